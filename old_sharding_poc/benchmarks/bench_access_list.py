@@ -0,0 +1,101 @@
+"""Benchmark the per-tx trie I/O of a collation executed with access lists and
+the bulk prefetch, against the plain execution, on a db with a simulated
+read latency
+
+    python benchmarks/bench_access_list.py [num_txs] [latency_us]
+"""
+import sys
+import time
+
+from ethereum.db import BaseDB
+
+from sharding.access_list import prefetch_access_lists
+from sharding.receipt_consuming_tx_utils import apply_shard_transaction
+from sharding.tools import tester as t
+from sharding.tools.workload import Workload
+from sharding.trie_db import cached_trie_nodes
+
+SHARD_ID = 1
+
+
+class LatencyDB(BaseDB):
+    """Counts the reads of `db`, and sleeps `latency` seconds on each of them
+    """
+
+    def __init__(self, db, latency):
+        self.db = db
+        self.kv = None
+        self.latency = latency
+        self.reads = 0
+
+    def get(self, key):
+        self.reads += 1
+        time.sleep(self.latency)
+        return self.db.get(key)
+
+    def put(self, key, value):
+        self.db.put(key, value)
+
+    def delete(self, key):
+        self.db.delete(key)
+
+    def commit(self):
+        pass
+
+    def _has_key(self, key):
+        return key in self.db
+
+    def __contains__(self, key):
+        return self._has_key(key)
+
+
+def mk_state(base_state, latency):
+    # ephemeral_clone puts an OverlayDB over the db, read through LatencyDB
+    state = base_state.ephemeral_clone()
+    latency_db = LatencyDB(state.env.db.db, latency)
+    state.env.db.db = latency_db
+    return state, latency_db
+
+
+def run_plain(base_state, txs, access_lists, latency):
+    state, latency_db = mk_state(base_state, latency)
+    start = time.time()
+    for tx in txs:
+        apply_shard_transaction(None, state, None, tx)
+    return time.time() - start, 0.0, latency_db.reads, state.trie.root_hash
+
+
+def run_prefetched(base_state, txs, access_lists, latency):
+    state, latency_db = mk_state(base_state, latency)
+    start = time.time()
+    with cached_trie_nodes(state):
+        prefetch_access_lists(state, access_lists, [tx.sender for tx in txs] + [state.block_coinbase])
+        prefetched = time.time()
+        for tx, access_list in zip(txs, access_lists):
+            apply_shard_transaction(None, state, None, tx, access_list=access_list)
+    end = time.time()
+    return end - prefetched, prefetched - start, latency_db.reads, state.trie.root_hash
+
+
+def main(num_txs=100, latency_us=50):
+    latency = latency_us / 1e6
+    workload = Workload(num_senders=num_txs)
+    c = t.Chain(env='sharding', deploy_sharding_contracts=True)
+    c.add_test_shard(SHARD_ID, setup_urs_contracts=False, alloc=workload.mk_alloc())
+    base_state = c.chain.shards[SHARD_ID].state
+    base_state.block_coinbase = t.a1
+    txs = workload.mk_transfer_txs(base_state, num_txs)
+    access_lists = [[[tx.to]] for tx in txs]
+
+    print('%d txs, %dus per db read' % (num_txs, latency_us))
+    results = []
+    for name, f in (('plain', run_plain), ('access lists + prefetch', run_prefetched)):
+        execution, prefetch, reads, root = f(base_state, txs, access_lists, latency)
+        results.append(root)
+        print('%-24s %.3fms/tx execution, %.3fms prefetch, %.1f db reads/tx' % (
+            name, execution * 1000 / num_txs, prefetch * 1000, reads / float(num_txs)))
+    assert results[0] == results[1]
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:3]])
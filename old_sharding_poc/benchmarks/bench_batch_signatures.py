@@ -0,0 +1,50 @@
+"""Benchmark batch_verify_header_signatures with different pool sizes
+
+    python benchmarks/bench_batch_signatures.py [num_headers]
+"""
+import multiprocessing
+import sys
+import time
+
+from sharding.collation import CollationHeader
+from sharding.contract_utils import sign
+from sharding.signature_utils import (
+    _verify_signature,
+    batch_verify_header_signatures,
+)
+from sharding.tools import tester as t
+from ethereum import utils
+
+
+def mk_pairs(num_headers):
+    pairs = []
+    for i in range(num_headers):
+        privkey = t.keys[i % len(t.keys)]
+        header = CollationHeader(shard_id=i % 100, number=i, coinbase=t.a0)
+        header.sig = sign(header.signing_hash, privkey)
+        pairs.append((header, utils.privtoaddr(privkey)))
+    return pairs
+
+
+def main(num_headers=1000):
+    pairs = mk_pairs(num_headers)
+    items = [(header.signing_hash, header.sig, signer) for header, signer in pairs]
+    start = time.time()
+    assert all(_verify_signature(item) for item in items)
+    sequential = time.time() - start
+    print('%d headers' % num_headers)
+    print('1 process:   %8.1f headers/s' % (num_headers / sequential))
+    for processes in sorted(set([2, 4, multiprocessing.cpu_count()])):
+        pool = multiprocessing.Pool(processes)
+        # Warm up the workers
+        batch_verify_header_signatures(pairs[:100], pool=pool)
+        start = time.time()
+        assert all(batch_verify_header_signatures(pairs, pool=pool))
+        elapsed = time.time() - start
+        pool.close()
+        pool.join()
+        print('%d processes: %8.1f headers/s' % (processes, num_headers / elapsed))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
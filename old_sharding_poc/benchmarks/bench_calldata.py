@@ -0,0 +1,61 @@
+"""Compare the allocations of building the call data of a contract call
+with a per-byte int list and with contract_utils.mk_calldata
+
+    python benchmarks/bench_calldata.py [data_size] [number]
+"""
+import sys
+import timeit
+import tracemalloc
+
+from ethereum import (
+    utils,
+    vm,
+)
+
+from sharding.contract_utils import (
+    encode_function_call,
+    mk_calldata,
+)
+from sharding.tools import tester as t
+from sharding.validator_manager_utils import get_valmgr_ct
+
+
+def old_calldata(ct, func, args):
+    return vm.CallData([utils.safe_ord(x) for x in ct.encode_function_call(func, args)])
+
+
+def new_calldata(ct, func, args):
+    return mk_calldata(encode_function_call(ct, func, args))
+
+
+def measure(make_calldata, ct, func, args, number):
+    """Return the peak traced memory of building one call data, and the time
+    of building `number` of them
+    """
+    tracemalloc.start()
+    calldata = make_calldata(ct, func, args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del calldata
+    elapsed = timeit.timeit(lambda: make_calldata(ct, func, args), number=number)
+    return peak, elapsed
+
+
+def main(data_size=4096, number=1000):
+    ct = get_valmgr_ct()
+    cases = [
+        ('get_shard_head', [1]),
+        ('add_header', [b'\x35' * data_size]),
+        ('tx_to_shard', [t.a1, 1, 100000, 1, b'\x35' * data_size]),
+    ]
+    for func, args in cases:
+        assert old_calldata(ct, func, args).extract_all() == new_calldata(ct, func, args).extract_all()
+        old_peak, old_time = measure(old_calldata, ct, func, args, number)
+        new_peak, new_time = measure(new_calldata, ct, func, args, number)
+        print('%s:' % func)
+        print('  int list:  peak %8d bytes, %.1fus/call' % (old_peak, old_time / number * 1e6))
+        print('  bytearray: peak %8d bytes, %.1fus/call' % (new_peak, new_time / number * 1e6))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:3]])
@@ -0,0 +1,43 @@
+"""Measure the cold-start time of a process which loads the validator
+manager and used receipt store contracts, with an empty and a warm
+contract artifact cache
+
+    python benchmarks/bench_cold_start.py [repeat]
+"""
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from sharding.contract_artifacts import CACHE_DIR_ENV
+
+LOAD_CONTRACTS = '''
+from sharding.validator_manager_utils import get_valmgr_bytecode, get_valmgr_ct
+from sharding.used_receipt_store_utils import get_urs_bytecode, get_urs_ct
+get_valmgr_ct(); get_valmgr_bytecode(); get_urs_ct(0); get_urs_bytecode(0)
+import sys; assert 'viper' not in sys.modules or sys.argv[1] == 'cold'
+'''
+
+
+def run(cache_dir, mode):
+    env = dict(os.environ)
+    env[CACHE_DIR_ENV] = cache_dir
+    start = time.time()
+    subprocess.check_call([sys.executable, '-c', LOAD_CONTRACTS, mode], env=env)
+    return time.time() - start
+
+
+def main(repeat=3):
+    cold, warm = [], []
+    for _ in range(repeat):
+        cache_dir = tempfile.mkdtemp()
+        cold.append(run(cache_dir, 'cold'))
+        warm.append(run(cache_dir, 'warm'))
+    print('empty artifact cache: %.3fs' % min(cold))
+    print('warm artifact cache:  %.3fs' % min(warm))
+    print('speedup: %.2fx' % (min(cold) / min(warm)))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
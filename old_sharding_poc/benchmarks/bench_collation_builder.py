@@ -0,0 +1,41 @@
+"""Benchmark CollationBuilder with shrinking time budgets: the number of
+transactions packed before the deadline, and the time spent in each phase
+
+    python benchmarks/bench_collation_builder.py [num_txs]
+"""
+import sys
+
+from ethereum.transaction_queue import TransactionQueue
+
+from sharding.collation_builder import CollationBuilder
+from sharding.tools import tester as t
+from sharding.tools.workload import Workload
+
+SHARD_ID = 1
+
+
+def main(num_txs=500):
+    workload = Workload(num_senders=num_txs)
+    c = t.Chain(env='sharding', deploy_sharding_contracts=True)
+    c.mine(5)
+    c.add_test_shard(SHARD_ID, setup_urs_contracts=False, alloc=workload.mk_alloc())
+    shard = c.chain.shards[SHARD_ID]
+    txs = workload.mk_transfer_txs(shard.state, num_txs)
+
+    for time_budget in (10.0, 1.0, 0.1, 0.01):
+        txqueue = TransactionQueue()
+        for tx in txs:
+            txqueue.add_transaction(tx)
+        builder = CollationBuilder(
+            c.chain, SHARD_ID, c.chain.get_expected_period_number(), t.a1, t.k1,
+            txqueue=txqueue, time_budget=time_budget,
+        )
+        collation = builder.build()
+        report = builder.report()
+        print('budget %6.2fs: %4d txs, remaining %+.4fs, %s' % (
+            time_budget, len(collation.transactions), report['remaining'],
+            ', '.join('%s %.4fs' % (phase, seconds) for phase, seconds in report['phases'].items())))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
@@ -0,0 +1,54 @@
+"""Benchmark the queries of the collations of ranges of 1, 100 and 10,000
+scores: one get_collations_with_score per score, the range query on the
+validator manager contract, and the range query served by the
+CollationsWithScoreCache of the main chain, which is filled from the indexed
+add_header logs
+
+    python benchmarks/bench_collations_with_score.py [max_range]
+"""
+import sys
+import time
+
+from sharding.stateless_collator import (
+    get_collations_by_score,
+    get_collations_with_score,
+)
+from sharding.tools import tester as t
+
+SHARD_ID = 1
+
+
+def timed(f):
+    start = time.time()
+    result = f()
+    return time.time() - start, result
+
+
+def main(max_range=10000):
+    c = t.Chain(env='sharding', deploy_sharding_contracts=True)
+    c.mine(5)
+    state = c.chain.state
+    cache = c.chain.collations_with_score_cache
+
+    for num_scores in [n for n in (1, 100, 10000) if n <= max_range]:
+        low, high = 1, num_scores
+
+        elapsed, per_score = timed(lambda: dict(
+            (score, get_collations_with_score(state, SHARD_ID, score)) for score in range(low, high + 1)))
+        r_elapsed, ranged = timed(lambda: get_collations_by_score(state, SHARD_ID, low, high))
+        assert ranged == per_score
+
+        cache.scores.clear()
+        fill_elapsed, _ = timed(lambda: c.chain.get_collations_by_score(SHARD_ID, low, high))
+        hit_elapsed, cached = timed(lambda: c.chain.get_collations_by_score(SHARD_ID, low, high))
+        assert cache.hits >= num_scores
+        assert cached == per_score
+        assert cache.fallbacks == 0
+
+        print('%5d scores: per score %.4fs, range %.4fs (%.1fx), cache fill %.4fs, cached %.6fs (%.0fx)' % (
+            num_scores, elapsed, r_elapsed, elapsed / r_elapsed,
+            fill_elapsed, hit_elapsed, elapsed / max(hit_elapsed, 1e-9)))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
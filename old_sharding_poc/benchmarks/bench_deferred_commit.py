@@ -0,0 +1,88 @@
+"""Benchmark the execution of collations of 100 to 1000 txs with the per-tx
+commits written to the db directly, and buffered by `deferred_commits`
+
+    python benchmarks/bench_deferred_commit.py [max_txs] [write_latency_us]
+"""
+import sys
+import time
+
+from ethereum.db import BaseDB
+
+from sharding.receipt_consuming_tx_utils import apply_shard_transaction
+from sharding.tools import tester as t
+from sharding.tools.workload import Workload
+from sharding.trie_db import deferred_commits
+
+SHARD_ID = 1
+
+
+class WriteLatencyDB(BaseDB):
+    """Counts the writes to `db`, and sleeps `latency` seconds on each of them
+    """
+
+    def __init__(self, db, latency):
+        self.db = db
+        self.kv = None
+        self.latency = latency
+        self.writes = 0
+
+    def get(self, key):
+        return self.db.get(key)
+
+    def put(self, key, value):
+        self.writes += 1
+        time.sleep(self.latency)
+        self.db.put(key, value)
+
+    def delete(self, key):
+        self.writes += 1
+        time.sleep(self.latency)
+        self.db.delete(key)
+
+    def commit(self):
+        pass
+
+    def _has_key(self, key):
+        return key in self.db
+
+    def __contains__(self, key):
+        return self._has_key(key)
+
+
+def run(base_state, txs, latency, deferred, checkpoint_interval=None):
+    state = base_state.ephemeral_clone()
+    db = WriteLatencyDB(state.env.db, latency)
+    state.env.db = db
+    state.trie.db.db = db
+    start = time.time()
+    if deferred:
+        with deferred_commits(state, checkpoint_interval):
+            for tx in txs:
+                apply_shard_transaction(None, state, None, tx)
+    else:
+        for tx in txs:
+            apply_shard_transaction(None, state, None, tx)
+    return time.time() - start, db.writes, state.trie.root_hash
+
+
+def main(max_txs=1000, write_latency_us=20):
+    latency = write_latency_us / 1e6
+    workload = Workload(num_senders=100)
+    c = t.Chain(env='sharding', deploy_sharding_contracts=True)
+    c.add_test_shard(SHARD_ID, setup_urs_contracts=False, alloc=workload.mk_alloc())
+    base_state = c.chain.shards[SHARD_ID].state
+    base_state.gas_limit = 10 ** 9
+    txs = workload.mk_transfer_txs(base_state, max_txs)
+
+    for num_txs in [n for n in (100, 250, 500, 1000) if n <= max_txs]:
+        elapsed, writes, root = run(base_state, txs[:num_txs], latency, False)
+        print('%d txs: per-tx commits %.3fs, %d db writes' % (num_txs, elapsed, writes))
+        for checkpoint_interval in (None, 100):
+            d_elapsed, d_writes, d_root = run(base_state, txs[:num_txs], latency, True, checkpoint_interval)
+            assert d_root == root
+            print('  deferred, checkpoint every %-4s %.3fs, %d db writes, speedup %.2fx' % (
+                checkpoint_interval, d_elapsed, d_writes, elapsed / d_elapsed))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:3]])
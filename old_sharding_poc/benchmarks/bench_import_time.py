@@ -0,0 +1,64 @@
+"""Measure the import time of each sharding submodule in a fresh process
+with `python -X importtime` (Python 3.7+)
+
+    python benchmarks/bench_import_time.py [module ...]
+"""
+import os
+import re
+import subprocess
+import sys
+
+import sharding
+
+IMPORTTIME_RE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)$')
+
+
+def get_submodules():
+    package_dir = os.path.dirname(sharding.__file__)
+    o = ['sharding']
+    for dirpath, dirnames, filenames in os.walk(package_dir):
+        dirnames[:] = [d for d in dirnames if d not in ('tests', '__pycache__')]
+        package = os.path.relpath(dirpath, os.path.dirname(package_dir)).replace(os.sep, '.')
+        for filename in sorted(filenames):
+            if filename.endswith('.py') and filename != '__init__.py':
+                o.append('%s.%s' % (package, filename[:-3]))
+    return o
+
+
+def measure(module):
+    """Return the cumulative import time of `module` in microseconds, and
+    the three slowest modules it imports (self time)
+    """
+    output = subprocess.check_output(
+        [sys.executable, '-X', 'importtime', '-c', 'import %s' % module],
+        stderr=subprocess.STDOUT,
+    ).decode()
+    cumulative, self_times = None, []
+    for line in output.splitlines():
+        match = IMPORTTIME_RE.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, _, name = match.groups()
+        self_times.append((int(self_us), name))
+        if name == module:
+            cumulative = int(cumulative_us)
+    return cumulative, sorted(self_times, reverse=True)[:3]
+
+
+def main(modules):
+    results = []
+    for module in modules or get_submodules():
+        try:
+            results.append((module,) + measure(module))
+        except subprocess.CalledProcessError as e:
+            print('%s: failed to import\n%s' % (module, e.output.decode()))
+    for module, cumulative, slowest in sorted(results, key=lambda r: -(r[1] or 0)):
+        print('%-45s %8.1fms   slowest: %s' % (
+            module,
+            (cumulative or 0) / 1000.0,
+            ', '.join('%s %.1fms' % (name, us / 1000.0) for us, name in slowest),
+        ))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,62 @@
+"""Benchmark the throughput of the optimistic execution of shard txs against
+the sequential path, as a function of the conflict rate of the workload
+
+    python benchmarks/bench_parallel_execution.py [num_txs] [num_threads]
+"""
+from multiprocessing.pool import ThreadPool
+import sys
+import time
+
+from sharding.parallel_execution import apply_transactions_optimistically
+from sharding.receipt_consuming_tx_utils import apply_shard_transaction
+from sharding.tools import tester as t
+from sharding.tools.workload import Workload
+
+SHARD_ID = 1
+CONFLICT_RATES = (0.0, 0.1, 0.25, 0.5, 1.0)
+
+
+def sequential(state, txs, pool=None):
+    for tx in txs:
+        apply_shard_transaction(None, state, None, tx)
+    return 0
+
+
+def optimistic(state, txs, pool=None):
+    _, reexecuted = apply_transactions_optimistically(None, state, None, txs, pool=pool)
+    return reexecuted
+
+
+def timed(f, base_state, txs, pool=None):
+    state = base_state.ephemeral_clone()
+    start = time.time()
+    reexecuted = f(state, txs, pool)
+    return time.time() - start, reexecuted, state.trie.root_hash
+
+
+def main(num_txs=100, num_threads=4):
+    workload = Workload(num_senders=num_txs)
+    c = t.Chain(env='sharding', deploy_sharding_contracts=True)
+    c.add_test_shard(SHARD_ID, setup_urs_contracts=False, alloc=workload.mk_alloc())
+    base_state = c.chain.shards[SHARD_ID].state
+    base_state.block_coinbase = t.a1
+    pool = ThreadPool(num_threads)
+
+    print('%d txs' % num_txs)
+    for conflict_rate in CONFLICT_RATES:
+        workload.nonces = {}
+        txs = workload.mk_transfer_txs(base_state, num_txs, conflict_rate=conflict_rate)
+        elapsed, _, root = timed(sequential, base_state, txs)
+        print('conflict rate %.2f: sequential %.1f tx/s' % (conflict_rate, num_txs / elapsed))
+        for name, p in (('optimistic', None), ('optimistic x%d threads' % num_threads, pool)):
+            opt_elapsed, reexecuted, opt_root = timed(optimistic, base_state, txs, p)
+            assert opt_root == root
+            print('  %-24s %.1f tx/s, %d re-executed, speedup %.2fx' % (
+                name, num_txs / opt_elapsed, reexecuted, elapsed / opt_elapsed))
+
+    pool.close()
+    pool.join()
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:3]])
@@ -0,0 +1,63 @@
+"""Benchmark recovering the senders of a collation's txs in a pool before
+execution, as a function of the tx count and the number of workers
+
+    python benchmarks/bench_preverify.py [max_txs]
+"""
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+import sys
+import time
+
+import rlp
+from ethereum.transactions import Transaction
+
+from sharding.sender_cache import sender_cache
+from sharding.signature_utils import recover_tx_senders
+from sharding.tools import tester as t
+from sharding.tools.workload import Workload
+
+
+def fresh_copies(txs):
+    # New tx objects whose senders aren't recovered yet
+    sender_cache.clear()
+    return [rlp.decode(rlp.encode(tx), Transaction) for tx in txs]
+
+
+def timed(txs, pool=None):
+    txs = fresh_copies(txs)
+    start = time.time()
+    if pool is None:
+        # The lazy path of apply_transaction
+        for tx in txs:
+            tx.sender
+    else:
+        assert recover_tx_senders(txs, pool=pool) == len(txs)
+    return time.time() - start
+
+
+def main(max_txs=800):
+    c = t.Chain(env='sharding', deploy_sharding_contracts=True)
+    workload = Workload(num_senders=50)
+    txs = workload.mk_transfer_txs(c.head_state, max_txs)
+    worker_counts = sorted(set([2, 4, multiprocessing.cpu_count()]))
+    pools = [('process', n, multiprocessing.Pool(n)) for n in worker_counts]
+    pools += [('thread', n, ThreadPool(n)) for n in worker_counts]
+    for _, _, pool in pools:
+        timed(txs[:100], pool)
+
+    num_txs = 50
+    while num_txs <= max_txs:
+        sequential = timed(txs[:num_txs])
+        print('%d txs: sequential %.4fs' % (num_txs, sequential))
+        for kind, n, pool in pools:
+            elapsed = timed(txs[:num_txs], pool)
+            print('  %-7s pool x%-2d %.4fs speedup %.2fx' % (kind, n, elapsed, sequential / elapsed))
+        num_txs *= 2
+
+    for _, _, pool in pools:
+        pool.close()
+        pool.join()
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
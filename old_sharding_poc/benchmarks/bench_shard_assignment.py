@@ -0,0 +1,54 @@
+"""Benchmark the native shard assignment against get_shard_list of the
+validator manager contract
+
+    python benchmarks/bench_shard_assignment.py [num_validators]
+"""
+import sys
+import time
+
+from sharding.config import sharding_config
+from sharding.shard_assignment import (
+    ShardAssignment,
+    get_cycle_seed,
+)
+from sharding.tools import tester as t
+from sharding.validator_manager_utils import (
+    get_shard_list,
+    get_validation_code_addrs,
+)
+
+
+def main(num_validators=5):
+    c = t.Chain(env='sharding', deploy_sharding_contracts=True)
+    c.mine(5)
+    valcode_addrs = []
+    for privkey in t.keys[:num_validators]:
+        valcode_addr = c.sharding_valcode_addr(privkey)
+        c.sharding_deposit(privkey, valcode_addr)
+        valcode_addrs.append(valcode_addr)
+    c.mine(sharding_config['SHUFFLING_CYCLE_LENGTH'])
+    state = c.head_state
+
+    start = time.time()
+    contract_lists = [get_shard_list(state, addr) for addr in valcode_addrs]
+    contract_time = time.time() - start
+
+    start = time.time()
+    addrs = get_validation_code_addrs(state)
+    read_time = time.time() - start
+    start = time.time()
+    assignment = ShardAssignment(get_cycle_seed(state), addrs)
+    build_time = time.time() - start
+    start = time.time()
+    native_lists = [assignment.get_shard_list(addr) for addr in valcode_addrs]
+    lookup_time = time.time() - start
+    assert native_lists == contract_lists
+
+    print('%d validators' % num_validators)
+    print('contract get_shard_list: %.4fs (%.1fms/validator)' % (contract_time, contract_time / num_validators * 1e3))
+    print('native: read validators %.4fs, build %.4fs, lookup %.1fus/validator' % (
+        read_time, build_time, lookup_time / num_validators * 1e6))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
@@ -0,0 +1,61 @@
+"""Benchmark the import of one collation per shard for 1 to `max_shards`
+tracked shards, one shard after another in this process and with the
+MultiShardImporter of the main chain, whose worker processes own the shards
+
+    python benchmarks/bench_shard_import.py [max_shards] [num_txs] [processes]
+
+`processes` defaults to the number of cores. The collations are decoded
+from RLP and the sender cache is cleared, like for collations received from
+the network, so that both imports recover the senders.
+"""
+import sys
+import time
+from multiprocessing import cpu_count
+
+import rlp
+from ethereum.transaction_queue import TransactionQueue
+
+from sharding.collation import Collation
+from sharding.sender_cache import sender_cache
+from sharding.tools import tester as t
+from sharding.tools.workload import Workload
+
+
+def mk_chain(num_shards, num_txs):
+    c = t.Chain(env='sharding', deploy_sharding_contracts=True)
+    c.mine(5)
+    collations = []
+    for shard_id in range(num_shards):
+        workload = Workload(num_senders=num_txs, seed=shard_id)
+        c.add_test_shard(shard_id, setup_urs_contracts=False, alloc=workload.mk_alloc())
+        txqueue = TransactionQueue()
+        for tx in workload.mk_transfer_txs(c.chain.shards[shard_id].state, num_txs):
+            txqueue.add_transaction(tx)
+        collation = c.generate_collation(shard_id=shard_id, coinbase=t.a1, key=t.k1, txqueue=txqueue)
+        collations.append(rlp.decode(rlp.encode(collation), Collation))
+    sender_cache.clear()
+    return c, collations
+
+
+def main(max_shards=8, num_txs=50, processes=None):
+    processes = processes or cpu_count()
+    num_shards = 1
+    while num_shards <= max_shards:
+        c, collations = mk_chain(num_shards, num_txs)
+        start = time.time()
+        assert all(c.chain.import_collations(c.chain.head, collations).values())
+        elapsed = time.time() - start
+
+        c, collations = mk_chain(num_shards, num_txs)
+        c.chain.start_shard_importer(processes)
+        start = time.time()
+        assert all(c.chain.import_collations(c.chain.head, collations).values())
+        p_elapsed = time.time() - start
+        c.chain.stop_shard_importer()
+        print('%2d shards: sequential %.3fs, %d processes %.3fs, speedup %.2fx' % (
+            num_shards, elapsed, min(processes, num_shards), p_elapsed, elapsed / p_elapsed))
+        num_shards *= 2
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:4]])
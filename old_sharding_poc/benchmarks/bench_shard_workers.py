@@ -0,0 +1,78 @@
+"""Benchmark the throughput of adding collations to 1 to `max_shards` shards
+in this process, one after another, and in one worker process per shard
+
+    python benchmarks/bench_shard_workers.py [max_shards] [num_txs] [collations_per_shard]
+"""
+import json
+import sys
+import time
+
+from ethereum import utils
+from ethereum.transaction_queue import TransactionQueue
+
+from sharding.shard_worker import ShardProcessPool
+from sharding.tools import tester as t
+from sharding.tools.workload import Workload
+
+
+def mk_chain(num_shards, num_txs, collations_per_shard):
+    """The collations are built on top of each other, without being added
+    to the chain of this process
+    """
+    c = t.Chain(env='sharding', deploy_sharding_contracts=True)
+    c.mine(5)
+    collations = []
+    for shard_id in range(num_shards):
+        workload = Workload(num_senders=num_txs, seed=shard_id)
+        c.add_test_shard(shard_id, setup_urs_contracts=False, alloc=workload.mk_alloc())
+        shard = c.chain.shards[shard_id]
+        parent_hash = shard.head_hash
+        for _ in range(collations_per_shard):
+            txqueue = TransactionQueue()
+            for tx in workload.mk_transfer_txs(shard.state, num_txs):
+                txqueue.add_transaction(tx)
+            collation = c.generate_collation(
+                shard_id=shard_id, coinbase=t.a1, key=t.k1, txqueue=txqueue, parent_collation_hash=parent_hash)
+            assert shard.add_collation(collation, c.chain.get_block(collation.header.period_start_prevhash))
+            collations.append(collation)
+            parent_hash = collation.header.hash
+    return c, collations
+
+
+def genesis_snapshot(c, shard_id):
+    db = c.chain.shards[shard_id].db
+    return json.loads(db.get(b'SHARD_' + utils.to_string(shard_id) + b'_GENESIS_STATE'))
+
+
+def main(max_shards=8, num_txs=50, collations_per_shard=2):
+    num_shards = 1
+    while num_shards <= max_shards:
+        c, collations = mk_chain(num_shards, num_txs, collations_per_shard)
+
+        # In this process, on fresh shards
+        c2, _ = mk_chain(num_shards, num_txs, 0)
+        start = time.time()
+        for collation in collations:
+            shard = c2.chain.shards[collation.header.shard_id]
+            shard.add_collation(collation, c.chain.get_block(collation.header.period_start_prevhash))
+        elapsed = time.time() - start
+
+        pool = ShardProcessPool(c.chain)
+        for shard_id in range(num_shards):
+            pool.start_worker({shard_id: genesis_snapshot(c, shard_id)})
+        pool.publish_snapshot()
+        start = time.time()
+        for collation in collations:
+            pool.submit(collation)
+        heads = pool.collect()
+        p_elapsed = time.time() - start
+        pool.close()
+        assert len(heads) == num_shards
+
+        print('%2d shards, %d collations: in-process %.3fs, worker processes %.3fs, speedup %.2fx' % (
+            num_shards, len(collations), elapsed, p_elapsed, elapsed / p_elapsed))
+        num_shards *= 2
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:4]])
@@ -0,0 +1,54 @@
+"""Benchmark the latency of validating a collation when its header is
+included, with and without the speculative validation of its body on arrival
+
+    python benchmarks/bench_speculative_validation.py [num_txs] [rounds]
+"""
+import sys
+import time
+
+from ethereum.transaction_queue import TransactionQueue
+
+from sharding.collation_validation import validate_collation
+from sharding.speculative_validation import SpeculativeValidationCache
+from sharding.tools import tester as t
+from sharding.tools.workload import Workload
+
+SHARD_ID = 1
+
+
+def main(num_txs=100, rounds=5):
+    workload = Workload(num_senders=num_txs)
+    c = t.Chain(env='sharding', deploy_sharding_contracts=True)
+    c.mine(5)
+    c.add_test_shard(SHARD_ID, setup_urs_contracts=False, alloc=workload.mk_alloc())
+    shard = c.chain.shards[SHARD_ID]
+    cache = SpeculativeValidationCache(shard)
+
+    txqueue = TransactionQueue()
+    for tx in workload.mk_transfer_txs(shard.state, num_txs):
+        txqueue.add_transaction(tx)
+    collation = c.generate_collation(shard_id=SHARD_ID, coinbase=t.a1, key=t.k1, txqueue=txqueue)
+    period_start_prevblock = c.chain.get_block(collation.header.period_start_prevhash)
+    print('collation of %d txs' % len(collation.transactions))
+
+    sync_elapsed = spec_elapsed = 0.0
+    for _ in range(rounds):
+        start = time.time()
+        validate_collation(shard, collation, period_start_prevblock)
+        sync_elapsed += time.time() - start
+
+        cache.submit(collation)
+        # The body arrived well before the block which includes its header
+        cache.results[cache.get_key(collation, period_start_prevblock)].wait()
+        start = time.time()
+        state = validate_collation(shard, collation, period_start_prevblock, speculative_cache=cache)
+        spec_elapsed += time.time() - start
+        assert state.trie.root_hash == collation.header.post_state_root
+
+    print('on header inclusion: validation %.4fs, speculatively validated %.4fs, speedup %.1fx' % (
+        sync_elapsed / rounds, spec_elapsed / rounds, sync_elapsed / spec_elapsed))
+    cache.close()
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:3]])
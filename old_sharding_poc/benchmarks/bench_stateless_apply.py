@@ -0,0 +1,55 @@
+"""Benchmark applying a collation with the full shard state against applying
+it statelessly from its witness, and compare the witness with the state db
+
+    python benchmarks/bench_stateless_apply.py [num_txs] [num_accounts]
+"""
+import sys
+import time
+
+from ethereum.transaction_queue import TransactionQueue
+
+from sharding import collator
+from sharding.tools import tester as t
+from sharding.tools.workload import Workload
+
+SHARD_ID = 1
+
+
+def main(num_txs=100, num_accounts=1000):
+    workload = Workload(num_senders=num_accounts)
+    c = t.Chain(env='sharding', deploy_sharding_contracts=True)
+    c.mine(5)
+    c.add_test_shard(SHARD_ID, setup_urs_contracts=False, alloc=workload.mk_alloc())
+    shard = c.chain.shards[SHARD_ID]
+
+    txqueue = TransactionQueue()
+    for tx in workload.mk_transfer_txs(shard.state, num_txs):
+        txqueue.add_transaction(tx)
+    collation = c.generate_collation(shard_id=SHARD_ID, coinbase=t.a1, key=t.k1, txqueue=txqueue)
+    period_start_prevblock = c.chain.get_block(collation.header.period_start_prevhash)
+    parent_hash = collation.header.parent_collation_hash
+    prev_state_root = shard.mk_poststate_of_collation_hash(parent_hash).trie.root_hash
+
+    start = time.time()
+    state = shard.mk_poststate_of_collation_hash(parent_hash).ephemeral_clone()
+    collator.apply_collation(state, collation, period_start_prevblock, c.chain.state, SHARD_ID)
+    stateful_elapsed = time.time() - start
+
+    nodes, codes = collator.mk_witness(shard, collation, period_start_prevblock, c.chain.state)
+    start = time.time()
+    _, reads, writes = collator.apply_collation_stateless(
+        prev_state_root, nodes, collation, period_start_prevblock, c.chain.state, shard.env.config,
+        shard_id=SHARD_ID, codes=codes,
+    )
+    stateless_elapsed = time.time() - start
+
+    witness_size = sum(len(obj) for obj in nodes + codes)
+    db_size = sum(len(value) for value in shard.db.kv.values()) if shard.db.kv is not None else None
+    print('collation of %d txs over %d accounts' % (len(collation.transactions), num_accounts))
+    print('stateful %.4fs, stateless %.4fs' % (stateful_elapsed, stateless_elapsed))
+    print('witness: %d objects, %d bytes, %d read; %d objects written; state db: %s bytes' % (
+        len(nodes) + len(codes), witness_size, len(reads), len(writes), db_size))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:3]])
@@ -0,0 +1,51 @@
+"""Benchmark the signature checks of collation headers with
+call_validation_code, in the EVM and with the native fast path
+
+    python benchmarks/bench_validation_code.py [num_headers]
+"""
+import sys
+import time
+
+from sharding.collation import CollationHeader
+from sharding.contract_utils import sign
+from sharding.tools import tester as t
+from sharding.validator_manager_utils import call_validation_code
+
+
+def mk_headers(num_headers, privkey):
+    headers = []
+    for i in range(num_headers):
+        header = CollationHeader(shard_id=i % 100, number=i, coinbase=t.a0)
+        header.sig = sign(header.signing_hash, privkey)
+        headers.append(header)
+    return headers
+
+
+def run(state, valcode_addr, headers, native):
+    start = time.time()
+    results = [
+        call_validation_code(state, valcode_addr, header.signing_hash, header.sig, native=native)
+        for header in headers
+    ]
+    return time.time() - start, results
+
+
+def main(num_headers=500):
+    c = t.Chain(env='sharding', deploy_sharding_contracts=True)
+    c.mine(5)
+    valcode_addr = c.sharding_valcode_addr(t.k0)
+    c.mine(1)
+    state = c.head_state
+    headers = mk_headers(num_headers, t.k0)
+
+    evm_time, evm_results = run(state, valcode_addr, headers, native=False)
+    native_time, native_results = run(state, valcode_addr, headers, native=True)
+    assert evm_results == native_results == [True] * num_headers
+    print('%d headers' % num_headers)
+    print('EVM:    %8.1f checks/s' % (num_headers / evm_time))
+    print('native: %8.1f checks/s' % (num_headers / native_time))
+    print('speedup: %.2fx' % (evm_time / native_time))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 import os
+import re
 from setuptools import setup, find_packages
 
 
@@ -32,9 +33,10 @@ if os.environ.get("USE_PYETHEREUM_DEVELOP"):
 viper_ref = '9a6f972ba459f66e63adcfe9a4ad1c7d2f6ec47a'  # Oct 23, 2017
 DEPENDENCY_LINKS.append('http://github.com/ethereum/viper/tarball/%s#egg=viper-9.99.9' % viper_ref)
 
-# *IMPORTANT*: Don't manually change the version here. Use the 'bumpversion' utility.
+# *IMPORTANT*: Don't manually change the version in sharding/_version.py. Use the 'bumpversion' utility.
 # see: https://github.com/ethereum/pyethapp/wiki/Development:-Versions-and-Releases
-version = '0.0.1'
+with open(os.path.join('sharding', '_version.py')) as version_file:
+    version = re.search(r"^__version__ = '([^']+)'", version_file.read(), re.M).group(1)
 
 setup(
     name='sharding',
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+import os.path
+import re
+
+# *IMPORTANT*: Don't manually change the version here. Use the 'bumpversion' utility.
+__version__ = '0.0.1'
+
+GIT_DESCRIBE_RE = re.compile(r'^(?P<version>v\d+\.\d+\.\d+)-(?P<git>\d+-g[a-fA-F0-9]+(?:-dirty)?)$')
+
+_full_version = None
+
+
+def get_version():
+    """Get the version of the installed distribution, or the `git describe`
+    version of a source checkout, falling back to `__version__`
+
+    This is computed on the first call instead of at import time, since it may
+    spawn a git subprocess.
+    """
+    global _full_version
+    if _full_version is not None:
+        return _full_version
+
+    version = None
+    from pkg_resources import get_distribution, DistributionNotFound
+    try:
+        _dist = get_distribution('sharding')
+        # Normalize case for Windows systems
+        dist_loc = os.path.normcase(_dist.location)
+        here = os.path.normcase(__file__)
+        if not here.startswith(os.path.join(dist_loc, 'sharding')):
+            # not installed, but there is another version that *is*
+            raise DistributionNotFound
+        version = _dist.version
+    except DistributionNotFound:
+        pass
+
+    if not version:
+        import subprocess
+        try:
+            rev = subprocess.check_output(['git', 'describe', '--tags', '--dirty'],
+                                          stderr=subprocess.STDOUT)
+            match = GIT_DESCRIBE_RE.match(rev.decode().strip())
+            if match:
+                version = "{}+git-{}".format(match.group("version"), match.group("git"))
+        except Exception:
+            pass
+
+    _full_version = version or __version__
+    return _full_version
@@ -0,0 +1,176 @@
+import rlp
+from ethereum import utils
+from ethereum.db import RefcountDB
+from ethereum.exceptions import InvalidTransaction
+from ethereum.securetrie import SecureTrie
+from ethereum.slogging import get_logger
+from ethereum.trie import BLANK_NODE, BLANK_ROOT, Trie
+
+log = get_logger('sharding.access_list')
+
+
+class AccessListViolation(InvalidTransaction):
+    pass
+
+
+def to_prefix_list_form(access_list):
+    """The prefixes of the single-layer trie keys which the access list allows,
+    as specified in docs/doc.md
+    """
+    o = []
+    for obj in access_list:
+        addr, storage_prefixes = obj[0], obj[1:]
+        o.append(utils.sha3(addr) + b'\x00')
+        o.append(utils.sha3(addr) + b'\x01')
+        for prefix in storage_prefixes:
+            o.append(utils.sha3(addr) + b'\x02' + prefix)
+    return o
+
+
+class AccessList(object):
+    """The access list of a tx: `[[address, prefix1, prefix2...], ...]`
+
+    The tx can access the balance, nonce and code of the listed addresses,
+    and the storage keys (as 32-byte big-endian) which start with one of the
+    prefixes listed with the address.
+    """
+
+    def __init__(self, access_list, implicit_addrs=()):
+        # address -> list of storage key prefixes
+        self.prefixes = {}
+        for obj in access_list:
+            addr = utils.normalize_address(obj[0])
+            self.prefixes.setdefault(addr, []).extend(obj[1:])
+        for addr in implicit_addrs:
+            self.prefixes.setdefault(utils.normalize_address(addr), [])
+
+    def allows_account(self, address):
+        return utils.normalize_address(address) in self.prefixes
+
+    def allows_storage(self, address, key):
+        prefixes = self.prefixes.get(utils.normalize_address(address))
+        if not prefixes:
+            return False
+        key = utils.encode_int32(key)
+        return any(key.startswith(prefix) for prefix in prefixes)
+
+    def check_account(self, address):
+        if not self.allows_account(address):
+            raise AccessListViolation(
+                'Access to {} is not in the access list'.format(utils.encode_hex(address))
+            )
+
+    def check_storage(self, address, key):
+        if not self.allows_storage(address, key):
+            raise AccessListViolation(
+                'Access to storage key {} of {} is not in the access list'.format(
+                    key, utils.encode_hex(address))
+            )
+
+
+class AccessListState(object):
+    """A proxy of a State which raises AccessListViolation on any access
+    outside of the access list, and forwards everything else to the state
+    """
+
+    def __init__(self, state, access_list):
+        object.__setattr__(self, '_state', state)
+        object.__setattr__(self, 'access_list', access_list)
+
+    def __getattr__(self, name):
+        return getattr(self._state, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._state, name, value)
+
+    def _check(self, *addresses):
+        for address in addresses:
+            self.access_list.check_account(address)
+
+    def get_balance(self, address):
+        self._check(address)
+        return self._state.get_balance(address)
+
+    def get_code(self, address):
+        self._check(address)
+        return self._state.get_code(address)
+
+    def get_nonce(self, address):
+        self._check(address)
+        return self._state.get_nonce(address)
+
+    def get_storage_data(self, address, key):
+        self.access_list.check_storage(address, key)
+        return self._state.get_storage_data(address, key)
+
+    def account_exists(self, address):
+        self._check(address)
+        return self._state.account_exists(address)
+
+    def set_balance(self, address, value):
+        self._check(address)
+        self._state.set_balance(address, value)
+
+    def set_code(self, address, value):
+        self._check(address)
+        self._state.set_code(address, value)
+
+    def set_nonce(self, address, value):
+        self._check(address)
+        self._state.set_nonce(address, value)
+
+    def set_storage_data(self, address, key, value):
+        self.access_list.check_storage(address, key)
+        self._state.set_storage_data(address, key, value)
+
+    def delta_balance(self, address, value):
+        self._check(address)
+        self._state.delta_balance(address, value)
+
+    def increment_nonce(self, address):
+        self._check(address)
+        self._state.increment_nonce(address)
+
+    def transfer_value(self, from_addr, to_addr, value):
+        self._check(from_addr, to_addr)
+        return self._state.transfer_value(from_addr, to_addr, value)
+
+    def reset_storage(self, address):
+        self._check(address)
+        self._state.reset_storage(address)
+
+    def del_account(self, address):
+        self._check(address)
+        self._state.del_account(address)
+
+
+def prefetch_access_lists(state, access_lists, addrs=()):
+    """Load the trie nodes of the accounts, code and storage keys of all the
+    access lists of a collation, and of `addrs` (e.g. the senders), in one
+    pass in trie key order
+
+    Only the full 32-byte storage keys can be prefetched, since the storage
+    trie is keyed by their hashes. The nodes are read through `state.db`, so
+    this is only useful inside `cached_trie_nodes(state)`.
+    Returns the number of the prefetched accounts.
+    """
+    storage_keys = dict((utils.normalize_address(addr), set()) for addr in addrs)
+    for access_list in access_lists:
+        for addr, prefixes in AccessList(access_list).prefixes.items():
+            keys = storage_keys.setdefault(addr, set())
+            keys.update(p for p in prefixes if len(p) == 32)
+
+    db = RefcountDB(state.db)
+    for addr in sorted(storage_keys, key=utils.sha3):
+        rlpdata = state.trie.get(addr)
+        if rlpdata == BLANK_NODE:
+            continue
+        nonce, balance, storage_root, code_hash = rlp.decode(rlpdata)
+        if code_hash != utils.sha3(b''):
+            state.db.get(code_hash)
+        if storage_root != BLANK_ROOT and storage_keys[addr]:
+            storage_trie = SecureTrie(Trie(db, storage_root))
+            for key in sorted(storage_keys[addr], key=utils.sha3):
+                storage_trie.get(key)
+    log.debug('Prefetched {} accounts'.format(len(storage_keys)))
+    return len(storage_keys)
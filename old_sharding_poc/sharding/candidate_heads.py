@@ -0,0 +1,128 @@
+import bisect
+
+import rlp
+from rlp.sedes import List, binary
+
+from ethereum import utils
+
+# The header of an add_header log
+# [num, num, bytes32, bytes32, bytes32, address, bytes32, bytes32, num, bytes]
+# use sedes to prevent integer 0 from being decoded as b''
+add_header_log_sedes = List([
+    utils.big_endian_int, utils.big_endian_int, utils.hash32, utils.hash32, utils.hash32,
+    utils.address, utils.hash32, utils.hash32, utils.big_endian_int, binary,
+])
+
+
+class CandidateHeadIndex(object):
+    """The collation headers of the add_header logs of every shard, ordered by
+    descending score, then from the oldest to the most recent log, which is
+    the order of `fetch_candidate_head` in docs/doc.md
+
+    The headers of each (shard, score) are in a sorted bucket, and the
+    scores of each shard in a sorted list, so that adding or removing a log
+    costs O(log n) plus the size of its bucket. The logs of the blocks
+    which leave the main chain in a reorg are removed with `remove_block`,
+    and added back with `restore_block` if they return, or skipped by the
+    `is_canonical` filter of `iter_candidates`.
+    """
+
+    def __init__(self):
+        self.scores = {}    # shard_id -> sorted list of scores
+        self.buckets = {}   # (shard_id, score) -> sorted list of entries
+        self.block_entries = {}     # blockhash -> list of (shard_id, score, entry)
+        self.removed_blocks = {}    # blockhash -> list of (shard_id, score, entry)
+
+    def __len__(self):
+        return sum(len(bucket) for bucket in self.buckets.values())
+
+    def add_header(self, shard_id, score, collation_hash, blockhash, block_number, log_index):
+        """Add the header of an add_header log, the `log_index`th of the block
+        `blockhash`. Returns False if it was already added.
+        """
+        entry = (block_number, log_index, collation_hash, blockhash)
+        key = (shard_id, score)
+        if key not in self.buckets:
+            self.buckets[key] = []
+            bisect.insort(self.scores.setdefault(shard_id, []), score)
+        bucket = self.buckets[key]
+        i = bisect.bisect_left(bucket, entry)
+        if i < len(bucket) and bucket[i] == entry:
+            return False
+        bucket.insert(i, entry)
+        self.block_entries.setdefault(blockhash, []).append((shard_id, score, entry))
+        return True
+
+    def add_header_log(self, block, log_index, header_rlp):
+        """Decode and add the header of the `log_index`th add_header log of `block`
+        """
+        values = rlp.decode(header_rlp, add_header_log_sedes)
+        return self.add_header(
+            values[0], values[8], utils.sha3(header_rlp),
+            block.header.hash, block.header.number, log_index,
+        )
+
+    def remove_block(self, blockhash):
+        """Remove the logs of the block, e.g. when it leaves the main chain
+        """
+        entries = self.block_entries.pop(blockhash, [])
+        if entries:
+            self.removed_blocks[blockhash] = entries
+        for shard_id, score, entry in entries:
+            key = (shard_id, score)
+            bucket = self.buckets[key]
+            del bucket[bisect.bisect_left(bucket, entry)]
+            if not bucket:
+                del self.buckets[key]
+                scores = self.scores[shard_id]
+                del scores[bisect.bisect_left(scores, score)]
+
+    def restore_block(self, blockhash):
+        """Add back the logs of a block removed by `remove_block`, e.g. when
+        it returns to the main chain
+        """
+        for shard_id, score, entry in self.removed_blocks.pop(blockhash, []):
+            block_number, log_index, collation_hash, _ = entry
+            self.add_header(shard_id, score, collation_hash, blockhash, block_number, log_index)
+
+    def get_collation_hashes(self, shard_id, score, is_canonical=None):
+        """Get the hashes of the collations of the logs with the score, from
+        the oldest log, which is the order of `get_collations_with_score` of
+        validator manager contract
+        """
+        return [
+            collation_hash
+            for block_number, _, collation_hash, blockhash in self.buckets.get((shard_id, score), [])
+            if is_canonical is None or is_canonical(blockhash, block_number)
+        ]
+
+    def _next_score(self, shard_id, score):
+        # The highest score of the shard lower than `score`, or None
+        scores = self.scores.get(shard_id, [])
+        i = bisect.bisect_left(scores, score) if score is not None else len(scores)
+        return scores[i - 1] if i > 0 else None
+
+    def iter_candidates(self, shard_id, is_canonical=None):
+        """Yield (score, collation_hash) of the candidate heads of the shard,
+        from the highest score, and the oldest log first for equal scores
+
+        Each candidate costs O(log n). The index can be changed while
+        iterating: the iterator continues after the last candidate it
+        yielded.
+
+        is_canonical: if given, `is_canonical(blockhash, block_number)`
+            tells whether a log is on the current main chain
+        """
+        score = self._next_score(shard_id, None)
+        while score is not None:
+            entry = None
+            while True:
+                bucket = self.buckets.get((shard_id, score), [])
+                i = bisect.bisect_right(bucket, entry) if entry is not None else 0
+                if i >= len(bucket):
+                    break
+                entry = bucket[i]
+                block_number, _, collation_hash, blockhash = entry
+                if is_canonical is None or is_canonical(blockhash, block_number):
+                    yield score, collation_hash
+            score = self._next_score(shard_id, score)
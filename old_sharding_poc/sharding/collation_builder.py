@@ -0,0 +1,261 @@
+from collections import OrderedDict
+from timeit import default_timer
+
+from ethereum.consensus_strategy import get_consensus_strategy
+from ethereum.slogging import get_logger
+from ethereum.utils import encode_hex
+
+from sharding import state_transition
+from sharding.contract_utils import sign
+from sharding.metrics import metrics
+from sharding.validator_manager_utils import call_valmgr
+
+log = get_logger('sharding.collation_builder')
+
+# The share of the time budget that GUESS_HEAD can use, the rest is for
+# packing the transactions
+DEFAULT_GUESS_HEAD_SHARE = 0.25
+
+PHASES = ('guess_head', 'create', 'pack', 'seal')
+
+
+def get_proposal_slots(chain, valcode_addr):
+    """Get the (shard_id, period) slots of the lookahead window which
+    `valcode_addr` is the eligible proposer of, in the order of the periods
+    """
+    slots = []
+    for period in chain.proposer_schedule.update(chain.state):
+        for shard_id in chain.proposer_schedule.get_proposer_shards(valcode_addr, period):
+            slots.append((shard_id, period))
+    return slots
+
+
+class CollationBuilder(object):
+    """Build the collation of a proposer slot within a time budget
+
+    The builder runs the phases of docs/doc.md one after the other:
+    GUESS_HEAD checks the candidate heads of `fetch_candidate_heads` from
+    the highest score until one is valid back to the genesis, fetching and
+    validating the collations the shard doesn't have, or its share of the
+    budget runs out, then CREATE_COLLATION starts a collation on the
+    head and packs transactions until the queue is empty or the deadline.
+    A signed collation is always ready from the end of `create`, and is
+    improved by `pack`: `best_collation` finalizes a clone of the state, so
+    packing can continue after it.
+
+    The time spent in each phase is kept in `phase_times`, observed in the
+    `collation_builder.<phase>.seconds` histograms, and reported against the
+    deadline by `report`.
+
+    time_budget: the seconds until the collation must be sent, e.g. the time
+        of the blocks left before the period of the slot
+    fetch_collation: if given, `fetch_collation(collation_hash)` downloads
+        a collation from the shard network, or returns None if it's not
+        available
+    """
+
+    def __init__(self, chain, shard_id, expected_period_number, coinbase, key,
+                 txqueue=None, time_budget=1.0, guess_head_share=DEFAULT_GUESS_HEAD_SHARE,
+                 clock=default_timer, fetch_collation=None):
+        assert chain.has_shard(shard_id)
+        self.chain = chain
+        self.shard = chain.shards[shard_id]
+        self.shard_id = shard_id
+        self.expected_period_number = expected_period_number
+        self.coinbase = coinbase
+        self.key = key
+        self.txqueue = txqueue
+        self.clock = clock
+        self.fetch_collation = fetch_collation
+        self.start_time = clock()
+        self.deadline = self.start_time + time_budget
+        self.guess_head_deadline = self.start_time + time_budget * guess_head_share
+        self.phase_times = OrderedDict((phase, 0.0) for phase in PHASES)
+
+        self.head_hash = None
+        self.head_score = None
+        self.checked_heads = 0
+        self.verified = {}      # collation_hash -> whether it's valid back to the genesis
+        self.state = None
+        self.period_start_prevhash = None
+        self.collation = None
+        self._best = None
+
+    @property
+    def remaining(self):
+        return self.deadline - self.clock()
+
+    def _observe(self, phase, start):
+        elapsed = self.clock() - start
+        self.phase_times[phase] += elapsed
+        metrics.histogram('collation_builder.{}.seconds'.format(phase)).observe(elapsed)
+
+    def _is_genesis(self, collation_hash):
+        return collation_hash == self.shard.env.config['GENESIS_PREVHASH']
+
+    def _is_known_invalid(self, collation_hash):
+        return self.verified.get(collation_hash) is False or \
+            self.shard.validity_cache.is_valid(collation_hash, self.chain.head_hash) is False
+
+    def fetch_and_verify(self, collation_hash):
+        """Whether the collation and all its ancestors are available and
+        valid, memoized in `verified`
+
+        The collations which aren't in the shard db are fetched with
+        `fetch_collation` and added to the shard from the oldest one, which
+        validates them. Returns None if the GUESS_HEAD budget runs out first.
+        """
+        # Walk back to a collation with a known verdict, or to the genesis
+        path = []       # (collation_hash, fetched collation or None)
+        h = collation_hash
+        while True:
+            if self.clock() >= self.guess_head_deadline:
+                return None
+            if h in self.verified:
+                valid = self.verified[h]
+                break
+            if self._is_genesis(h):
+                valid = True
+                break
+            if self._is_known_invalid(h):
+                self.verified[h] = valid = False
+                break
+            if h in self.shard.db:
+                collation = self.shard.get_collation(h)
+                path.append((h, None))
+            else:
+                collation = self.fetch_collation(h) if self.fetch_collation is not None else None
+                if collation is None:
+                    log.info('Collation {} is not available'.format(encode_hex(h)))
+                    self.verified[h] = valid = False
+                    break
+                path.append((h, collation))
+            h = collation.header.parent_collation_hash
+
+        for h, collation in reversed(path):
+            if valid and collation is not None:
+                if self.clock() >= self.guess_head_deadline:
+                    return None
+                period_start_prevblock = self.chain.get_block(collation.header.period_start_prevhash)
+                valid = self.shard.add_collation(collation, period_start_prevblock)
+            self.verified[h] = valid
+        return valid
+
+    def guess_head(self):
+        """Pick the candidate head with the highest score whose collation and
+        ancestors are available and valid, checking the candidates until the
+        GUESS_HEAD budget runs out. Falls back to the shard's current head.
+        """
+        start = self.clock()
+        head_hash = head_score = None
+        for score, collation_hash in self.chain.fetch_candidate_heads(self.shard_id):
+            if self.clock() >= self.guess_head_deadline:
+                break
+            self.checked_heads += 1
+            if self.fetch_and_verify(collation_hash):
+                head_hash, head_score = collation_hash, score
+                break
+        if head_hash is None:
+            if self.clock() >= self.guess_head_deadline:
+                log.info('Out of time for GUESS_HEAD after {} candidates'.format(self.checked_heads))
+            # The head of the shard, or its closest ancestor not known to be invalid
+            head_hash = self.shard.head_hash
+            while not self._is_genesis(head_hash) and self._is_known_invalid(head_hash):
+                head_hash = self.shard.get_collation(head_hash).header.parent_collation_hash
+            head_score = 0 if self._is_genesis(head_hash) else \
+                self.shard.get_score(self.shard.get_collation(head_hash))
+        if head_hash != self.head_hash:
+            # Start again on the new head
+            self.state = self.collation = self._best = None
+        self.head_hash, self.head_score = head_hash, head_score
+        self._observe('guess_head', start)
+        log.info('Guessed head {} with score {}'.format(encode_hex(head_hash), head_score))
+        return head_hash
+
+    def create(self):
+        """Start an empty collation on the guessed head
+        """
+        if self.head_hash is None:
+            self.guess_head()
+        start = self.clock()
+        self.state = self.shard.mk_poststate_of_collation_hash(self.head_hash)
+        period_start_prevhash = self.chain.get_period_start_prevhash(self.expected_period_number)
+        assert period_start_prevhash is not None
+        get_consensus_strategy(self.state.config).initialize(
+            self.state, self.chain.get_block(period_start_prevhash))
+        gas_limit = call_valmgr(self.chain.state, 'get_collation_gas_limit', [])
+        state_transition.set_collation_gas_limit(self.state, gas_limit)
+
+        self.period_start_prevhash = period_start_prevhash
+        self.collation = self._mk_collation(self.state)
+        self._best = None
+        self._observe('create', start)
+
+    def _mk_collation(self, state):
+        collation = state_transition.mk_collation_from_prevstate(self.shard, state, self.coinbase)
+        collation.header.parent_collation_hash = self.head_hash
+        collation.header.expected_period_number = self.expected_period_number
+        collation.header.period_start_prevhash = self.period_start_prevhash
+        collation.header.number = self.shard.get_collation(self.head_hash).number + 1
+        return collation
+
+    def pack(self, deadline=None):
+        """Add the transactions of the queue to the collation until the queue
+        is empty or the deadline
+        """
+        if self.collation is None:
+            self.create()
+        start = self.clock()
+        state_transition.add_transactions(
+            self.state, self.collation, self.txqueue, self.chain.state, self.shard_id,
+            deadline=self.deadline if deadline is None else deadline, clock=self.clock,
+        )
+        if self._best is not None and len(self._best.transactions) != len(self.collation.transactions):
+            self._best = None
+        self._observe('pack', start)
+
+    def best_collation(self):
+        """The signed collation with the transactions packed so far
+        """
+        if self.collation is None:
+            self.create()
+        if self._best is not None:
+            return self._best
+        start = self.clock()
+        self.state.commit()
+        temp_state = self.state.ephemeral_clone()
+        collation = self._mk_collation(temp_state)
+        collation.header.prev_state_root = self.collation.header.prev_state_root
+        collation.transactions = list(self.collation.transactions)
+        state_transition.finalize(temp_state, collation.header.coinbase)
+        state_transition.set_execution_results(temp_state, collation)
+        collation.header.sig = sign(collation.signing_hash, self.key)
+        self._best = collation
+        self._observe('seal', start)
+        return collation
+
+    def build(self):
+        """Run all the phases within the budget and return the best collation
+        """
+        self.guess_head()
+        self.create()
+        self.pack()
+        collation = self.best_collation()
+        if self.remaining < 0:
+            metrics.counter('collation_builder.deadline_missed').inc()
+            log.info('Missed the deadline by {:.4f}s'.format(-self.remaining))
+        return collation
+
+    def report(self):
+        """The time spent in each phase against the deadline
+        """
+        budget = self.deadline - self.start_time
+        return {
+            'phases': dict(self.phase_times),
+            'budget': budget,
+            'elapsed': self.clock() - self.start_time,
+            'remaining': self.remaining,
+            'checked_heads': self.checked_heads,
+            'head_score': self.head_score,
+            'num_txs': len(self.collation.transactions) if self.collation is not None else 0,
+        }
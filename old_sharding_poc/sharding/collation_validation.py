@@ -0,0 +1,123 @@
+import rlp
+from ethereum.slogging import get_logger
+from ethereum.utils import encode_hex
+
+from sharding import state_transition
+from sharding.collator import apply_collation
+from sharding.config import sharding_config
+from sharding.metrics import metrics
+from sharding.validator_manager_utils import call_validation_code
+
+log = get_logger('sharding.collation_validation')
+
+# The stages of `validate_collation`, cheapest first
+STAGES = ('structure', 'signature', 'tx_root', 'execution')
+# The stages whose result only depends on the collation and its period,
+# not on the state of the main chain head
+CONTEXT_FREE_STAGES = ('structure', 'signature', 'tx_root')
+
+
+class CollationValidationError(ValueError):
+
+    def __init__(self, stage, reason):
+        super(CollationValidationError, self).__init__('{} check failed: {}'.format(stage, reason))
+        self.stage = stage
+        self.reason = reason
+
+
+def check_structure(shard_chain, collation, period_start_prevblock):
+    """The checks which don't need any state
+    """
+    if collation.header.shard_id != shard_chain.shard_id:
+        raise CollationValidationError(
+            'structure', 'shard_id {} != {}'.format(collation.header.shard_id, shard_chain.shard_id))
+    if period_start_prevblock is None:
+        raise CollationValidationError('structure', 'unknown period_start_prevblock')
+    size = len(rlp.encode(collation))
+    if size > sharding_config['MAX_COLLATION_SIZE']:
+        raise CollationValidationError('structure', 'size {} bytes'.format(size))
+
+
+def check_signature(main_chain, collation):
+    """Check that the header is signed by the eligible proposer of its period
+
+    Returns False if the proposer isn't known on the current main chain
+    state, e.g. the period is out of the lookahead window, and the check is
+    skipped.
+    """
+    header = collation.header
+    state = main_chain.state
+    main_chain.proposer_schedule.update(state)
+    proposer = main_chain.proposer_schedule.get_proposer(header.shard_id, header.expected_period_number)
+    if proposer is None or proposer == b'\x00' * 20:
+        return False
+    if len(header.sig) != 96 or not call_validation_code(state, proposer, header.signing_hash, header.sig):
+        raise CollationValidationError(
+            'signature', 'not signed by the eligible proposer {}'.format(encode_hex(proposer)))
+    return True
+
+
+def check_tx_root(collation):
+    try:
+        state_transition.validate_transaction_tree(collation)
+    except ValueError as e:
+        raise CollationValidationError('tx_root', str(e))
+
+
+def execute(shard_chain, collation, period_start_prevblock, env=None, mainchain_state=None):
+    """Apply the collation on the post-state of its parent, and return it
+
+    env: if given, the Env of the post-state instead of the shard chain's
+    mainchain_state: if given, used instead of the main chain's head state
+    """
+    if mainchain_state is None:
+        mainchain_state = shard_chain.main_chain.state
+    state = shard_chain.mk_poststate_of_collation_hash(collation.header.parent_collation_hash, env)
+    apply_collation(
+        state,
+        collation,
+        period_start_prevblock,
+        mainchain_state,
+        shard_chain.shard_id
+    )
+    return state
+
+
+def _run_stage(stage, f, *args):
+    with metrics.timer('collation_validation.{}.seconds'.format(stage)):
+        try:
+            result = f(*args)
+        except Exception:
+            metrics.counter('collation_validation.{}.rejected'.format(stage)).inc()
+            raise
+    # A stage which returns False couldn't run
+    outcome = 'skipped' if result is False else 'passed'
+    metrics.counter('collation_validation.{}.{}'.format(stage, outcome)).inc()
+    return result
+
+
+def validate_collation(
+        shard_chain, collation, period_start_prevblock, check_header_signature=False,
+        speculative_cache=None):
+    """Validate the collation in stages, cheapest first, so that an invalid
+    collation is rejected before the expensive ones:
+    structure, header signature and proposer eligibility, tx root, execution
+
+    Each stage counts its passed and rejected collations and observes its
+    latency in `metrics`. The signature stage only runs if
+    `check_header_signature` is set. If the collation was already validated
+    in the background by `speculative_cache`, its result replaces the tx root
+    and execution stages.
+    Returns the post-state of the collation, raises on an invalid collation.
+    """
+    _run_stage('structure', check_structure, shard_chain, collation, period_start_prevblock)
+    if check_header_signature:
+        _run_stage('signature', check_signature, shard_chain.main_chain, collation)
+    if speculative_cache is not None:
+        state = speculative_cache.take(collation, period_start_prevblock)
+        if state is not None:
+            return state
+    _run_stage('tx_root', check_tx_root, collation)
+    state = _run_stage('execution', execute, shard_chain, collation, period_start_prevblock)
+    log.debug('Collation {} is valid'.format(encode_hex(collation.header.hash)))
+    return state
@@ -1,24 +1,73 @@
 import rlp
 
+from ethereum.config import Env
 from ethereum.slogging import get_logger
 from ethereum.consensus_strategy import get_consensus_strategy
 from ethereum.common import mk_block_from_prevstate
-from ethereum.state import State
+from ethereum.db import OverlayDB
+from ethereum.state import (
+    STATE_DEFAULTS,
+    State,
+)
 from ethereum.exceptions import VerificationFailed
+from ethereum.transaction_queue import TransactionQueue
+from ethereum.utils import encode_hex
 
 from sharding import state_transition
+from sharding.access_list import (
+    AccessListViolation,
+    prefetch_access_lists,
+)
 from sharding.contract_utils import sign
 from sharding.validator_manager_utils import call_valmgr
-from sharding.receipt_consuming_tx_utils import apply_shard_transaction
+from sharding.receipt_consuming_tx_utils import (
+    apply_shard_transaction,
+    is_receipt_consuming_tx,
+    mk_receipt_consuming_txs,
+)
+from sharding.parallel_execution import apply_transactions_optimistically
+from sharding.sender_cache import sender_cache
+from sharding.signature_utils import recover_tx_senders
+from sharding.trie_db import (
+    RecordingDB,
+    WitnessDB,
+    cached_trie_nodes,
+    db_value_to_object,
+    deferred_commits,
+)
 
 log = get_logger('sharding.collator')
 
 
-def apply_collation(state, collation, period_start_prevblock, mainchain_state, shard_id=None):
+def apply_collation(
+        state, collation, period_start_prevblock, mainchain_state, shard_id=None,
+        preverify_pool=None, optimistic=False, execution_pool=None, access_lists=None,
+        deferred_commit=False, checkpoint_interval=None):
     """Apply collation
+
+    preverify_pool: if given, the senders of the txs are recovered in this
+        process/thread pool before the txs are executed
+    optimistic: if True, the txs are executed speculatively and then
+        validated in order, see `apply_transactions_optimistically`
+    execution_pool: the thread pool of the speculative executions
+    access_lists: if given, the access list of each tx, which is enforced
+        during its execution and used to prefetch the trie nodes of the
+        whole collation before the txs are executed
+    deferred_commit: if True, the trie nodes written by the per-tx commits
+        are buffered in memory and written to the db at the end of the
+        collation, or every `checkpoint_interval` txs, see `deferred_commits`
     """
+    if deferred_commit:
+        with deferred_commits(state, checkpoint_interval):
+            return apply_collation(
+                state, collation, period_start_prevblock, mainchain_state, shard_id,
+                preverify_pool, optimistic, execution_pool, access_lists,
+            )
+
     snapshot = state.snapshot()
     cs = get_consensus_strategy(state.config)
+    if preverify_pool is not None:
+        recover_tx_senders(collation.transactions, pool=preverify_pool)
 
     try:
         # Call the initialize state transition function
@@ -29,19 +78,84 @@ def apply_collation(state, collation, period_start_prevblock, mainchain_state, s
         # assert cs.check_seal(state, period_start_prevblock.header)
         # Validate tx_list_root in collation first
         assert state_transition.validate_transaction_tree(collation)
-        for tx in collation.transactions:
-            apply_shard_transaction(
-                mainchain_state, state, shard_id, tx
+        if access_lists is not None:
+            assert len(access_lists) == len(collation.transactions)
+            with cached_trie_nodes(state):
+                senders = [
+                    sender_cache.get_sender(tx) for tx in collation.transactions
+                    if not is_receipt_consuming_tx(tx)
+                ]
+                prefetch_access_lists(state, access_lists, senders + [state.block_coinbase])
+                for tx, access_list in zip(collation.transactions, access_lists):
+                    apply_shard_transaction(
+                        mainchain_state, state, shard_id, tx, access_list=access_list
+                    )
+        elif optimistic:
+            apply_transactions_optimistically(
+                mainchain_state, state, shard_id, collation.transactions, pool=execution_pool
             )
+        else:
+            for tx in collation.transactions:
+                apply_shard_transaction(
+                    mainchain_state, state, shard_id, tx
+                )
         # Set state root, receipt root, etc
         state_transition.finalize(state, collation.header.coinbase)
         assert state_transition.verify_execution_results(state, collation)
-    except (ValueError, AssertionError) as e:
+    except (ValueError, AssertionError, AccessListViolation) as e:
         state.revert(snapshot)
         raise e
     return state
 
 
+def mk_witness(shard_chain, collation, period_start_prevblock, mainchain_state):
+    """Make the witness of a collation: the trie nodes and codes of the
+    parent's post-state that its execution reads, as (nodes, codes)
+    """
+    parent_state = shard_chain.mk_poststate_of_collation_hash(
+        collation.header.parent_collation_hash, env=Env(OverlayDB(shard_chain.db), shard_chain.env.config))
+    # Open the parent's post-state again from its root, reading through the
+    # RecordingDB: the root node is read once, when the trie is made, and
+    # a genesis post-state is written rather than read
+    db = RecordingDB(parent_state.env.db)
+    state = State.from_snapshot(
+        parent_state.to_snapshot(root_only=True, no_prevblocks=True), Env(db, parent_state.config))
+    for param in STATE_DEFAULTS:
+        setattr(state, param, getattr(parent_state, param))
+    apply_collation(state, collation, period_start_prevblock, mainchain_state, shard_chain.shard_id)
+    nodes, codes = [], []
+    for key, value in sorted(db.reads.items()):
+        obj = db_value_to_object(key, value)
+        if obj is None:
+            continue
+        if obj == value:
+            codes.append(obj)
+        else:
+            nodes.append(obj)
+    return nodes, codes
+
+
+def apply_collation_stateless(
+        state_root, witness, collation, period_start_prevblock, mainchain_state, config,
+        shard_id=None, codes=()):
+    """Apply collation to the state root with only a witness, see
+    `apply_block` of docs/doc.md
+
+    witness: the trie nodes which the execution reads
+    config: the config of the shard state
+    codes: the codes of the contracts which the execution calls
+
+    Returns (post_state_root, reads, writes): the hashes of the witness
+    objects which were read, and the new trie nodes and codes by hash.
+    Raises KeyError if the execution needs an object missing from the
+    witness.
+    """
+    db = WitnessDB(witness, codes)
+    state = State(state_root, Env(db, config))
+    apply_collation(state, collation, period_start_prevblock, mainchain_state, shard_id)
+    return state.trie.root_hash, db.reads, db.get_written_objects()
+
+
 def create_collation(
         chain,
         shard_id,
@@ -50,7 +164,8 @@ def create_collation(
         coinbase,
         key,
         txqueue=None,
-        period_start_prevhash=None):
+        period_start_prevhash=None,
+        consume_receipts=False):
     """Create a collation
 
     chain: MainChain
@@ -61,10 +176,13 @@ def create_collation(
     key: key for sig
     txqueue: transaction queue
     period_start_prevhash: the block hash of block PERIOD_LENGTH * expected_period_number - 1
+    consume_receipts: if True, add the receipt-consuming txs of the pending receipts to this shard
     """
     log.info('Creating a collation')
 
     assert chain.has_shard(shard_id)
+    if chain.shards[shard_id].validity_cache.is_valid(parent_collation_hash) is False:
+        raise ValueError('Parent collation {} is invalid'.format(encode_hex(parent_collation_hash)))
 
     temp_state = chain.shards[shard_id].mk_poststate_of_collation_hash(parent_collation_hash)
     cs = get_consensus_strategy(temp_state.config)
@@ -79,6 +197,15 @@ def create_collation(
     # Collation Gas Limit
     gas_limit = call_valmgr(chain.state, 'get_collation_gas_limit', [])
     state_transition.set_collation_gas_limit(temp_state, gas_limit)
+    # Pull the pending receipts of this shard from the receipt index
+    if consume_receipts:
+        receipts = chain.receipt_index.get_receipts(shard_id)
+        rctxs = mk_receipt_consuming_txs(chain.state, temp_state, shard_id, receipts)
+        log.info('Adding %d receipt-consuming txs' % len(rctxs))
+        if txqueue is None:
+            txqueue = TransactionQueue()
+        for tx in rctxs:
+            txqueue.add_transaction(tx)
     # Initialize a collation with the given previous state and current coinbase
     collation = state_transition.mk_collation_from_prevstate(chain.shards[shard_id], temp_state, coinbase)
     # Add transactions
@@ -22,7 +22,9 @@ sharding_config['SIG_GASLIMIT'] = 40000
 sharding_config['PERIOD_LENGTH'] = 5                 # blocks
 sharding_config['SHUFFLING_CYCLE_LENGTH'] = 25       # blocks, this parameter will be [DEPRECATED] for stateless client
 sharding_config['LOOKAHEAD_PERIODS'] = 4
+sharding_config['NUM_VALIDATORS_PER_CYCLE'] = 100    # will be [DEPRECATED] for stateless client
 sharding_config['DEPOSIT_SIZE'] = 10 ** 20
+sharding_config['MAX_COLLATION_SIZE'] = 2 ** 20     # bytes, of the RLP-encoded collation
 sharding_config['CONTRACT_CALL_GAS'] = {
     'VALIDATOR_MANAGER': defaultdict(lambda: 200000, {
         'deposit': 160000,
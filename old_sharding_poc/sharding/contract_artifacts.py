@@ -0,0 +1,158 @@
+import json
+import os
+import tempfile
+
+from ethereum import utils
+from ethereum.slogging import get_logger
+
+log = get_logger('sharding.contract_artifacts')
+
+CACHE_DIR_ENV = 'SHARDING_ARTIFACT_CACHE_DIR'
+DEFAULT_CACHE_DIR = os.path.join('~', '.cache', 'sharding', 'artifacts')
+
+_compiler_version = None
+_compiler_source_hash = None
+# source_path -> {'bytecode': bytes, 'abi': list}
+_artifacts = {}
+
+
+def get_cache_dir():
+    return os.path.expanduser(os.environ.get(CACHE_DIR_ENV, DEFAULT_CACHE_DIR))
+
+
+def _get_distribution_version(name):
+    try:
+        from importlib.metadata import version, PackageNotFoundError
+    except ImportError:
+        # Python < 3.8
+        try:
+            from importlib_metadata import version, PackageNotFoundError
+        except ImportError:
+            from pkg_resources import get_distribution, DistributionNotFound
+            try:
+                return get_distribution(name).version
+            except DistributionNotFound:
+                return None
+    try:
+        return version(name)
+    except PackageNotFoundError:
+        return None
+
+
+def _find_package_dir(name):
+    try:
+        from importlib.util import find_spec
+    except ImportError:
+        # Python 2
+        import imp
+        try:
+            return imp.find_module(name)[1]
+        except ImportError:
+            return None
+    spec = find_spec(name)
+    if spec is None or not spec.submodule_search_locations:
+        return None
+    return list(spec.submodule_search_locations)[0]
+
+
+def get_compiler_version():
+    """Get the version of the installed Viper compiler without importing it
+    """
+    global _compiler_version
+    if _compiler_version is None:
+        _compiler_version = _get_distribution_version('viper') or 'unknown'
+    return _compiler_version
+
+
+def get_compiler_source_hash():
+    """Get the sha3 of the source files of the installed Viper compiler
+    without importing it, e.g. for a development install whose version
+    doesn't change with its code
+    """
+    global _compiler_source_hash
+    if _compiler_source_hash is None:
+        package_dir = _find_package_dir('viper')
+        source = []
+        if package_dir is not None:
+            for root, dirs, files in os.walk(package_dir):
+                dirs.sort()
+                for name in sorted(files):
+                    if name.endswith('.py'):
+                        path = os.path.join(root, name)
+                        with open(path, 'rb') as f:
+                            source.append(utils.to_string(os.path.relpath(path, package_dir)) + b'\x00' + f.read())
+        _compiler_source_hash = utils.encode_hex(utils.sha3(b'\x00'.join(source)))
+    return _compiler_source_hash
+
+
+def get_artifact_key(code):
+    """The key of the compiled artifact of the contract source `code`
+    """
+    return utils.encode_hex(utils.sha3(b'\x00'.join([
+        utils.to_string(code),
+        utils.to_string(get_compiler_version()),
+        utils.to_string(get_compiler_source_hash()),
+    ])))
+
+
+def get_artifact_path(source_path, code):
+    name = os.path.basename(source_path).split('.')[0]
+    return os.path.join(get_cache_dir(), '{}-{}.json'.format(name, get_artifact_key(code)))
+
+
+def _compile(code):
+    from viper import compiler
+    return {
+        'bytecode': compiler.compile(code),
+        'abi': compiler.mk_full_signature(code),
+    }
+
+
+def _load(path):
+    try:
+        with open(path) as f:
+            artifact = json.load(f)
+        return {
+            'bytecode': utils.decode_hex(artifact['bytecode']),
+            'abi': artifact['abi'],
+        }
+    except (IOError, OSError, ValueError, KeyError):
+        return None
+
+
+def _store(path, artifact):
+    try:
+        cache_dir = os.path.dirname(path)
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        # Write to a temporary file first so that concurrent processes
+        # never read a partially written artifact
+        fd, tmp_path = tempfile.mkstemp(dir=cache_dir)
+        with os.fdopen(fd, 'w') as f:
+            json.dump({
+                'bytecode': utils.encode_hex(artifact['bytecode']),
+                'abi': artifact['abi'],
+            }, f)
+        os.rename(tmp_path, path)
+    except (IOError, OSError) as e:
+        log.warn('Failed to store the contract artifact {}: {}'.format(path, e))
+
+
+def get_contract_artifact(source_path):
+    """Get the bytecode and the ABI of the Viper contract at `source_path`
+
+    The artifact is compiled once and stored in the cache directory, keyed by
+    the sha3 of the contract source, the compiler version and the sha3 of the
+    compiler source. On a cache hit the compiler isn't imported at all.
+    """
+    if source_path not in _artifacts:
+        with open(source_path) as f:
+            code = f.read()
+        path = get_artifact_path(source_path, code)
+        artifact = _load(path)
+        if artifact is None:
+            log.debug('Compiling {}'.format(source_path))
+            artifact = _compile(code)
+            _store(path, artifact)
+        _artifacts[source_path] = artifact
+    return _artifacts[source_path]
@@ -4,13 +4,23 @@ from ethereum import (
     utils,
     vm,
 )
+from ethereum.abi import encode_abi
 from ethereum.messages import apply_message
-from ethereum.transactions import Transaction
+from ethereum.transactions import (
+    Transaction,
+    secpk1n,
+)
+
+from sharding.sender_cache import sender_cache
+from sharding.state_view import StateView
 
 
 STARTGAS = 3141592   # TODO: use config
 GASPRICE = 1         # TODO: use config
 
+# (ct, func) -> (function selector, encode_types)
+_function_encoders = {}
+
 
 class MessageFailed(Exception):
     pass
@@ -22,6 +32,26 @@ def sign(msg_hash, privkey):
     return signature
 
 
+def ecrecover_from_signature(msg_hash, signature):
+    """Do the same as calling the ECRECOVER precompile with `msg_hash + signature`
+    as the input data, where signature is `v, r, s` encoded as 32-byte words
+
+    Returns the recovered address, or None if the precompile would return
+    nothing.
+    """
+    data = (msg_hash + signature)[:128].ljust(128, b'\x00')
+    v = utils.big_endian_to_int(data[32:64])
+    r = utils.big_endian_to_int(data[64:96])
+    s = utils.big_endian_to_int(data[96:128])
+    if r >= secpk1n or s >= secpk1n or v < 27 or v > 28:
+        return None
+    try:
+        pub = utils.ecrecover_to_pub(data[:32], v, r, s)
+    except Exception:
+        return None
+    return utils.sha3(pub)[-20:]
+
+
 def get_tx_rawhash(tx, network_id=None):
     """Get a tx's rawhash.
        Copied from ethereum.transactions.Transaction.sign
@@ -35,15 +65,51 @@ def get_tx_rawhash(tx, network_id=None):
     return rawhash
 
 
-def extract_sender_from_tx(tx):
+def _recover_sender_from_rawhash(tx):
     tx_rawhash = get_tx_rawhash(tx)
     return utils.sha3(
         utils.ecrecover_to_pub(tx_rawhash, tx.v, tx.r, tx.s)
     )[-20:]
 
 
+def extract_sender_from_tx(tx):
+    return sender_cache.get_sender(tx, recover=_recover_sender_from_rawhash)
+
+
+def get_function_encoder(ct, func):
+    """Get the cached function selector and argument types of `func`
+    """
+    key = (ct, func)
+    if key not in _function_encoders:
+        if func not in ct.function_data:
+            raise ValueError('Unknown function {}'.format(func))
+        description = ct.function_data[func]
+        _function_encoders[key] = (
+            utils.zpad(utils.encode_int(description['prefix']), 4),
+            description['encode_types'],
+        )
+    return _function_encoders[key]
+
+
+def encode_function_call(ct, func, args):
+    """Same as `ct.encode_function_call(func, args)`, with the function
+    selector and argument types looked up only once per (ct, func)
+    """
+    selector, encode_types = get_function_encoder(ct, func)
+    if not encode_types:
+        return selector
+    return selector + encode_abi(encode_types, args)
+
+
+def mk_calldata(data):
+    """Make the message call data backed by a bytearray copy of `data`,
+    instead of a list of ints
+    """
+    return vm.CallData(bytearray(data))
+
+
 def call_msg(state, ct, func, args, sender_addr, to, value=0, startgas=STARTGAS):
-    abidata = vm.CallData([utils.safe_ord(x) for x in ct.encode_function_call(func, args)])
+    abidata = mk_calldata(encode_function_call(ct, func, args))
     msg = vm.Message(sender_addr, to, value, startgas, abidata)
     result = apply_message(state, msg)
     if result is None:
@@ -58,7 +124,7 @@ def call_msg(state, ct, func, args, sender_addr, to, value=0, startgas=STARTGAS)
 
 def call_contract_constantly(state, ct, contract_addr, func, args, value=0, startgas=200000, sender_addr=b'\x00' * 20):
     return call_msg(
-        state.ephemeral_clone(), ct, func, args,
+        StateView(state), ct, func, args,
         sender_addr, contract_addr, value, startgas
     )
 
@@ -76,7 +142,7 @@ def call_tx(state, ct, func, args, sender, to, value=0, startgas=STARTGAS, gaspr
     tx = Transaction(
         state.get_nonce(utils.privtoaddr(sender)) if nonce is None else nonce,
         gasprice, startgas, to, value,
-        ct.encode_function_call(func, args)
+        encode_function_call(ct, func, args)
     ).sign(sender)
     return tx
 
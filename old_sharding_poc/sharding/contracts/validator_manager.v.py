@@ -396,7 +396,7 @@ def tx_to_shard(to: address, shard_id: num, tx_startgas: num, tx_gasprice: num,
 
     raw_log(
         [sha3("tx_to_shard()"), as_bytes32(to), as_bytes32(shard_id)],
-        concat('', as_bytes32(receipt_id))
+        concat('', as_bytes32(receipt_id), as_bytes32(msg.value), as_bytes32(tx_startgas))
     )
 
     return receipt_id
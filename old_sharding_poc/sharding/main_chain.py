@@ -20,8 +20,20 @@ from ethereum.exceptions import (
 )
 from ethereum.db import RefcountDB
 
+from sharding.candidate_heads import CandidateHeadIndex
 from sharding.shard_chain import ShardChain
-from sharding.validator_manager_utils import ADD_HEADER_TOPIC
+from sharding.shard_import import MultiShardImporter
+from sharding.proposer_schedule import ProposerSchedule
+from sharding.receipt_index import ReceiptIndex
+from sharding.stateless_collator import (
+    CollationsWithScoreCache,
+    get_collations_by_score,
+    get_collations_with_scores_in_range,
+)
+from sharding.validator_manager_utils import (
+    ADD_HEADER_TOPIC,
+    get_valmgr_addr,
+)
 
 log = get_logger('eth.chain')
 
@@ -38,6 +50,12 @@ class MainChain(Chain):
         self.shards = {}
         self.shard_id_list = set()
         self.add_header_logs = []
+        self.receipt_index = ReceiptIndex()
+        self.proposer_schedule = ProposerSchedule()
+        self.candidate_heads = CandidateHeadIndex()
+        self.collations_with_score_cache = CollationsWithScoreCache(self.candidate_heads, self.is_canonical_block)
+        # Imports the collations of the shards in worker processes, if started
+        self.shard_importer = None
 
     # Call upon receiving a block
     def add_block(self, block):
@@ -66,6 +84,8 @@ class MainChain(Chain):
                          (block.number, encode_hex(block.header.hash[:4]), encode_hex(block.header.prevhash[:4]), str(e)))
                 return False, {}
             self.db.put(b'block:%d' % block.header.number, block.header.hash)
+            self.receipt_index.add_block_receipts(block.header.hash, self.state.receipts)
+            self.receipt_index.connect_block(block.header.hash)
             # side effect: put 'score:' cache in db
             block_score = self.get_score(block)
             self.head_hash = block.header.hash
@@ -76,6 +96,7 @@ class MainChain(Chain):
                 block.header.number) == block.header.hash
             deletes = self.state.deletes
             changed = self.state.changed
+            self.update_proposer_schedule()
         # Or is the block being added to a chain that is not currently the
         # head?
         elif block.header.prevhash in self.env.db:
@@ -90,6 +111,9 @@ class MainChain(Chain):
                     'Block %s with parent %s invalid, reason: %s' %
                     (encode_hex(block.header.hash[:4]), encode_hex(block.header.prevhash[:4]), str(e)))
                 return False, {}
+            self.receipt_index.add_block_receipts(block.header.hash, temp_state.receipts)
+            # The log listeners only see the logs of the blocks added to the head
+            self.add_block_header_logs(block, temp_state.receipts)
             deletes = temp_state.deletes
             block_score = self.get_score(block)
             changed = temp_state.changed
@@ -98,7 +122,7 @@ class MainChain(Chain):
                 b = block
                 new_chain = {}
                 # Find common ancestor
-                while b.header.number >= int(self.db.get(b'GENESIS_NUMBER')):
+                while b.header.number >= self.genesis.header.number:
                     new_chain[b.header.number] = b
                     key = b'block:%d' % b.header.number
                     orig_at_height = self.db.get(
@@ -131,6 +155,12 @@ class MainChain(Chain):
                                 orig_block_at_height.header.hash))
                         # Delete from block index
                         self.db.delete(key)
+                        # Delete from receipt index
+                        self.receipt_index.disconnect_block(orig_at_height)
+                        # Delete from candidate heads
+                        self.candidate_heads.remove_block(orig_at_height)
+                        # Drop the proposer schedules seeded by the block
+                        self.proposer_schedule.invalidate(i)
                         # Delete from txindex
                         for tx in orig_block_at_height.transactions:
                             if b'txindex:' + tx.hash in self.db:
@@ -149,6 +179,10 @@ class MainChain(Chain):
                                 new_block_at_height.header.hash))
                         # Add to block index
                         self.db.put(key, new_block_at_height.header.hash)
+                        # Add to receipt index
+                        self.receipt_index.connect_block(new_block_at_height.header.hash)
+                        # Add back to candidate heads if it was removed before
+                        self.candidate_heads.restore_block(new_block_at_height.header.hash)
                         # Add to txindex
                         for j, tx in enumerate(
                                 new_block_at_height.transactions):
@@ -178,6 +212,9 @@ class MainChain(Chain):
                 self.head_hash = block.header.hash
                 self.state = temp_state
                 self.state.executing_on_head = True
+                # The cached collations with score are of the old chain
+                self.collations_with_score_cache.clear()
+                self.update_proposer_schedule()
         # Block has no parent yet
         else:
             if block.header.prevhash not in self.parent_queue:
@@ -213,6 +250,7 @@ class MainChain(Chain):
             except KeyError as e:
                 print(e)
                 pass
+            self.receipt_index.prune_block(old_block_hash)
         self.db.commit()
         assert (b'deletes:' + block.hash) in self.db
         log.info('Added block %d (%s) with %d txs and %d gas' %
@@ -231,7 +269,7 @@ class MainChain(Chain):
                 self.add_block(_blk)
 
                 # FIXME check_collation
-                collation_map, missing_collations_map = self.parse_add_header_logs(block)
+                collation_map, missing_collations_map = self.parse_add_header_logs(_blk)
                 for i in missing_collations_map:
                     if i not in missing_collations:
                         missing_collations[i] = {}
@@ -271,6 +309,61 @@ class MainChain(Chain):
         """
         return shard_id in self.shard_id_list
 
+    def start_shard_importer(self, processes=None):
+        """Import the collations of the tracked shards in worker processes
+        from now on, see MultiShardImporter
+        """
+        assert self.shard_importer is None, 'shard importer already started'
+        self.shard_importer = MultiShardImporter(self, processes)
+        return self.shard_importer
+
+    def stop_shard_importer(self):
+        if self.shard_importer is not None:
+            self.shard_importer.close()
+            self.shard_importer = None
+
+    def import_collations(self, block, collations):
+        """Add the collations whose headers are included in `block`, at most
+        one per shard, and reorganize the heads of their shards
+
+        The collations of the shards of `shard_importer` are added in its
+        worker processes in parallel, and the others in this process, in the
+        order of the shard ids.
+
+        Returns {shard_id: True if the collation was added}
+        """
+        imported = []
+        collation_map = {}
+        for collation in collations:
+            shard_id = collation.header.shard_id
+            if self.shard_importer is not None and shard_id in self.shard_importer.shard_ids:
+                imported.append(collation)
+            elif self.has_shard(shard_id):
+                assert shard_id not in collation_map, 'two collations of shard {}'.format(shard_id)
+                collation_map[shard_id] = collation
+        added = self.shard_importer.import_collations(block, imported) if imported else {}
+
+        # Carry the heads of all the shards over to the block first
+        self.reorganize_head_collation(block, None)
+        for shard_id in sorted(collation_map):
+            collation = collation_map[shard_id]
+            shard = self.shards[shard_id]
+            added[shard_id] = collation.header.hash in shard.db or \
+                shard.add_collation(collation, self.get_block(collation.header.period_start_prevhash))
+            if added[shard_id]:
+                self.reorganize_head_collation(block, collation)
+        return added
+
+    def get_shard_head_hash(self, shard_id):
+        """The hash of the head collation of the shard, from the worker of the
+        shard with a shard importer
+        """
+        if self.shard_importer is not None and shard_id in self.shard_importer.shard_ids:
+            head_hash = self.shard_importer.get_head_hash(shard_id)
+            if head_hash is not None:
+                return head_hash
+        return self.shards[shard_id].head_hash
+
     def get_expected_period_number(self):
         """Get default expected period number to be the period number of the next block
         """
@@ -319,7 +412,8 @@ class MainChain(Chain):
             shard = self.shards[shard_id]
 
         # Update collation_blockhash_lists
-        if self.has_shard(shard_id) and collhash and shard.db.get(collhash):
+        if self.has_shard(shard_id) and collhash and \
+                shard.validity_cache.is_valid(collhash) is not False and shard.db.get(collhash):
             shard.collation_blockhash_lists[collhash].append(blockhash)
             # Compare score
             given_coll_score = shard.get_score(collation)
@@ -363,6 +457,60 @@ class MainChain(Chain):
                 self.shards[collation.shard_id].add_collation(_collation, _period_start_prevblock)
                 del self.shards[collation.shard_id].parent_queue[collation.header.hash]
 
+    def index_add_header_log(self, block, log_index, header_rlp):
+        """Update the candidate heads and the collations-with-score cache with
+        the `log_index`th add_header log of `block`
+        """
+        self.candidate_heads.add_header_log(block, log_index, header_rlp)
+        self.collations_with_score_cache.add_header_log(header_rlp)
+
+    def add_block_header_logs(self, block, receipts):
+        """Add the add_header logs found in the receipts of a block which isn't
+        added to the head to the candidate heads
+        """
+        add_header_topic = big_endian_to_int(ADD_HEADER_TOPIC)
+        log_index = 0
+        for receipt in receipts:
+            for item in receipt.logs:
+                if add_header_topic not in item.topics or item.address != get_valmgr_addr():
+                    continue
+                self.candidate_heads.add_header_log(block, log_index, item.data)
+                log_index += 1
+
+    def get_collations_by_score(self, shard_id, low, high):
+        """Get {score: [collation hashes]} of the shard for the scores within
+        [low, high] as of the head, through the collations-with-score cache
+        """
+        return get_collations_by_score(self.state, shard_id, low, high, self.collations_with_score_cache)
+
+    def get_collations_with_scores_in_range(self, shard_id, low, high):
+        """Get the collations of the shard with the score within [low, high]
+        as of the head, through the collations-with-score cache
+        """
+        return get_collations_with_scores_in_range(
+            self.state, shard_id, low, high, self.collations_with_score_cache)
+
+    def update_proposer_schedule(self):
+        """Compute the proposer schedules of the lookahead window of the head,
+        once the validator manager is deployed
+        """
+        if self.state.get_code(get_valmgr_addr()):
+            self.proposer_schedule.update(self.state)
+
+    def is_canonical_block(self, blockhash, block_number):
+        return self.get_blockhash_by_number(block_number) == blockhash
+
+    def fetch_candidate_heads(self, shard_id):
+        """Yield (score, collation_hash) of the collation headers added to the
+        shard on the current main chain, from the highest score, and the
+        oldest first for equal scores, skipping the known invalid collations
+        """
+        shard = self.shards.get(shard_id)
+        for score, collation_hash in self.candidate_heads.iter_candidates(shard_id, self.is_canonical_block):
+            if shard is not None and shard.validity_cache.is_valid(collation_hash, self.head_hash) is False:
+                continue
+            yield score, collation_hash
+
     def append_log_listener(self):
         """ Append log_listeners
         """
@@ -378,8 +526,9 @@ class MainChain(Chain):
         """
         collation_map = {}
         missing_collations_map = {}
-        for item in self.add_header_logs:
+        for log_index, item in enumerate(self.add_header_logs):
             log.info('Got log item form self.add_header_logs!')
+            self.index_add_header_log(block, log_index, item)
             # [num, num, bytes32, bytes32, bytes32, address, bytes32, bytes32, bytes]
             # use sedes to prevent integer 0 from being decoded as b''
             sedes = List([utils.big_endian_int, utils.big_endian_int, hash32, hash32, hash32, utils.address, hash32, hash32, utils.big_endian_int, binary])
@@ -388,6 +537,10 @@ class MainChain(Chain):
             log.info("add_header: shard_id={}, expected_period_number={}, header_hash={}, parent_header_hash={}".format(values[0], values[1], encode_hex(utils.sha3(item)), encode_hex(values[3])))
             if shard_id in self.shard_id_list and self.shards[shard_id].active:
                 collation_hash = sha3(item)
+                if self.shards[shard_id].validity_cache.is_valid(collation_hash) is False:
+                    # Neither a head candidate nor worth requesting
+                    log.info('Ignoring the header of the invalid collation {}'.format(encode_hex(collation_hash)))
+                    continue
                 collation = self.shards[shard_id].get_collation(collation_hash)
                 if collation is None:
                     # Getting add_header before getting collation
@@ -402,5 +555,6 @@ class MainChain(Chain):
 
         # Clear add_header_logs cache
         self.add_header_logs = []
+        self.collations_with_score_cache.advance(block)
 
         return collation_map, missing_collations_map
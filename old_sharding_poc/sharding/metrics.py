@@ -0,0 +1,100 @@
+import contextlib
+import threading
+from timeit import default_timer
+
+# Upper bounds of the latency buckets, in seconds
+DEFAULT_BUCKETS = (1e-5, 1e-4, 1e-3, 1e-2, 1e-1, 1.0, 10.0)
+
+
+class Counter(object):
+
+    def __init__(self):
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, n=1):
+        with self.lock:
+            self.value += n
+
+
+class Histogram(object):
+    """Counts the observed values in non-cumulative buckets: `counts[i]` is
+    the number of values <= `buckets[i]` and > `buckets[i - 1]`, and the last
+    count is the number of values above all the buckets
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        i = 0
+        while i < len(self.buckets) and value > self.buckets[i]:
+            i += 1
+        with self.lock:
+            self.counts[i] += 1
+            self.count += 1
+            self.sum += value
+
+    @property
+    def mean(self):
+        return self.sum / self.count if self.count else 0.0
+
+    def to_dict(self):
+        return {
+            'buckets': list(self.buckets),
+            'counts': list(self.counts),
+            'count': self.count,
+            'sum': self.sum,
+        }
+
+
+class Metrics(object):
+    """A thread-safe registry of named counters and latency histograms
+    """
+
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+        self.lock = threading.Lock()
+
+    def counter(self, name):
+        with self.lock:
+            if name not in self.counters:
+                self.counters[name] = Counter()
+            return self.counters[name]
+
+    def histogram(self, name, buckets=DEFAULT_BUCKETS):
+        with self.lock:
+            if name not in self.histograms:
+                self.histograms[name] = Histogram(buckets)
+            return self.histograms[name]
+
+    @contextlib.contextmanager
+    def timer(self, name):
+        """Observe the time spent in the context in the histogram `name`,
+        also when it raises
+        """
+        start = default_timer()
+        try:
+            yield
+        finally:
+            self.histogram(name).observe(default_timer() - start)
+
+    def to_dict(self):
+        return {
+            'counters': dict((k, c.value) for k, c in self.counters.items()),
+            'histograms': dict((k, h.to_dict()) for k, h in self.histograms.items()),
+        }
+
+    def reset(self):
+        with self.lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+
+# The metrics of the whole process
+metrics = Metrics()
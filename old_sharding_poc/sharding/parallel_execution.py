@@ -0,0 +1,200 @@
+from ethereum import messages, utils
+from ethereum.messages import (
+    apply_transaction,
+    mk_receipt,
+)
+from ethereum.slogging import get_logger
+
+from sharding.receipt_consuming_tx_utils import (
+    apply_shard_transaction,
+    is_receipt_consuming_tx,
+)
+from sharding.sender_cache import sender_cache
+from sharding.state_view import StateView
+
+log = get_logger('sharding.parallel_execution')
+
+
+class RecordingStateView(StateView):
+    """A StateView which records the keys read from the parent state
+
+    The balance deltas of the block coinbase (the tx fees) are accumulated in
+    `coinbase_delta` without reading the coinbase balance, so that the txs of
+    a collation don't all conflict on it. Deleting an account or resetting a
+    storage marks the view as not replayable.
+    """
+
+    def __init__(self, parent):
+        super(RecordingStateView, self).__init__(parent)
+        self.reads = set()
+        self.base_gas_used = parent.gas_used
+        self.coinbase_delta = 0
+        self.coinbase_touched = False
+        self.replayable = True
+
+    def _read(self, key, parent_getter, *args):
+        if key not in self.writes:
+            self.reads.add(key)
+        return super(RecordingStateView, self)._read(key, parent_getter, *args)
+
+    def account_exists(self, address):
+        if not self.is_SPURIOUS_DRAGON():
+            address = utils.normalize_address(address)
+            self.reads.update((address, k) for k in ('balance', 'nonce', 'code'))
+        return super(RecordingStateView, self).account_exists(address)
+
+    def _is_coinbase_delta(self, address):
+        return address == self.block_coinbase and (address, 'balance') not in self.writes
+
+    def _set_coinbase_delta(self, delta, touched):
+        predelta, pretouched = self.coinbase_delta, self.coinbase_touched
+
+        def revert():
+            self.coinbase_delta, self.coinbase_touched = predelta, pretouched
+        self.journal.append(revert)
+        self.coinbase_delta, self.coinbase_touched = delta, touched
+
+    def get_balance(self, address):
+        address = utils.normalize_address(address)
+        balance = super(RecordingStateView, self).get_balance(address)
+        if self._is_coinbase_delta(address):
+            balance += self.coinbase_delta
+        return balance
+
+    def set_balance(self, address, value):
+        address = utils.normalize_address(address)
+        if self._is_coinbase_delta(address):
+            # `value` already includes the accumulated delta
+            self._set_coinbase_delta(0, False)
+        super(RecordingStateView, self).set_balance(address, value)
+
+    def delta_balance(self, address, value):
+        address = utils.normalize_address(address)
+        if self._is_coinbase_delta(address):
+            self._set_coinbase_delta(self.coinbase_delta + value, True)
+        else:
+            super(RecordingStateView, self).delta_balance(address, value)
+
+    def reset_storage(self, address):
+        self.replayable = False
+        super(RecordingStateView, self).reset_storage(address)
+
+    def del_account(self, address):
+        self.replayable = False
+        super(RecordingStateView, self).del_account(address)
+
+    def get_written_keys(self):
+        keys = set(k for k in self.writes)
+        if self.coinbase_touched:
+            keys.add((self.block_coinbase, 'balance'))
+        return keys
+
+
+class SpeculativeResult(object):
+
+    def __init__(self, view, success=None, output=None, exception=None):
+        self.view = view
+        self.success = success
+        self.output = output
+        self.exception = exception
+
+
+def execute_speculatively(state, tx):
+    """Apply the tx on a RecordingStateView of `state`
+    """
+    view = RecordingStateView(state)
+    try:
+        success, output = apply_transaction(view, tx)
+    except Exception as e:
+        return SpeculativeResult(view, exception=e)
+    return SpeculativeResult(view, success, output)
+
+
+def replay(state, result):
+    """Apply the writes of a speculative execution to `state`, and finish the
+    tx in the same way as `apply_transaction`: commit, then add the receipt
+    with the intermediate state root
+    """
+    view = result.view
+    for key, value in view.writes.items():
+        address, field = key[0], key[1]
+        if field == 'balance':
+            state.set_balance(address, value)
+        elif field == 'nonce':
+            state.set_nonce(address, value)
+        elif field == 'code':
+            state.set_code(address, value)
+        elif field == 'storage':
+            state.set_storage_data(address, key[2], value)
+    if view.coinbase_touched:
+        state.delta_balance(view.block_coinbase, view.coinbase_delta)
+    state.gas_used += view.gas_used - view.base_gas_used
+    if not state.is_METROPOLIS() and not messages.SKIP_MEDSTATES:
+        state.commit()
+
+    logs = view.receipts[-1].logs
+    for item in logs:
+        for listener in state.log_listeners:
+            listener(item)
+    r = mk_receipt(state, result.success, logs)
+    state.add_receipt(r)
+    state.set_param('bloom', state.bloom | r.bloom)
+    state.set_param('txindex', state.txindex + 1)
+
+
+def apply_transactions_optimistically(mainchain_state, shard_state, shard_id, txs, pool=None):
+    """Apply the txs to `shard_state` in order, with the same results as calling
+    `apply_shard_transaction` for each of them
+
+    All the txs are first executed speculatively against `shard_state`, in
+    `pool.map` if a pool is given (a `multiprocessing.pool.ThreadPool`, the
+    views can't be sent to other processes). Then, in order, the result of a tx is
+    replayed if it didn't read anything written by the previous txs of the
+    collation; otherwise the tx is executed again on the current state.
+    The exception of the first failing tx is raised, like the sequential path.
+
+    Returns the list of (success, output), and the number of re-executed txs.
+    """
+    def is_rctx(tx):
+        return mainchain_state is not None and shard_id is not None and is_receipt_consuming_tx(tx)
+
+    def speculate(tx):
+        return None if is_rctx(tx) else execute_speculatively(shard_state, tx)
+
+    # Recover the senders once, before the speculative executions
+    for tx in txs:
+        if not is_rctx(tx):
+            sender_cache.get_sender(tx)
+    results = list(pool.map(speculate, txs) if pool is not None else map(speculate, txs))
+
+    outputs = []
+    written = set()
+    # After a tx which can't be replayed, the writes are unknown
+    all_dirty = False
+    reexecuted = 0
+    for tx, result in zip(txs, results):
+        if result is None:
+            # Receipt-consuming tx: apply it directly
+            outputs.append(apply_shard_transaction(mainchain_state, shard_state, shard_id, tx))
+            all_dirty = True
+            continue
+        if (
+            all_dirty or
+            result.exception is not None or
+            not result.view.replayable or
+            shard_state.gas_used + tx.startgas > shard_state.gas_limit or
+            result.view.reads & written
+        ):
+            reexecuted += 1
+            result = execute_speculatively(shard_state, tx)
+            if result.exception is not None:
+                raise result.exception
+            if not result.view.replayable:
+                outputs.append(apply_shard_transaction(mainchain_state, shard_state, shard_id, tx))
+                all_dirty = True
+                continue
+        replay(shard_state, result)
+        written |= result.view.get_written_keys()
+        outputs.append((result.success, result.output))
+    log.debug('Applied {} txs optimistically, {} re-executed'.format(len(txs), reexecuted))
+    return outputs, reexecuted
@@ -0,0 +1,107 @@
+from ethereum import utils
+from ethereum.slogging import get_logger
+
+from sharding.config import sharding_config
+from sharding.validator_manager_utils import (
+    get_blockhash,
+    get_validation_code_addrs,
+)
+
+log = get_logger('sharding.proposer_schedule')
+
+
+class PeriodSchedule(object):
+    """The eligible proposers of every shard in one period, computed natively
+    in the same way as `get_eligible_proposer` of the validator manager contract
+    """
+
+    def __init__(self, period, seed, validation_code_addrs, shard_count):
+        self.period = period
+        self.seed = seed
+        self.validation_code_addrs = tuple(validation_code_addrs)
+        max_index = len(self.validation_code_addrs)
+        # proposers[shard_id] -> validation_code_addr
+        self.proposers = []
+        # validation_code_addr -> list of shard ids
+        self.shard_ids = {}
+        for shard_id in range(shard_count):
+            if max_index == 0:
+                addr = b'\x00' * 20
+            else:
+                index = utils.big_endian_to_int(
+                    utils.sha3(seed + utils.encode_int32(shard_id))
+                ) % max_index
+                addr = self.validation_code_addrs[index]
+            self.proposers.append(addr)
+            self.shard_ids.setdefault(addr, []).append(shard_id)
+
+
+class ProposerSchedule(object):
+    """The (shard_id, period) -> validation_code_addr table of the lookahead
+    window, cached per period
+
+    A period's schedule is recomputed when its seed blockhash or the validator
+    set changes, and dropped by `invalidate` when the seed block leaves the
+    canonical chain.
+    """
+
+    def __init__(self, config=sharding_config):
+        self.shard_count = config['SHARD_COUNT']
+        self.period_length = config['PERIOD_LENGTH']
+        self.lookahead_periods = config['LOOKAHEAD_PERIODS']
+        self.schedules = {}     # period -> PeriodSchedule
+
+    def get_seed_block_number(self, period):
+        return (period - self.lookahead_periods) * self.period_length
+
+    def get_window(self, state):
+        """Get the periods which `get_eligible_proposer` accepts on `state`
+        """
+        current_period = state.block_number // self.period_length
+        first = max(current_period, self.lookahead_periods)
+        last = (state.block_number - 1) // self.period_length + self.lookahead_periods
+        return range(first, last + 1)
+
+    def update(self, state):
+        """Compute the schedules of the lookahead window of `state`, and
+        drop the ones of the past periods
+        """
+        validation_code_addrs = tuple(get_validation_code_addrs(state))
+        window = self.get_window(state)
+        for period in list(self.schedules):
+            if not window or period < window[0]:
+                del self.schedules[period]
+        for period in window:
+            seed = get_blockhash(state, self.get_seed_block_number(period))
+            schedule = self.schedules.get(period)
+            if schedule is None or schedule.seed != seed or \
+                    schedule.validation_code_addrs != validation_code_addrs:
+                self.schedules[period] = PeriodSchedule(
+                    period, seed, validation_code_addrs, self.shard_count,
+                )
+        return window
+
+    def invalidate(self, block_number):
+        """Drop the schedules whose seed block is at or above `block_number`,
+        e.g. when that block is replaced in a reorg
+        """
+        for period in list(self.schedules):
+            if self.get_seed_block_number(period) >= block_number:
+                log.debug('Invalidate the proposer schedule of period {}'.format(period))
+                del self.schedules[period]
+
+    def get_proposer(self, shard_id, period):
+        """Get the eligible proposer of the shard in the period, or None if the
+        schedule of the period hasn't been computed
+        """
+        schedule = self.schedules.get(period)
+        return schedule.proposers[shard_id] if schedule else None
+
+    def get_proposer_shards(self, valcode_addr, period):
+        """Get the ids of the shards which `valcode_addr` is the eligible
+        proposer of in the period
+        """
+        schedule = self.schedules.get(period)
+        if schedule is None:
+            return []
+        return schedule.shard_ids.get(utils.normalize_address(valcode_addr), [])
@@ -18,7 +18,13 @@ from ethereum.exceptions import (
     InsufficientStartGas,
 )
 
+from sharding.access_list import (
+    AccessList,
+    AccessListState,
+    AccessListViolation,
+)
 from sharding.contract_utils import call_contract_inconstantly
+from sharding.sender_cache import sender_cache
 from sharding.used_receipt_store_utils import (
     call_urs,
     get_urs_ct,
@@ -83,6 +89,36 @@ def validate_receipt_consuming_tx(mainchain_state, shard_state, shard_id, tx):
     return True
 
 
+def mk_receipt_consuming_tx(mainchain_state, receipt_id, to, value, startgas):
+    """Make the receipt-consuming tx of the receipt `receipt_id` from the
+    fields of its tx_to_shard log. The gasprice can be updated after the log,
+    so it's read from validator manager contract.
+    """
+    gasprice = call_valmgr(mainchain_state, 'get_receipts__tx_gasprice', [receipt_id])
+    tx = Transaction(0, gasprice, startgas, to, value, b'')
+    tx.v, tx.r, tx.s = 1, receipt_id, 0
+    return tx
+
+
+def mk_receipt_consuming_txs(mainchain_state, shard_state, shard_id, receipts):
+    """Make the receipt-consuming txs of the given receipts, skipping the
+    receipts which have been used in the shard or can't pay for their gas yet
+
+    receipts: (receipt_id, to, value, startgas) of the receipts, e.g. from
+        `ReceiptIndex.get_receipts`
+    """
+    o = []
+    for receipt_id, to, value, startgas in receipts:
+        if call_urs(shard_state, shard_id, 'get_used_receipts', [receipt_id]):
+            continue
+        tx = mk_receipt_consuming_tx(mainchain_state, receipt_id, to, value, startgas)
+        if tx.value <= tx.gasprice * tx.startgas:
+            log_rctx.debug('Skip receipt {}: value {} <= gasprice * startgas'.format(receipt_id, tx.value))
+            continue
+        o.append(tx)
+    return o
+
+
 def send_msg_add_used_receipt(state, shard_id, receipt_id):
     ct = get_urs_ct(shard_id)
     urs_addr = get_urs_contract(shard_id)['addr']
@@ -178,16 +214,40 @@ def send_msg_transfer_value(mainchain_state, shard_state, shard_id, tx):
     return success, output
 
 
-def apply_shard_transaction(mainchain_state, shard_state, shard_id, tx):
+def apply_shard_transaction(mainchain_state, shard_state, shard_id, tx, access_list=None):
     """Apply shard transactions, including both receipt-consuming and normal
     transactions.
+
+    access_list: if given, the tx raises AccessListViolation on any access
+        outside of it, and the state is reverted to before the tx
     """
-    if (mainchain_state is not None and
-            shard_id is not None and
-            is_receipt_consuming_tx(tx)):
+    rctx = (
+        mainchain_state is not None and
+        shard_id is not None and
+        is_receipt_consuming_tx(tx)
+    )
+    if access_list is not None:
+        if rctx:
+            implicit_addrs = [shard_state.block_coinbase, get_urs_contract(shard_id)['addr']]
+        else:
+            implicit_addrs = [shard_state.block_coinbase, sender_cache.get_sender(tx)]
+        snapshot = shard_state.snapshot()
+        try:
+            return apply_shard_transaction(
+                mainchain_state,
+                AccessListState(shard_state, AccessList(access_list, implicit_addrs)),
+                shard_id, tx,
+            )
+        except AccessListViolation:
+            shard_state.revert(snapshot)
+            raise
+    if rctx:
         success, output = send_msg_transfer_value(
             mainchain_state, shard_state, shard_id, tx
         )
     else:
+        # Recover the sender from the cache, so that replaying the tx doesn't
+        # run ecrecover again
+        sender_cache.get_sender(tx)
         success, output = apply_transaction(shard_state, tx)
     return success, output
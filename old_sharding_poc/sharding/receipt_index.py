@@ -0,0 +1,97 @@
+from collections import defaultdict
+
+from ethereum import utils
+from ethereum.slogging import get_logger
+
+from sharding.validator_manager_utils import (
+    TX_TO_SHARD_TOPIC,
+    get_valmgr_addr,
+)
+
+log = get_logger('sharding.receipt_index')
+
+
+class ReceiptIndex(object):
+    """Main-chain-side index of the `tx_to_shard` receipts, keyed by the
+    destination shard_id
+
+    The receipts emitted by every imported block are recorded once, and the
+    blocks are connected to / disconnected from the index as they join or
+    leave the canonical chain, so that a reorg only touches the replaced blocks.
+    Every receipt keeps the fields of its log, so that the receipt-consuming
+    txs can be made without reading them from the validator manager contract.
+    """
+
+    def __init__(self):
+        self.block_receipts = {}    # blockhash -> list[(shard_id, receipt_id, to, value, startgas)]
+        self.shard_receipts = defaultdict(dict)   # shard_id -> {receipt_id: (blockhash, to, value, startgas)}
+        self.canonical_blocks = set()
+
+    def add_block_receipts(self, blockhash, receipts):
+        """Record the `tx_to_shard` logs found in the receipts of the given block
+        """
+        tx_to_shard_topic = utils.big_endian_to_int(TX_TO_SHARD_TOPIC)
+        entries = []
+        for receipt in receipts:
+            for item in receipt.logs:
+                if not item.topics or item.topics[0] != tx_to_shard_topic:
+                    continue
+                if item.address != get_valmgr_addr():
+                    continue
+                # topics: [sha3("tx_to_shard()"), to, shard_id]
+                # data: receipt_id, value, startgas
+                shard_id = item.topics[2]
+                to = utils.zpad(utils.int_to_big_endian(item.topics[1]), 20)
+                receipt_id, value, startgas = [
+                    utils.big_endian_to_int(item.data[i:i + 32]) for i in range(0, 96, 32)
+                ]
+                entries.append((shard_id, receipt_id, to, value, startgas))
+        self.block_receipts[blockhash] = entries
+        return entries
+
+    def connect_block(self, blockhash):
+        """Add the receipts of the block which is now in the canonical chain
+        """
+        if blockhash in self.canonical_blocks:
+            return False
+        if blockhash not in self.block_receipts:
+            log.debug('No receipts recorded for block %s' % utils.encode_hex(blockhash))
+            return False
+        for shard_id, receipt_id, to, value, startgas in self.block_receipts[blockhash]:
+            self.shard_receipts[shard_id][receipt_id] = (blockhash, to, value, startgas)
+        self.canonical_blocks.add(blockhash)
+        return True
+
+    def disconnect_block(self, blockhash):
+        """Remove the receipts of the block which is no longer in the canonical chain
+        """
+        if blockhash not in self.canonical_blocks:
+            return False
+        for shard_id, receipt_id, _, _, _ in self.block_receipts[blockhash]:
+            if self.shard_receipts[shard_id].get(receipt_id, (None,))[0] == blockhash:
+                del self.shard_receipts[shard_id][receipt_id]
+        self.canonical_blocks.remove(blockhash)
+        return True
+
+    def prune_block(self, blockhash):
+        """Forget the block once it's too old to leave the canonical chain.
+        The receipts of a canonical block stay in the index.
+        """
+        self.block_receipts.pop(blockhash, None)
+        self.canonical_blocks.discard(blockhash)
+
+    def get_receipt_ids(self, shard_id):
+        """Get the ids of the receipts to the given shard on the canonical chain,
+        in ascending order
+        """
+        return sorted(self.shard_receipts[shard_id])
+
+    def get_receipts(self, shard_id):
+        """Get (receipt_id, to, value, startgas) of the receipts to the given
+        shard on the canonical chain, in ascending order of receipt_id
+        """
+        receipts = self.shard_receipts[shard_id]
+        return [(receipt_id,) + receipts[receipt_id][1:] for receipt_id in sorted(receipts)]
+
+    def has_receipt(self, shard_id, receipt_id):
+        return receipt_id in self.shard_receipts[shard_id]
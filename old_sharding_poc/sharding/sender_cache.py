@@ -0,0 +1,90 @@
+import threading
+from collections import OrderedDict
+
+DEFAULT_MAX_SIZE = 65536
+
+
+def _recover_sender(tx):
+    return tx.sender
+
+
+class SenderCache(object):
+    """A bounded LRU cache of the recovered transaction senders
+
+    The key is `tx.hash`, which covers the signature (v, r, s) as well as the
+    signed fields, so two txs with the same key always have the same sender.
+    Only the senders it recovered itself, and the ones added with `put`,
+    e.g. by `sign_tx`, are cached: a `tx._sender` set by the caller isn't.
+    The cache is thread-safe; the senders are recovered outside of its lock.
+    """
+
+    def __init__(self, max_size=DEFAULT_MAX_SIZE):
+        self.max_size = max_size
+        self.senders = OrderedDict()    # tx.hash -> sender
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.senders)
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / float(total) if total else 0.0
+
+    def get_sender(self, tx, recover=_recover_sender):
+        """Get the sender of `tx`, recovering it with `recover(tx)` only on a
+        cache miss, and set it as `tx._sender` so that `tx.sender` doesn't
+        recover it again
+        """
+        key = tx.hash
+        with self.lock:
+            sender = self.senders.pop(key, None)
+            if sender is not None:
+                self.hits += 1
+                self._put(key, sender)
+        if sender is None:
+            if tx._sender:
+                # Like tx.sender, but not trusted for the other copies of the tx
+                return tx._sender
+            sender = recover(tx)
+            with self.lock:
+                self.misses += 1
+                self._put(key, sender)
+        tx._sender = sender
+        return sender
+
+    def _put(self, key, sender):
+        self.senders.pop(key, None)
+        self.senders[key] = sender
+        if len(self.senders) > self.max_size:
+            self.senders.popitem(last=False)
+
+    def put(self, tx, sender):
+        """Add the sender of `tx` which was recovered elsewhere
+        """
+        with self.lock:
+            self._put(tx.hash, sender)
+
+    def __contains__(self, tx):
+        return tx.hash in self.senders
+
+    def clear(self):
+        with self.lock:
+            self.senders.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+# The cache shared by the whole process
+sender_cache = SenderCache()
+
+
+def sign_tx(tx, key):
+    """Sign `tx` with `key` and add its sender to `sender_cache`, so that
+    the copies of the tx, e.g. in a collation received back, aren't recovered
+    """
+    tx.sign(key)
+    sender_cache.put(tx, tx._sender)
+    return tx
@@ -0,0 +1,115 @@
+from array import array
+from collections import OrderedDict
+
+from ethereum import utils
+
+from sharding.config import sharding_config
+from sharding.validator_manager_utils import (
+    get_blockhash,
+    get_validation_code_addrs,
+)
+
+# as_bytes32(i) of the shard ids and the indexes in subset
+_bytes32_cache = [utils.encode_int32(i) for i in range(256)]
+
+# (cycle_seed, validation_code_addrs) -> ShardAssignment
+_assignments = OrderedDict()
+MAX_CACHED_ASSIGNMENTS = 16
+
+
+def _bytes32(i):
+    return _bytes32_cache[i] if i < len(_bytes32_cache) else utils.encode_int32(i)
+
+
+def get_cycle_seed(state, shuffling_cycle_length=None):
+    """Get the `cycle_seed` which `get_shard_list` and `sample` of the
+    validator manager contract use for the current shuffling cycle
+    """
+    if shuffling_cycle_length is None:
+        shuffling_cycle_length = sharding_config['SHUFFLING_CYCLE_LENGTH']
+    cycle = state.block_number // shuffling_cycle_length
+    cycle_start_block_number = max(cycle * shuffling_cycle_length - 1, 0)
+    return get_blockhash(state, cycle_start_block_number)
+
+
+class ShardAssignment(object):
+    """The assignment of the validators to the shards for one shuffling cycle,
+    computed natively in the same way as `get_shard_list` of the validator
+    manager contract
+
+    validation_code_addrs: the validation_code_addr of the validators indexed
+        by the validator index, with zero addresses for the empty slots
+    """
+
+    def __init__(self, cycle_seed, validation_code_addrs, shard_count=None, num_validators_per_cycle=None):
+        self.cycle_seed = cycle_seed
+        self.validation_code_addrs = tuple(validation_code_addrs)
+        self.shard_count = sharding_config['SHARD_COUNT'] if shard_count is None else shard_count
+        self.num_validators_per_cycle = (
+            sharding_config['NUM_VALIDATORS_PER_CYCLE']
+            if num_validators_per_cycle is None else num_validators_per_cycle
+        )
+        # indices[shard_id * num_validators_per_cycle + index_in_subset] -> validator index
+        self.indices = self._compute_indices()
+        # validation_code_addr -> sorted list of shard ids
+        self.shard_ids = self._compute_shard_ids()
+
+    def _compute_indices(self):
+        max_index = len(self.validation_code_addrs)
+        indices = array('l')
+        if max_index == 0:
+            return indices
+        subset = [_bytes32(i) for i in range(self.num_validators_per_cycle)]
+        for shard_id in range(self.shard_count):
+            prefix = self.cycle_seed + _bytes32(shard_id)
+            indices.extend(
+                utils.big_endian_to_int(utils.sha3(prefix + index_in_subset)) % max_index
+                for index_in_subset in subset
+            )
+        return indices
+
+    def _compute_shard_ids(self):
+        shard_ids = {}
+        zero_addr = b'\x00' * 20
+        n = self.num_validators_per_cycle
+        for shard_id in range(self.shard_count):
+            for validator_index in set(self.indices[shard_id * n:(shard_id + 1) * n]):
+                addr = self.validation_code_addrs[validator_index]
+                if addr != zero_addr:
+                    shard_ids.setdefault(addr, []).append(shard_id)
+        return shard_ids
+
+    def get_shard_ids(self, valcode_addr):
+        """Get the ids of the shards which `valcode_addr` may be sampled in
+        """
+        return self.shard_ids.get(utils.normalize_address(valcode_addr), [])
+
+    def get_shard_list(self, valcode_addr):
+        """Same as the `bool[100]` result of `get_shard_list` of the contract
+        """
+        shard_list = [False] * self.shard_count
+        for shard_id in self.get_shard_ids(valcode_addr):
+            shard_list[shard_id] = True
+        return shard_list
+
+
+def get_shard_assignment(state):
+    """Get the ShardAssignment of the current shuffling cycle of `state`,
+    which is cached by the cycle_seed and the validator set
+    """
+    cycle_seed = get_cycle_seed(state)
+    validation_code_addrs = tuple(get_validation_code_addrs(state))
+    key = (cycle_seed, validation_code_addrs)
+    if key in _assignments:
+        _assignments[key] = _assignments.pop(key)
+    else:
+        _assignments[key] = ShardAssignment(cycle_seed, validation_code_addrs)
+        while len(_assignments) > MAX_CACHED_ASSIGNMENTS:
+            _assignments.popitem(last=False)
+    return _assignments[key]
+
+
+def get_shard_list(state, valcode_addr):
+    """Native replacement of `validator_manager_utils.get_shard_list`
+    """
+    return get_shard_assignment(state).get_shard_list(valcode_addr)
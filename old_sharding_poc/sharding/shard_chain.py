@@ -22,12 +22,18 @@ from sharding.collation import (
     CollationHeader,
     Collation,
 )
-from sharding.collator import apply_collation
+from sharding.collation_validation import (
+    CONTEXT_FREE_STAGES,
+    CollationValidationError,
+    validate_collation,
+)
+from sharding.speculative_validation import SpeculativeValidationCache
 from sharding.state_transition import (
     update_collation_env_variables,
     set_collation_gas_limit,
 )
 from sharding.validator_manager_utils import call_valmgr
+from sharding.validity_cache import ValidityCache
 
 log = get_logger('sharding.shard_chain')
 log.setLevel(logging.DEBUG)
@@ -51,9 +57,16 @@ def initialize_genesis_keys(state, genesis, shard_id):
 class ShardChain(object):
     def __init__(self, shard_id, env=None,
                  new_head_cb=None, reset_genesis=False, localtime=None, max_history=1000,
-                 initial_state=None, main_chain=None, **kwargs):
+                 initial_state=None, main_chain=None, check_header_signature=False,
+                 speculative_validation=False, validity_cache=None, **kwargs):
         self.env = env or Env()
         self.shard_id = shard_id
+        # Reject the collations which aren't signed by the eligible proposer
+        self.check_header_signature = check_header_signature
+        # Validate the collations in the background when their bodies arrive
+        self.speculative_validation = SpeculativeValidationCache(self) if speculative_validation else None
+        # The verified collations, shared with the fork choice and the collator
+        self.validity_cache = ValidityCache() if validity_cache is None else validity_cache
         self.active = False
         self.is_syncing = True
 
@@ -128,6 +141,14 @@ class ShardChain(object):
             log.info(str(e))
             return None
 
+    def receive_collation(self, collation):
+        """Call upon receiving a collation body from the shard network, before
+        its header is included in the main chain
+        """
+        if self.speculative_validation is None:
+            return False
+        return self.speculative_validation.submit(collation)
+
     def add_collation(self, collation, period_start_prevblock):
         """Add collation to db and update score
         """
@@ -137,21 +158,39 @@ class ShardChain(object):
                 (encode_hex(collation.header.hash), encode_hex(collation.header.parent_collation_hash)))
             if self.is_first_collation(collation):
                 log.debug('It is the first collation of shard {}'.format(self.shard_id))
-            temp_state = self.mk_poststate_of_collation_hash(collation.header.parent_collation_hash)
-            try:
-                apply_collation(
-                    temp_state,
-                    collation,
-                    period_start_prevblock,
-                    self.main_chain.state,
-                    self.shard_id
-                )
-            except (AssertionError, KeyError, ValueError, InvalidTransaction, VerificationFailed) as e:
-                log.info('Collation %s with parent %s invalid, reason: %s' %
-                         (encode_hex(collation.header.hash), encode_hex(collation.header.parent_collation_hash), str(e)))
+            # The execution reads the main chain head state
+            context = self.main_chain.head_hash
+            validity = self.validity_cache.get(collation.header.hash, context)
+            if validity is not None and not validity[0]:
+                log.info('Collation %s is known to be invalid, reason: %s' %
+                         (encode_hex(collation.header.hash), validity[1]))
                 return False
-            deletes = temp_state.deletes
-            changed = temp_state.changed
+            if validity is not None and collation.header.hash in self.db:
+                # Already verified on this main chain head and added, e.g.
+                # before a restart
+                deletes = changed = None
+            else:
+                try:
+                    temp_state = validate_collation(
+                        self,
+                        collation,
+                        period_start_prevblock,
+                        self.check_header_signature,
+                        self.speculative_validation,
+                    )
+                except (AssertionError, KeyError, ValueError, InvalidTransaction, VerificationFailed) as e:
+                    log.info('Collation %s with parent %s invalid, reason: %s' %
+                             (encode_hex(collation.header.hash), encode_hex(collation.header.parent_collation_hash), str(e)))
+                    # Missing data may still arrive
+                    if period_start_prevblock is not None and not isinstance(e, KeyError):
+                        if isinstance(e, CollationValidationError) and e.stage in CONTEXT_FREE_STAGES:
+                            self.validity_cache.set_invalid(collation.header.hash, str(e))
+                        else:
+                            self.validity_cache.set_invalid(collation.header.hash, str(e), context)
+                    return False
+                self.validity_cache.set_valid(collation.header.hash, context)
+                deletes = temp_state.deletes
+                changed = temp_state.changed
             collation_score = self.get_score(collation)
             log.info('collation_score of {} is {}'.format(encode_hex(collation.header.hash), collation_score))
         # Collation has no parent yet
@@ -166,21 +205,22 @@ class ShardChain(object):
             self.parent_queue[collation.header.parent_collation_hash].append(collation)
             log.info('No parent found. Delaying for now')
             return False
-        self.db.put(collation.header.hash, rlp.encode(collation))
+        if changed is not None:
+            self.db.put(collation.header.hash, rlp.encode(collation))
 
-        self.db.put(b'changed:' + collation.hash, b''.join(list(changed.keys())))
-        # log.debug('Saved %d address change logs' % len(changed.keys()))
-        self.db.put(b'deletes:' + collation.hash, b''.join(deletes))
-        # log.debug('Saved %d trie node deletes for collation (%s)' % (len(deletes), encode_hex(collation.hash)))
+            self.db.put(b'changed:' + collation.hash, b''.join(list(changed.keys())))
+            # log.debug('Saved %d address change logs' % len(changed.keys()))
+            self.db.put(b'deletes:' + collation.hash, b''.join(deletes))
+            # log.debug('Saved %d trie node deletes for collation (%s)' % (len(deletes), encode_hex(collation.hash)))
 
-        # TODO: Delete old junk data
-        # deletes, changed
+            # TODO: Delete old junk data
+            # deletes, changed
 
-        self.db.commit()
-        log.info(
-            'Added collation (%s) with %d txs' %
-            (encode_hex(collation.header.hash)[:8],
-                len(collation.transactions)))
+            self.db.commit()
+            log.info(
+                'Added collation (%s) with %d txs' %
+                (encode_hex(collation.header.hash)[:8],
+                    len(collation.transactions)))
 
         # Call optional callback
         if self.new_head_cb and self.is_first_collation(collation):
@@ -200,18 +240,26 @@ class ShardChain(object):
 
         return True
 
-    def mk_poststate_of_collation_hash(self, collation_hash):
+    def get_genesis_snapshot(self):
+        """The snapshot of the genesis state, stored by `initialize_genesis_keys`
+        """
+        return json.loads(self.db.get(b'SHARD_' + to_string(self.shard_id) + b'_GENESIS_STATE'))
+
+    def mk_poststate_of_collation_hash(self, collation_hash, env=None):
         """Return the post-state of the collation
+
+        env: if given, the Env of the state, e.g. to buffer its writes
         """
+        env = env or self.env
         if collation_hash not in self.db:
             raise Exception("Collation hash %s not found" % encode_hex(collation_hash))
 
         collation_rlp = self.db.get(collation_hash)
         if collation_rlp == b'GENESIS':
-            return State.from_snapshot(json.loads(self.db.get(b'SHARD_' + to_string(self.shard_id) + b'_GENESIS_STATE')), self.env)
+            return State.from_snapshot(self.get_genesis_snapshot(), env)
         collation = rlp.decode(collation_rlp, Collation)
 
-        state = State(env=self.env)
+        state = State(env=env)
         state.trie.root_hash = collation.header.post_state_root
 
         update_collation_env_variables(state, collation)
@@ -0,0 +1,82 @@
+from multiprocessing import cpu_count
+
+from ethereum.slogging import get_logger
+from ethereum.utils import encode_hex
+
+from sharding.metrics import metrics
+from sharding.shard_worker import ShardProcessPool
+
+log = get_logger('sharding.shard_import')
+
+
+class MultiShardImporter(object):
+    """Imports the collations of several shards whose headers are included in
+    one main chain block, in parallel worker processes
+
+    The shards tracked by `main_chain` are spread over `processes` workers of
+    a ShardProcessPool, each of them owning the shard dbs of its shards,
+    which start from their genesis states, so the importer has to be started
+    before any collation of them is added. For every new head, the importer
+    publishes a snapshot of the main chain to the workers, and submits the
+    collations, and `ShardProcessPool.collect` merges the reports into
+    the shard heads in the order of the shard ids, so that the result
+    doesn't depend on the order in which the workers finish.
+    """
+
+    def __init__(self, main_chain, processes=None, snapshot_dir=None):
+        self.main_chain = main_chain
+        self.shard_ids = sorted(main_chain.shard_id_list)
+        self.pool = ShardProcessPool(main_chain, snapshot_dir=snapshot_dir)
+        processes = min(processes or cpu_count(), len(self.shard_ids))
+        for i in range(processes):
+            self.pool.start_worker(dict(
+                (shard_id, main_chain.shards[shard_id].get_genesis_snapshot())
+                for shard_id in self.shard_ids[i::processes]
+            ))
+        self.snapshot_head = None
+        if self.shard_ids:
+            # The first snapshot carries all the objects, the next ones only
+            # the changed ones. Wait for the workers to load it.
+            self.pool.publish_snapshot()
+            self.pool.collect()
+            self.snapshot_head = main_chain.head_hash
+
+    def import_collations(self, block, collations):
+        """Add the collations, at most one per shard, in the workers of their
+        shards, on top of `block`, the main chain head
+
+        Returns {shard_id: True if the collation was added}
+        """
+        assert block.header.hash == self.main_chain.head_hash, \
+            'block {} is not the head'.format(encode_hex(block.header.hash))
+        collation_map = {}
+        for collation in collations:
+            shard_id = collation.header.shard_id
+            assert shard_id not in collation_map, 'two collations of shard {}'.format(shard_id)
+            if shard_id in self.shard_ids:
+                collation_map[shard_id] = collation
+        if not collation_map:
+            return {}
+
+        with metrics.timer('shard_import.seconds'):
+            if self.snapshot_head != block.header.hash:
+                self.pool.publish_snapshot()
+                self.snapshot_head = block.header.hash
+            for shard_id in sorted(collation_map):
+                self.pool.submit(collation_map[shard_id])
+            self.pool.collect()
+        added = dict(
+            (shard_id, self.pool.added[collation.header.hash])
+            for shard_id, collation in collation_map.items()
+        )
+        metrics.counter('shard_import.collations').inc(sum(added.values()))
+        return added
+
+    def get_head_hash(self, shard_id):
+        """The hash of the head collation of the shard, or None if no
+        collation of it was added
+        """
+        return self.pool.get_head_hash(shard_id)
+
+    def close(self):
+        self.pool.close()
@@ -0,0 +1,427 @@
+import json
+import mmap
+import os
+import shutil
+import struct
+import tempfile
+import traceback
+from collections import deque
+from multiprocessing import (
+    Pipe,
+    Process,
+)
+
+import rlp
+from ethereum.block import (
+    Block,
+    BlockHeader,
+)
+from ethereum.config import Env
+from ethereum.db import (
+    EphemDB,
+    RefcountDB,
+)
+from ethereum.securetrie import SecureTrie
+from ethereum.slogging import get_logger
+from ethereum.state import (
+    BLANK_HASH,
+    State,
+)
+from ethereum.trie import (
+    BLANK_NODE,
+    BLANK_ROOT,
+    NODE_TYPE_BRANCH,
+    NODE_TYPE_EXTENSION,
+    Trie,
+)
+from ethereum.utils import (
+    decode_hex,
+    encode_hex,
+)
+
+from sharding.collation import Collation
+from sharding.proposer_schedule import ProposerSchedule
+from sharding.shard_chain import ShardChain
+from sharding.trie_db import REFCOUNT_ONE
+from sharding.validator_manager_utils import (
+    get_valmgr_addr,
+    get_validation_code_addrs,
+    is_valmgr_setup,
+    sighasher_addr,
+    viper_rlp_decoder_addr,
+)
+
+log = get_logger('sharding.shard_worker')
+
+# The number of the latest main chain block headers in a snapshot
+DEFAULT_NUM_HEADERS = 256
+
+
+def _new_trie_nodes(trie, root_hash, known):
+    """The trie nodes under `root_hash` which aren't in `known`, by hash,
+    skipping the subtrees of the known nodes. The new keys are added to
+    `known`.
+    """
+    nodes = {}
+    stack = [] if root_hash == BLANK_ROOT else [root_hash]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, list):
+            # Embedded in its parent
+            node = item
+        elif item == BLANK_NODE or item in known:
+            continue
+        else:
+            known.add(item)
+            nodes[item] = trie.db.get(item)
+            node = rlp.decode(nodes[item])
+        node_type = trie._get_node_type(node)
+        if node_type == NODE_TYPE_BRANCH:
+            stack.extend(node[:16])
+        elif node_type == NODE_TYPE_EXTENSION:
+            stack.append(node[1])
+    return nodes
+
+
+def mk_main_chain_snapshot(main_chain, num_headers=DEFAULT_NUM_HEADERS, known=None):
+    """The part of the main chain head which the shards read: the accounts
+    of the sharding contracts and of the validation codes, and the latest
+    `num_headers` block headers
+
+    The accounts are put in a trie of their own, and the snapshot carries
+    the db objects of that state, i.e. its trie nodes and codes, which
+    aren't in `known`. With the set of the objects already sent to the
+    workers, only the trie nodes that changed since then are in the
+    snapshot, not the whole storage of the validator manager.
+    """
+    known = set() if known is None else known
+    state = main_chain.state
+    addrs = [get_valmgr_addr(), viper_rlp_decoder_addr, sighasher_addr]
+    if is_valmgr_setup(state):
+        addrs.extend(addr for addr in get_validation_code_addrs(state) if addr != b'\x00' * 20)
+
+    nodes, codes = {}, {}
+    main_trie = Trie(RefcountDB(state.db))
+    accounts = SecureTrie(Trie(RefcountDB(EphemDB())))
+    for addr in sorted(set(addrs)):
+        account_rlp = state.trie.get(addr)
+        if not account_rlp:
+            continue
+        accounts.update(addr, account_rlp)
+        _, _, storage_root, code_hash = rlp.decode(account_rlp)
+        nodes.update(_new_trie_nodes(main_trie, storage_root, known))
+        if code_hash != BLANK_HASH and code_hash not in known:
+            known.add(code_hash)
+            codes[code_hash] = state.db.get(code_hash)
+    nodes.update(_new_trie_nodes(accounts.trie, accounts.trie.root_hash, known))
+    # The db values of the trie nodes carry the refcount of RefcountDB
+    objects = dict((key, REFCOUNT_ONE + node) for key, node in nodes.items())
+    objects.update(codes)
+
+    state_snapshot = state.to_snapshot(root_only=True)
+    state_snapshot['state_root'] = '0x' + encode_hex(accounts.trie.root_hash)
+    headers = []
+    block = main_chain.head
+    while block is not None and len(headers) < num_headers:
+        headers.append(encode_hex(rlp.encode(block.header)))
+        block = main_chain.get_parent(block) if block.header.number > 0 else None
+    return {
+        'head_hash': encode_hex(main_chain.head_hash),
+        'state': state_snapshot,
+        'headers': headers,
+        'objects': objects,
+    }
+
+
+# A snapshot file is the length of its JSON part, the JSON part, and then
+# the db objects, each of them as its key and the length of its value
+# followed by the value
+SNAPSHOT_HEADER = struct.Struct('>I')
+OBJECT_HEADER = struct.Struct('>32sI')
+
+
+def write_snapshot(path, snapshot):
+    meta = dict((k, v) for k, v in snapshot.items() if k != 'objects')
+    meta_json = json.dumps(meta).encode('utf-8')
+    with open(path, 'wb') as f:
+        f.write(SNAPSHOT_HEADER.pack(len(meta_json)))
+        f.write(meta_json)
+        for key, value in snapshot['objects'].items():
+            f.write(OBJECT_HEADER.pack(key, len(value)))
+            f.write(value)
+
+
+def read_snapshot(path, db):
+    """Read a snapshot written by `write_snapshot` through a read-only memory
+    map, so that the workers share the pages of the file, and put its db
+    objects into `db` one by one, without a copy of the whole file
+
+    Returns the snapshot without the objects
+    """
+    with open(path, 'rb') as f:
+        m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            offset = SNAPSHOT_HEADER.size
+            meta_length, = SNAPSHOT_HEADER.unpack_from(m, 0)
+            meta = json.loads(m[offset:offset + meta_length].decode('utf-8'))
+            offset += meta_length
+            while offset < len(m):
+                key, length = OBJECT_HEADER.unpack_from(m, offset)
+                offset += OBJECT_HEADER.size
+                db.put(key, m[offset:offset + length])
+                offset += length
+            return meta
+        finally:
+            m.close()
+
+
+class SnapshotMainChain(object):
+    """The main chain as seen by the shards of a worker process: read-only,
+    as of the latest snapshot
+
+    The shard heads are chosen by the coordinator, so the head updates of
+    `ShardChain.add_collation` are no-ops here.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.shards = {}
+        self.proposer_schedule = ProposerSchedule()
+        # The objects of all the snapshots, as they only carry the new ones
+        self.db = EphemDB()
+        self.state = None
+        self.head_hash = None
+        self.blocks = {}
+
+    def load(self, path):
+        """Load the snapshot file at `path`, written after the ones loaded before
+        """
+        snapshot = read_snapshot(path, self.db)
+        self.state = State.from_snapshot(snapshot['state'], Env(self.db, self.config))
+        self.head_hash = decode_hex(snapshot['head_hash'])
+        self.blocks = {}
+        for header_rlp in snapshot['headers']:
+            header = rlp.decode(decode_hex(header_rlp), BlockHeader)
+            self.blocks[header.hash] = Block(header)
+
+    def get_block(self, blockhash):
+        return self.blocks.get(blockhash)
+
+    def handle_ignored_collation(self, collation):
+        shard = self.shards[collation.header.shard_id]
+        for _collation in shard.parent_queue.pop(collation.header.hash, []):
+            shard.add_collation(_collation, self.get_block(_collation.header.period_start_prevhash))
+
+    def update_head_collation_of_block(self, collation):
+        return True
+
+
+class WorkerFailed(Exception):
+    pass
+
+
+def _load_snapshot(main_chain, path, genesis_snapshots, config):
+    main_chain.load(path)
+    # The shards need the main chain to be initialized
+    for shard_id in sorted(genesis_snapshots):
+        if shard_id not in main_chain.shards:
+            initial_state = State.from_snapshot(genesis_snapshots[shard_id], Env(EphemDB(), config))
+            main_chain.shards[shard_id] = ShardChain(
+                shard_id=shard_id, initial_state=initial_state, main_chain=main_chain)
+
+
+def _add_collation(main_chain, collation):
+    header = collation.header
+    shard = main_chain.shards[header.shard_id]
+    added = shard.add_collation(collation, main_chain.get_block(header.period_start_prevhash))
+    return added, shard.get_score(collation) if added else 0
+
+
+def _run_worker(conn, genesis_snapshots, config):
+    """The loop of a worker process, which owns the shards of
+    `genesis_snapshots` (shard_id -> snapshot of the genesis state)
+
+    Messages:
+    ('snapshot', path): load the main chain snapshot at `path`, and send
+        back ('loaded', path), or ('error', traceback) if it failed
+    ('collation', collation_rlp): add the collation, and send back
+        ('report', added, score), or ('error', traceback) if it failed
+    ('stop',)
+    """
+    main_chain = SnapshotMainChain(config)
+    while True:
+        message = conn.recv()
+        if message[0] == 'stop':
+            break
+        try:
+            if message[0] == 'snapshot':
+                _load_snapshot(main_chain, message[1], genesis_snapshots, config)
+                reply = ('loaded', message[1])
+            elif message[0] == 'collation':
+                added, score = _add_collation(main_chain, rlp.decode(message[1], Collation))
+                reply = ('report', added, score)
+        except Exception:
+            log.error('Worker failed on a {} message'.format(message[0]))
+            reply = ('error', traceback.format_exc())
+        conn.send(reply)
+    conn.close()
+
+
+class ShardProcessPool(object):
+    """Runs the shards in worker processes, one per group of shards, each of
+    them with its own shard db
+
+    The coordinator publishes a snapshot of the main chain to the workers
+    with `publish_snapshot`, e.g. after every block, through a file which
+    they read with a memory map. A snapshot only carries the trie nodes and
+    codes which weren't in the previous ones, and its file is removed once
+    all the workers have loaded it. The workers report the collations they
+    added, and `collect` merges the reports into the shard heads in the
+    order of the shard ids and of the submissions. A collation which made
+    its worker fail is reported as not added, and a snapshot which a worker
+    failed to load raises WorkerFailed.
+    """
+
+    def __init__(self, main_chain, snapshot_dir=None, num_headers=DEFAULT_NUM_HEADERS):
+        self.main_chain = main_chain
+        self.own_snapshot_dir = snapshot_dir is None
+        self.snapshot_dir = tempfile.mkdtemp(prefix='shard_snapshots_') if snapshot_dir is None else snapshot_dir
+        self.num_headers = num_headers
+        self.snapshot_path = None
+        self.num_snapshots = 0
+        self.known = set()      # keys of the objects sent to all the workers
+        self.unloaded = {}      # snapshot path -> connections which didn't load it yet
+        self.processes = []
+        self.conns = {}     # shard_id -> connection of its worker
+        self.requests = {}  # connection -> requests it didn't reply to yet, in order
+        self.reports = []   # (shard_id, number of the report of its worker, ...)
+        self.num_reports = {}   # connection -> number of reports received
+        self.heads = {}     # shard_id -> (score, collation_hash)
+        self.added = {}     # collation_hash -> whether it was added, of the last collect
+
+    def start_worker(self, genesis_snapshots):
+        """Start a worker process for the shards of `genesis_snapshots`,
+        shard_id -> snapshot of the genesis state, e.g. the one stored by
+        `initialize_genesis_keys`
+        """
+        conn, child_conn = Pipe()
+        process = Process(target=_run_worker, args=(child_conn, genesis_snapshots, self.main_chain.env.config))
+        process.daemon = True
+        process.start()
+        self.processes.append(process)
+        for shard_id in genesis_snapshots:
+            assert shard_id not in self.conns, 'shard {} already has a worker'.format(shard_id)
+            self.conns[shard_id] = conn
+        others = list(self.requests)
+        self.requests[conn] = deque()
+        self.num_reports[conn] = 0
+        if self.snapshot_path is not None:
+            # The new worker has none of the objects, so it gets a full
+            # snapshot, and the next ones are relative to it. The other
+            # workers first get the objects of the head they miss, so that
+            # all of them have the ones of the full snapshot.
+            if others:
+                self._send_snapshot(others)
+            self.known = set()
+            self.snapshot_path = self._send_snapshot([conn])
+        return process
+
+    def publish_snapshot(self):
+        """Send a snapshot of the main chain head to all the workers
+        """
+        for conn in self.requests:
+            while conn.poll():
+                self._receive(conn)
+        self.snapshot_path = self._send_snapshot(list(self.requests))
+        return self.snapshot_path
+
+    def _send_snapshot(self, conns):
+        path = os.path.join(self.snapshot_dir, 'snapshot_{}.bin'.format(self.num_snapshots))
+        self.num_snapshots += 1
+        write_snapshot(path, mk_main_chain_snapshot(self.main_chain, self.num_headers, self.known))
+        self.unloaded[path] = set(conns)
+        for conn in conns:
+            conn.send(('snapshot', path))
+            self.requests[conn].append(('snapshot', path))
+        return path
+
+    def _loaded(self, conn, path):
+        self.unloaded[path].discard(conn)
+        if not self.unloaded[path]:
+            del self.unloaded[path]
+            os.remove(path)
+
+    def _receive(self, conn):
+        # The workers reply to the requests in order
+        message = conn.recv()
+        request = self.requests[conn].popleft()
+        if request[0] == 'snapshot':
+            self._loaded(conn, request[1])
+            if message[0] == 'error':
+                raise WorkerFailed('Failed to load snapshot {}:\n{}'.format(request[1], message[1]))
+            return
+        _, shard_id, collation_hash = request
+        if message[0] == 'error':
+            log.error('Failed to add collation {} of shard {}:\n{}'.format(
+                encode_hex(collation_hash), shard_id, message[1]))
+            added, score = False, 0
+        else:
+            _, added, score = message
+        # The reports of a shard are in the order of its submissions
+        self.reports.append((shard_id, self.num_reports[conn], collation_hash, added, score))
+        self.num_reports[conn] += 1
+
+    def submit(self, collation):
+        assert self.snapshot_path is not None, 'no main chain snapshot published'
+        header = collation.header
+        conn = self.conns[header.shard_id]
+        # Don't let the reports fill the pipe while the worker waits
+        while conn.poll():
+            self._receive(conn)
+        conn.send(('collation', rlp.encode(collation)))
+        self.requests[conn].append(('collation', header.shard_id, header.hash))
+
+    def collect(self):
+        """Wait for the reports of all the submitted collations and update
+        the heads. A collation becomes the head of its shard if its score is
+        higher than the current head's.
+
+        Returns {shard_id: head collation hash} of the shards whose head changed
+        """
+        for conn in self.requests:
+            while self.requests[conn]:
+                self._receive(conn)
+        reports, self.reports = self.reports, []
+
+        changed = {}
+        self.added = {}
+        for shard_id, _, collation_hash, added, score in sorted(reports):
+            self.added[collation_hash] = added
+            if not added:
+                log.info('Collation {} of shard {} not added'.format(encode_hex(collation_hash), shard_id))
+                continue
+            if score > self.heads.get(shard_id, (0, None))[0]:
+                self.heads[shard_id] = (score, collation_hash)
+                changed[shard_id] = collation_hash
+        return changed
+
+    def get_head_hash(self, shard_id):
+        return self.heads[shard_id][1] if shard_id in self.heads else None
+
+    def close(self):
+        for conn in self.requests:
+            conn.send(('stop',))
+        for process in self.processes:
+            process.join()
+        self.processes = []
+        self.conns = {}
+        self.requests = {}
+        self.num_reports = {}
+        # The workers stopped, so nothing reads the remaining files
+        for path in self.unloaded:
+            if os.path.exists(path):
+                os.remove(path)
+        self.unloaded = {}
+        self.known = set()
+        if self.own_snapshot_dir:
+            shutil.rmtree(self.snapshot_dir, ignore_errors=True)
@@ -0,0 +1,140 @@
+import multiprocessing
+
+from ethereum import utils
+from ethereum.slogging import get_logger
+from ethereum.transactions import secpk1n
+
+from sharding.contract_utils import (
+    ecrecover_from_signature,
+    get_tx_rawhash,
+)
+from sharding.sender_cache import sender_cache
+
+log = get_logger('sharding.signature_utils')
+
+# Batches smaller than this are verified in the current process, since
+# sending them to the pool costs more than the recovery itself
+MIN_POOL_BATCH_SIZE = 16
+
+_pool = None
+
+
+def get_pool(processes=None):
+    """Get the process pool shared by the batch verifiers, created on first use
+    """
+    global _pool
+    if _pool is None:
+        _pool = multiprocessing.Pool(processes)
+    return _pool
+
+
+def close_pool():
+    global _pool
+    if _pool is not None:
+        _pool.close()
+        _pool.join()
+        _pool = None
+
+
+def recover_header_signer(signing_hash, sig):
+    """Recover the address which signed `signing_hash`, or None if the
+    signature is invalid
+    """
+    return ecrecover_from_signature(signing_hash, sig)
+
+
+def _verify_signature(item):
+    signing_hash, sig, expected_signer = item
+    return recover_header_signer(signing_hash, sig) == expected_signer
+
+
+def batch_verify_header_signatures(pairs, pool=None, chunksize=None):
+    """Verify the signatures of the collation headers against the expected
+    signers, recovering the public keys in a process pool
+
+    pairs: list of (header, expected signer address)
+    pool: the multiprocessing pool to use, defaults to the shared pool
+    Returns the list of the results, in the same order as `pairs`
+    """
+    items = [
+        (header.signing_hash, header.sig, utils.normalize_address(signer))
+        for header, signer in pairs
+    ]
+    if len(items) < MIN_POOL_BATCH_SIZE:
+        return [_verify_signature(item) for item in items]
+    if pool is None:
+        pool = get_pool()
+    if chunksize is None:
+        chunksize = max(1, len(items) // (4 * multiprocessing.cpu_count()))
+    log.debug('Verifying {} header signatures in the pool'.format(len(items)))
+    return pool.map(_verify_signature, items, chunksize)
+
+
+def _mk_recovery_item(tx):
+    """Get (rawhash, v, r, s) of the tx, in the same way as `tx.sender`, or
+    None if the sender isn't recovered with ecrecover or `tx.sender` would
+    reject the signature, so that the tx falls back to `tx.sender`
+    """
+    if tx.r == 0 and tx.s == 0:
+        return None
+    if tx.r >= secpk1n or tx.s >= secpk1n or tx.r == 0 or tx.s == 0:
+        return None
+    if tx.v in (27, 28):
+        return get_tx_rawhash(tx), tx.v, tx.r, tx.s
+    if tx.v >= 37:
+        network_id = ((tx.v - 1) // 2) - 17
+        v = tx.v - network_id * 2 - 8
+        if v not in (27, 28) or not 1 <= network_id < 2**63 - 18:
+            return None
+        return get_tx_rawhash(tx, network_id), v, tx.r, tx.s
+    return None
+
+
+def _recover_sender(item):
+    rawhash, v, r, s = item
+    if r >= secpk1n or s >= secpk1n or r == 0 or s == 0 or v not in (27, 28):
+        return None
+    try:
+        pub = utils.ecrecover_to_pub(rawhash, v, r, s)
+    except Exception:
+        return None
+    if pub == b'\x00' * 64:
+        return None
+    return utils.sha3(pub)[-20:]
+
+
+def recover_tx_senders(txs, pool=None, chunksize=None):
+    """Recover the senders of the txs in the pool (a process pool or a
+    `multiprocessing.pool.ThreadPool`), and put them in the sender cache so
+    that applying the txs doesn't recover them again
+
+    The txs whose senders are cached, and the ones which can't be recovered,
+    are skipped; the latter fail as usual when they're applied.
+    Returns the number of recovered senders.
+    """
+    pending = []
+    for tx in txs:
+        if tx._sender:
+            continue
+        if tx in sender_cache:
+            sender_cache.get_sender(tx)
+            continue
+        item = _mk_recovery_item(tx)
+        if item is not None:
+            pending.append((tx, item))
+    if not pending:
+        return 0
+    items = [item for _, item in pending]
+    if pool is None or len(items) < MIN_POOL_BATCH_SIZE:
+        senders = [_recover_sender(item) for item in items]
+    else:
+        if chunksize is None:
+            chunksize = max(1, len(items) // (4 * multiprocessing.cpu_count()))
+        senders = pool.map(_recover_sender, items, chunksize)
+    recovered = 0
+    for (tx, _), sender in zip(pending, senders):
+        if sender is not None:
+            tx._sender = sender
+            sender_cache.put(tx, sender)
+            recovered += 1
+    return recovered
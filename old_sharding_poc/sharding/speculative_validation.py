@@ -0,0 +1,209 @@
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
+
+from ethereum.config import Env
+from ethereum.exceptions import InvalidTransaction
+from ethereum.slogging import get_logger
+from ethereum import utils
+from ethereum.utils import encode_hex
+
+from sharding.collation_validation import (
+    _run_stage,
+    check_tx_root,
+    execute,
+)
+from sharding.metrics import metrics
+from sharding.receipt_consuming_tx_utils import is_receipt_consuming_tx
+from sharding.sender_cache import sender_cache
+from sharding.trie_db import (
+    REFCOUNT_ONE,
+    DeferredCommitDB,
+)
+
+log = get_logger('sharding.speculative_validation')
+
+DEFAULT_MAX_SIZE = 64
+
+
+def _split_refcounted(key, value):
+    # (refcount, node) of a trie node stored by RefcountDB, (0, None) if
+    # it's absent, or None if the value isn't a trie node
+    if value is None:
+        return 0, None
+    node = value[len(REFCOUNT_ONE):]
+    if utils.sha3(node) != key:
+        return None
+    return utils.big_endian_to_int(value[:len(REFCOUNT_ONE)]), node
+
+
+def _rebase_refcount(key, observed, value, current):
+    """The value of `key` with the refcount change from `observed` to `value`
+    applied on `current`, or False if it isn't a trie node whose only change
+    in `db` is its refcount
+    """
+    splits = [_split_refcounted(key, v) for v in (observed, value, current)]
+    if None in splits:
+        return False
+    nodes = set(node for _, node in splits if node is not None)
+    if len(nodes) != 1:
+        return False
+    (observed_count, _), (count, _), (current_count, _) = splits
+    refcount = current_count + count - observed_count
+    if refcount <= 0:
+        return None
+    return utils.zpad(utils.int_to_big_endian(refcount), len(REFCOUNT_ONE)) + nodes.pop()
+
+
+class SpeculativeDB(DeferredCommitDB):
+    """A DeferredCommitDB which remembers the values of `db` it has seen, so
+    that its writes are only flushed to `db` if their keys haven't been
+    changed in `db` since. The trie nodes whose refcount only was changed,
+    e.g. the nodes shared with the other shards, get the refcount changes
+    of both.
+    """
+
+    def __init__(self, db):
+        super(SpeculativeDB, self).__init__(db)
+        self.observed = {}
+
+    def _get_underlying(self, key):
+        try:
+            return self.db.get(key)
+        except KeyError:
+            return None
+
+    def _observe(self, key):
+        if key not in self.overlay and key not in self.observed:
+            self.observed[key] = self._get_underlying(key)
+
+    def get(self, key):
+        self._observe(key)
+        return super(SpeculativeDB, self).get(key)
+
+    def put(self, key, value):
+        self._observe(key)
+        super(SpeculativeDB, self).put(key, value)
+
+    def delete(self, key):
+        self._observe(key)
+        super(SpeculativeDB, self).delete(key)
+
+    def merge(self):
+        """Flush the buffered writes to `db` and return True, or return False
+        if any of their keys was changed in `db` in the meantime
+        """
+        rebased = {}
+        for key, value in self.overlay.items():
+            current = self._get_underlying(key)
+            if current != self.observed[key]:
+                rebased[key] = _rebase_refcount(key, self.observed[key], value, current)
+                if rebased[key] is False:
+                    return False
+        self.overlay.update(rebased)
+        self.flush()
+        return True
+
+
+def _validate(shard_chain, collation, period_start_prevblock, mainchain_state):
+    # Executed in the pool: all the writes go to a SpeculativeDB
+    db = SpeculativeDB(shard_chain.env.db)
+    env = Env(db, shard_chain.env.config)
+    try:
+        _run_stage('tx_root', check_tx_root, collation)
+        state = _run_stage(
+            'execution', execute, shard_chain, collation, period_start_prevblock, env, mainchain_state)
+    except Exception as e:
+        return None, None, e
+    return state, db, None
+
+
+class SpeculativeValidationCache(object):
+    """Validates the collations of a shard in the background when their
+    bodies arrive, before the blocks which include their headers
+
+    The results are keyed by (collation hash, parent_collation_hash,
+    period_start_prevhash), and `validate_collation` takes the result of
+    the collation instead of executing it again when the header is included.
+    The execution writes to a SpeculativeDB, which is only merged into the
+    shard db when the result is taken.
+    """
+
+    def __init__(self, shard_chain, pool=None, max_size=DEFAULT_MAX_SIZE):
+        self.shard_chain = shard_chain
+        self.own_pool = pool is None
+        self.pool = ThreadPool(1) if pool is None else pool
+        self.max_size = max_size
+        self.results = OrderedDict()    # key -> AsyncResult of _validate
+
+    def __len__(self):
+        return len(self.results)
+
+    def __contains__(self, collation):
+        period_start_prevblock = self.shard_chain.main_chain.get_block(collation.header.period_start_prevhash)
+        return period_start_prevblock is not None and \
+            self.get_key(collation, period_start_prevblock) in self.results
+
+    @staticmethod
+    def get_key(collation, period_start_prevblock):
+        header = collation.header
+        return (header.hash, header.parent_collation_hash, period_start_prevblock.header.hash)
+
+    def submit(self, collation):
+        """Start validating the collation in the background
+
+        Returns False if it can't be validated speculatively: its parent
+        collation or its period_start_prevblock is unknown, or it consumes
+        receipts, which depends on the main chain state of its inclusion.
+        """
+        header = collation.header
+        period_start_prevblock = self.shard_chain.main_chain.get_block(header.period_start_prevhash)
+        if period_start_prevblock is None or header.parent_collation_hash not in self.shard_chain.db:
+            return False
+        if any(is_receipt_consuming_tx(tx) for tx in collation.transactions):
+            return False
+        key = self.get_key(collation, period_start_prevblock)
+        if key in self.results:
+            return True
+        # Recover the senders before the execution, an invalid one rejects the collation
+        try:
+            for tx in collation.transactions:
+                sender_cache.get_sender(tx)
+        except InvalidTransaction:
+            return False
+        mainchain_state = self.shard_chain.main_chain.state.ephemeral_clone()
+        self.results[key] = self.pool.apply_async(
+            _validate, (self.shard_chain, collation, period_start_prevblock, mainchain_state))
+        if len(self.results) > self.max_size:
+            self.results.popitem(last=False)
+        metrics.counter('speculative_validation.submitted').inc()
+        log.debug('Validating collation {} speculatively'.format(encode_hex(header.hash)))
+        return True
+
+    def take(self, collation, period_start_prevblock):
+        """Remove the result of the collation and return its post-state, or
+        raise the error which made it invalid, waiting for the validation if
+        it's still running
+
+        Returns None if there is no result for the collation with this
+        period_start_prevblock, or if its writes conflict with the shard db.
+        """
+        result = self.results.pop(self.get_key(collation, period_start_prevblock), None)
+        if result is None:
+            metrics.counter('speculative_validation.miss').inc()
+            return None
+        state, db, exception = result.get()
+        if exception is not None:
+            metrics.counter('speculative_validation.hit').inc()
+            raise exception
+        if not db.merge():
+            metrics.counter('speculative_validation.conflict').inc()
+            log.debug('Speculative writes of collation {} conflict'.format(encode_hex(collation.header.hash)))
+            return None
+        metrics.counter('speculative_validation.hit').inc()
+        return state
+
+    def close(self):
+        if self.own_pool:
+            self.pool.close()
+            self.pool.join()
+        self.results.clear()
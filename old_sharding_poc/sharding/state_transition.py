@@ -1,4 +1,5 @@
-from ethereum.common import mk_transaction_sha, mk_receipt_sha
+from timeit import default_timer
+
 from ethereum.exceptions import (
     InsufficientBalance,
     BlockGasLimitReached,
@@ -20,6 +21,10 @@ from sharding.collation import (
     Collation,
     CollationHeader,
 )
+from sharding.trie_root import (
+    get_receipts_root,
+    get_tx_list_root,
+)
 
 log = get_logger('sharding.shard_state_transition')
 
@@ -37,9 +42,12 @@ def mk_collation_from_prevstate(shard_chain, state, coinbase):
     return collation
 
 
-def add_transactions(shard_state, collation, txqueue, mainchain_state, shard_id, min_gasprice=0):
+def add_transactions(shard_state, collation, txqueue, mainchain_state, shard_id, min_gasprice=0,
+                     deadline=None, clock=default_timer):
     """Add transactions to a collation
     (refer to ethereum.common.add_transactions)
+
+    deadline: if given, stop adding transactions once `clock()` reaches it
     """
     if not txqueue:
         return
@@ -49,7 +57,7 @@ def add_transactions(shard_state, collation, txqueue, mainchain_state, shard_id,
     # Collation Gas Limit
     shard_state.gas_limit = call_valmgr(mainchain_state, 'get_collation_gas_limit', [])
 
-    while 1:
+    while deadline is None or clock() < deadline:
         tx = txqueue.pop_transaction(
             max_gas=shard_state.gas_limit - shard_state.gas_used,
             min_gasprice=min_gasprice
@@ -68,6 +76,9 @@ def add_transactions(shard_state, collation, txqueue, mainchain_state, shard_id,
         try:
             apply_shard_transaction(mainchain_state, shard_state, shard_id, tx)
             collation.transactions.append(tx)
+            # Update the roots with the new tx and receipt
+            get_tx_list_root(collation)
+            get_receipts_root(collation, shard_state.receipts)
         except (InsufficientBalance, BlockGasLimitReached, InsufficientStartGas,
                 InvalidNonce, UnsignedTransaction) as e:
             log.info(str(e))
@@ -86,8 +97,8 @@ def set_execution_results(state, collation):
     """Set state root, receipt root, etc
     (ethereum.pow.common.set_execution_results)
     """
-    collation.header.receipts_root = mk_receipt_sha(state.receipts)
-    collation.header.tx_list_root = mk_transaction_sha(collation.transactions)
+    collation.header.receipts_root = get_receipts_root(collation, state.receipts)
+    collation.header.tx_list_root = get_tx_list_root(collation)
 
     # Notice: commit state before assigning
     state.commit()
@@ -104,9 +115,10 @@ def validate_transaction_tree(collation):
     """Validate that the transaction list root is correct
     (refer to ethereum.common.validate_transaction_tree)
     """
-    if collation.header.tx_list_root != mk_transaction_sha(collation.transactions):
+    tx_list_root = get_tx_list_root(collation)
+    if collation.header.tx_list_root != tx_list_root:
         raise ValueError("Transaction root mismatch: header %s computed %s, %d transactions" %
-                         (encode_hex(collation.header.tx_list_root), encode_hex(mk_transaction_sha(collation.transactions)),
+                         (encode_hex(collation.header.tx_list_root), encode_hex(tx_list_root),
                           len(collation.transactions)))
     return True
 
@@ -122,9 +134,10 @@ def verify_execution_results(state, collation):
     if collation.header.post_state_root != state.trie.root_hash:
         raise ValueError('State root mismatch: header %s computed %s' %
                          (encode_hex(collation.header.post_state_root), encode_hex(state.trie.root_hash)))
-    if collation.header.receipts_root != mk_receipt_sha(state.receipts):
+    receipts_root = get_receipts_root(collation, state.receipts)
+    if collation.header.receipts_root != receipts_root:
         raise ValueError('Receipt root mismatch: header %s computed %s, computed %d, %d receipts' %
-                         (encode_hex(collation.header.receipts_root), encode_hex(mk_receipt_sha(state.receipts)),
+                         (encode_hex(collation.header.receipts_root), encode_hex(receipts_root),
                           state.gas_used, len(state.receipts)))
 
     return True
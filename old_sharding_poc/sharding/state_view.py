@@ -0,0 +1,213 @@
+import copy
+
+from ethereum import utils
+from ethereum.state import STATE_DEFAULTS
+
+# The STATE_DEFAULTS which are only read during a message call, so that the
+# view can share them with the parent state instead of copying them
+SHARED_PARAMS = ('prev_headers', 'recent_uncles')
+
+_MISSING = object()
+
+
+def _zero(*args):
+    return 0
+
+
+class StateView(object):
+    """A lightweight read-only overlay view of a State
+
+    Reads are forwarded to the parent state and writes are buffered in a small
+    dict which is dropped together with the view, so the parent state is never
+    modified. Unlike `State.ephemeral_clone`, creating a view doesn't depend on
+    the size of the parent state's caches and journal.
+    """
+
+    def __init__(self, parent):
+        self.parent = parent
+        self.env = parent.env
+        self.writes = {}    # (address, field) or (address, 'storage', key) -> value
+        self.journal = []
+        self.log_listeners = []
+        for k in STATE_DEFAULTS:
+            v = getattr(parent, k)
+            setattr(self, k, v if k in SHARED_PARAMS else copy.copy(v))
+
+    @property
+    def db(self):
+        return self.env.db
+
+    @property
+    def config(self):
+        return self.env.config
+
+    @property
+    def trie(self):
+        return self.parent.trie
+
+    def ephemeral_clone(self):
+        return StateView(self)
+
+    # Reads
+
+    def _read(self, key, parent_getter, *args):
+        if key in self.writes:
+            return self.writes[key]
+        return parent_getter(*args)
+
+    def get_balance(self, address):
+        address = utils.normalize_address(address)
+        return self._read((address, 'balance'), self.parent.get_balance, address)
+
+    def get_code(self, address):
+        address = utils.normalize_address(address)
+        return self._read((address, 'code'), self.parent.get_code, address)
+
+    def get_nonce(self, address):
+        address = utils.normalize_address(address)
+        return self._read((address, 'nonce'), self.parent.get_nonce, address)
+
+    def get_storage_data(self, address, key):
+        address = utils.normalize_address(address)
+        if self.writes.get((address, 'storage_reset')):
+            return self._read((address, 'storage', key), _zero, address, key)
+        return self._read((address, 'storage', key), self.parent.get_storage_data, address, key)
+
+    def account_exists(self, address):
+        address = utils.normalize_address(address)
+        if self.is_SPURIOUS_DRAGON():
+            return not (
+                self.get_nonce(address) == 0 and
+                self.get_balance(address) == 0 and
+                self.get_code(address) == b''
+            )
+        if any(k[0] == address for k in self.writes):
+            return True
+        return self.parent.account_exists(address)
+
+    def account_to_dict(self, address):
+        # Only used for tracing, doesn't include the buffered writes
+        return self.parent.account_to_dict(address)
+
+    def get_block_hash(self, n):
+        if self.block_number < n or n > 256 or n < 0:
+            return b'\x00' * 32
+        return self.prev_headers[n].hash if self.prev_headers[n] else b'\x00' * 32
+
+    # Writes
+
+    def _write(self, key, value):
+        preval = self.writes.get(key, _MISSING)
+        self.journal.append((key, preval))
+        self.writes[key] = value
+
+    def set_balance(self, address, value):
+        self._write((utils.normalize_address(address), 'balance'), value)
+
+    def set_code(self, address, value):
+        self._write((utils.normalize_address(address), 'code'), value)
+
+    def set_nonce(self, address, value):
+        self._write((utils.normalize_address(address), 'nonce'), value)
+
+    def set_storage_data(self, address, key, value):
+        self._write((utils.normalize_address(address), 'storage', key), value)
+
+    def delta_balance(self, address, value):
+        self.set_balance(address, self.get_balance(address) + value)
+
+    def increment_nonce(self, address):
+        self.set_nonce(address, self.get_nonce(address) + 1)
+
+    def transfer_value(self, from_addr, to_addr, value):
+        assert value >= 0
+        if self.get_balance(from_addr) >= value:
+            self.delta_balance(from_addr, -value)
+            self.delta_balance(to_addr, value)
+            return True
+        return False
+
+    def reset_storage(self, address):
+        address = utils.normalize_address(address)
+        for key in [k for k in self.writes if k[0] == address and k[1] == 'storage']:
+            self._write(key, 0)
+        self._write((address, 'storage_reset'), True)
+
+    def del_account(self, address):
+        self.set_balance(address, 0)
+        self.set_nonce(address, 0)
+        self.set_code(address, b'')
+        self.reset_storage(address)
+
+    def add_suicide(self, address):
+        self.suicides.append(address)
+        self.journal.append(lambda: self.suicides.pop())
+
+    def add_log(self, log):
+        # The logs of a view are never passed to the parent's log_listeners
+        self.logs.append(log)
+        self.journal.append(lambda: self.logs.pop())
+
+    def add_receipt(self, receipt):
+        self.receipts.append(receipt)
+        self.journal.append(lambda: self.receipts.pop())
+
+    def add_refund(self, value):
+        self.set_param('refunds', self.refunds + value)
+
+    def set_param(self, k, v):
+        preval = getattr(self, k)
+        self.journal.append(lambda: setattr(self, k, preval))
+        setattr(self, k, v)
+
+    def snapshot(self):
+        return (len(self.journal), {
+                k: copy.copy(getattr(self, k)) for k in STATE_DEFAULTS})
+
+    def revert(self, snapshot):
+        L, auxvars = snapshot
+        while len(self.journal) > L:
+            lastitem = self.journal.pop()
+            if callable(lastitem):
+                lastitem()
+                continue
+            key, preval = lastitem
+            if preval is _MISSING:
+                del self.writes[key]
+            else:
+                self.writes[key] = preval
+        for k in STATE_DEFAULTS:
+            setattr(self, k, copy.copy(auxvars[k]))
+
+    def commit(self, allow_empties=False):
+        # The buffered writes are dropped with the view, never committed
+        pass
+
+    # Forks
+
+    def _is_fork(self, fork_name, at_fork_height):
+        fork_blknum = self.config[fork_name + '_FORK_BLKNUM']
+        if at_fork_height:
+            return self.block_number == fork_blknum
+        return self.block_number >= fork_blknum
+
+    def is_SERENITY(self, at_fork_height=False):
+        return self._is_fork('SERENITY', at_fork_height)
+
+    def is_HOMESTEAD(self, at_fork_height=False):
+        return self._is_fork('HOMESTEAD', at_fork_height)
+
+    def is_METROPOLIS(self, at_fork_height=False):
+        return self._is_fork('METROPOLIS', at_fork_height)
+
+    def is_CONSTANTINOPLE(self, at_fork_height=False):
+        return self._is_fork('CONSTANTINOPLE', at_fork_height)
+
+    def is_ANTI_DOS(self, at_fork_height=False):
+        return self._is_fork('ANTI_DOS', at_fork_height)
+
+    def is_SPURIOUS_DRAGON(self, at_fork_height=False):
+        return self._is_fork('SPURIOUS_DRAGON', at_fork_height)
+
+    def is_DAO(self, at_fork_height=False):
+        return self._is_fork('DAO', at_fork_height)
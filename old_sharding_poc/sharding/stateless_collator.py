@@ -1,40 +1,145 @@
+import rlp
 from ethereum.slogging import get_logger
 
+from sharding.candidate_heads import add_header_log_sedes
 from sharding.validator_manager_utils import call_valmgr
 
 log = get_logger('sharding.collator')
 
 
-def get_collations_with_score(main_state, shard_id, score):
-    """ Get collations with the given shard_id and score
+class CollationsWithScoreCache(object):
+    """The score -> [collation hashes] tables of the validator manager
+    contract, per shard, as of the main chain block `head_hash`
+
+    A score only gets new collations through add_header, so the entry of a
+    score is dropped by `add_header_log` when a log adds a collation with
+    this score, and the cache moves to the next block with `advance` once
+    the logs of that block are added. It's only used for the post-state of
+    `head_hash`, see `is_head_state`. On a main chain reorg, the cache has
+    to be cleared.
 
-    TODO: cache result
+    candidate_heads: if given, the CandidateHeadIndex of the add_header logs
+        of the main chain, which the missing scores are filled from
+    is_canonical: `is_canonical(blockhash, block_number)` tells whether a
+        log of `candidate_heads` is on the main chain
     """
+
+    def __init__(self, candidate_heads=None, is_canonical=None):
+        self.scores = {}    # shard_id -> {score: [collation hashes]}
+        self.head_hash = None
+        self.state_root = None
+        self.candidate_heads = candidate_heads
+        self.is_canonical = is_canonical
+        self.hits = 0
+        self.misses = 0
+        self.fallbacks = 0  # missing scores read from validator manager contract
+
+    def is_head_state(self, main_state):
+        """Whether `main_state` is the post-state of the block of the cache,
+        and not e.g. the state of another block or a pending one
+        """
+        return self.head_hash is not None and main_state.trie.root_hash == self.state_root
+
+    def get(self, shard_id, score):
+        return self.scores.get(shard_id, {}).get(score)
+
+    def put(self, shard_id, score, collation_hashes):
+        self.scores.setdefault(shard_id, {})[score] = collation_hashes
+
+    def get_logged(self, shard_id, score):
+        """Get the collation hashes of the score from the add_header logs, or
+        None without an index of the logs
+        """
+        if self.candidate_heads is None:
+            return None
+        return self.candidate_heads.get_collation_hashes(shard_id, score, self.is_canonical)
+
+    def add_header_log(self, header_rlp):
+        values = rlp.decode(header_rlp, add_header_log_sedes)
+        self.scores.get(values[0], {}).pop(values[8], None)
+
+    def advance(self, block):
+        """Move the cache to `block`, whose add_header logs were added. The
+        entries are dropped unless `block` is a child of the block of the cache.
+        """
+        if block.header.prevhash != self.head_hash:
+            self.scores.clear()
+        self.head_hash = block.header.hash
+        self.state_root = block.header.state_root
+
+    def clear(self):
+        self.scores.clear()
+        self.head_hash = None
+        self.state_root = None
+
+
+def _read_collations_with_score(main_state, shard_id, score, num_collations):
     return [
         call_valmgr(
             main_state,
             'get_collations_with_score',
             [shard_id, score, i],
-        ) for i in range(
-            call_valmgr(
-                main_state,
-                'get_num_collations_with_score',
-                [shard_id, score],
-            )
-        )
+        ) for i in range(num_collations)
     ]
 
 
-def get_collations_with_scores_in_range(main_state, shard_id, low, high):
+def get_collations_by_score(main_state, shard_id, low, high, cache=None):
+    """ Get {score: [collation hashes]} of the shard for the scores within
+    [low, high]. The scores which aren't in `cache`, if given, are filled
+    from the add_header logs of the cache, with one call to validator
+    manager contract to check the number of collations, and read from the
+    contract if the logs miss some of them. The cache is ignored unless
+    `main_state` is the post-state of its block.
+    """
+    if cache is not None and not cache.is_head_state(main_state):
+        cache = None
+    result = {}
+    missing = []
+    for score in range(low, high + 1):
+        collation_hashes = cache.get(shard_id, score) if cache is not None else None
+        if collation_hashes is None:
+            missing.append(score)
+        else:
+            result[score] = collation_hashes
+    if cache is not None:
+        cache.hits += high + 1 - low - len(missing)
+        cache.misses += len(missing)
+    if not missing:
+        return result
+
+    for score in missing:
+        if cache is None:
+            result[score] = get_collations_with_score(main_state, shard_id, score)
+            continue
+        collation_hashes = cache.get_logged(shard_id, score)
+        num_collations = call_valmgr(main_state, 'get_num_collations_with_score', [shard_id, score])
+        if collation_hashes is None or len(collation_hashes) != num_collations:
+            cache.fallbacks += 1
+            collation_hashes = _read_collations_with_score(main_state, shard_id, score, num_collations)
+        result[score] = collation_hashes
+        cache.put(shard_id, score, collation_hashes)
+    return result
+
+
+def get_collations_with_score(main_state, shard_id, score, cache=None):
+    """ Get collations with the given shard_id and score
+    """
+    if cache is not None:
+        return list(get_collations_by_score(main_state, shard_id, score, score, cache)[score])
+    num_collations = call_valmgr(
+        main_state,
+        'get_num_collations_with_score',
+        [shard_id, score],
+    )
+    return _read_collations_with_score(main_state, shard_id, score, num_collations)
+
+
+def get_collations_with_scores_in_range(main_state, shard_id, low, high, cache=None):
     """ Get collations with the given shard_id and the score within the certain range
     """
-    o = []
-    for i in range(low, high+1):
-        o.extend(
-            get_collations_with_score(
-                main_state,
-                shard_id,
-                i,
-            )
-        )
-    return o
+    collations = get_collations_by_score(main_state, shard_id, low, high, cache)
+    return [
+        collation_hash
+        for score in range(low, high + 1)
+        for collation_hash in collations[score]
+    ]
@@ -0,0 +1,110 @@
+import pytest
+
+from ethereum import utils
+from ethereum.transaction_queue import TransactionQueue
+
+from sharding import collator
+from sharding.access_list import (
+    AccessList,
+    AccessListViolation,
+    prefetch_access_lists,
+    to_prefix_list_form,
+)
+from sharding.receipt_consuming_tx_utils import apply_shard_transaction
+from sharding.tools import tester
+from sharding.trie_db import cached_trie_nodes
+
+SHARD_ID = 1
+
+
+@pytest.fixture
+def chain():
+    c = tester.Chain(env='sharding', deploy_sharding_contracts=True)
+    c.mine(5)
+    c.add_test_shard(SHARD_ID)
+    return c
+
+
+def test_to_prefix_list_form():
+    prefix = b'\x01\x02'
+    assert to_prefix_list_form([[tester.a1, prefix]]) == [
+        utils.sha3(tester.a1) + b'\x00',
+        utils.sha3(tester.a1) + b'\x01',
+        utils.sha3(tester.a1) + b'\x02' + prefix,
+    ]
+
+
+def test_access_list():
+    access_list = AccessList([[tester.a1, b'\x00' * 31]], implicit_addrs=[tester.a2])
+    assert access_list.allows_account(tester.a1)
+    assert access_list.allows_account(tester.a2)
+    assert not access_list.allows_account(tester.a3)
+    assert access_list.allows_storage(tester.a1, 0)
+    assert access_list.allows_storage(tester.a1, 255)
+    assert not access_list.allows_storage(tester.a1, 256)
+    assert not access_list.allows_storage(tester.a2, 0)
+    with pytest.raises(AccessListViolation):
+        access_list.check_account(tester.a3)
+    with pytest.raises(AccessListViolation):
+        access_list.check_storage(tester.a1, 256)
+
+
+def test_apply_shard_transaction_with_access_list(chain):
+    state = chain.chain.shards[SHARD_ID].state
+    tx = chain.generate_shard_tx(SHARD_ID, tester.k2, tester.a4, 1)
+
+    # Out-of-list access: the state is unchanged
+    root = state.trie.root_hash
+    with pytest.raises(AccessListViolation):
+        apply_shard_transaction(None, state, None, tx, access_list=[[tester.a5]])
+    assert state.trie.root_hash == root
+    assert state.get_nonce(tester.a2) == tx.nonce
+
+    sequential_state = state.ephemeral_clone()
+    apply_shard_transaction(None, sequential_state, None, tx)
+    success, _ = apply_shard_transaction(None, state, None, tx, access_list=[[tester.a4]])
+    assert success
+    assert state.trie.root_hash == sequential_state.trie.root_hash
+
+
+def test_prefetch_access_lists(chain):
+    state = chain.chain.shards[SHARD_ID].state
+    db = state.env.db
+    with cached_trie_nodes(state) as cache:
+        assert state.env.db is cache
+        assert prefetch_access_lists(state, [[[tester.a1]], [[tester.a2]]], [tester.a1]) == 2
+        assert cache.nodes
+        num_nodes = len(cache.nodes)
+        # Already cached
+        state.trie.get(tester.a1)
+        state.trie.get(tester.a2)
+        assert len(cache.nodes) == num_nodes
+    assert state.env.db is db
+    assert state.trie.db.db is db
+
+
+def test_apply_collation_with_access_lists(chain):
+    txqueue = TransactionQueue()
+    for i in range(3):
+        txqueue.add_transaction(chain.generate_shard_tx(SHARD_ID, tester.keys[2 + i], tester.a9, i + 1))
+    collation = chain.generate_collation(shard_id=SHARD_ID, coinbase=tester.a1, key=tester.k1, txqueue=txqueue)
+    assert collation.transaction_count == 3
+    period_start_prevblock = chain.chain.get_block(collation.header.period_start_prevhash)
+    state = chain.chain.shards[SHARD_ID].state
+
+    # tester.a9 is missing from the last access list
+    access_lists = [[[tester.a9]], [[tester.a9]], [[tester.a8]]]
+    root = state.trie.root_hash
+    with pytest.raises(AccessListViolation):
+        collator.apply_collation(
+            state, collation, period_start_prevblock, chain.chain.state, SHARD_ID,
+            access_lists=access_lists,
+        )
+    assert state.trie.root_hash == root
+
+    access_lists[2] = [[tester.a9]]
+    collator.apply_collation(
+        state, collation, period_start_prevblock, chain.chain.state, SHARD_ID,
+        access_lists=access_lists,
+    )
+    assert collation.header.post_state_root == state.trie.root_hash
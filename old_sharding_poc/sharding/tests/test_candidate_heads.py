@@ -0,0 +1,115 @@
+from ethereum import utils
+from ethereum.common import set_execution_results
+from ethereum.meta import make_head_candidate
+from ethereum.pow.ethpow import Miner
+
+from sharding.candidate_heads import CandidateHeadIndex
+from sharding.config import sharding_config
+from sharding.tools import tester
+
+shard_id = 1
+
+# The example of docs/doc.md: the scores of the collations A1..A5, B1..B5,
+# C1..C5 and D1..D5, one block per letter
+DOC_SCORES = [
+    10, 11, 12, 11, 13,
+    14, 15, 11, 12, 13,
+    14, 12, 13, 14, 15,
+    16, 17, 18, 19, 16,
+]
+DOC_ORDER = 'D4 D3 D2 D1 D5 B2 C5 B1 C1 C4 A5 B5 C3 A3 B4 C2 A2 A4 B3 A1'.split()
+
+
+def mk_doc_index():
+    index = CandidateHeadIndex()
+    for i, score in enumerate(DOC_SCORES):
+        block_number, log_index = divmod(i, 5)
+        name = 'ABCD'[block_number] + str(log_index + 1)
+        index.add_header(shard_id, score, name, utils.sha3(str(block_number)), block_number, log_index)
+    return index
+
+
+def test_candidate_order():
+    index = mk_doc_index()
+    assert len(index) == 20
+    assert [name for _, name in index.iter_candidates(shard_id)] == DOC_ORDER
+    assert list(index.iter_candidates(shard_id + 1)) == []
+    # Added twice
+    assert not index.add_header(shard_id, 10, 'A1', utils.sha3('0'), 0, 0)
+
+
+def test_candidate_reorg():
+    index = mk_doc_index()
+    # Block D leaves the main chain
+    index.remove_block(utils.sha3('3'))
+    assert [name for _, name in index.iter_candidates(shard_id)] == \
+        [name for name in DOC_ORDER if name[0] != 'D']
+    assert 19 not in index.scores[shard_id]
+    # And returns
+    index.restore_block(utils.sha3('3'))
+    assert [name for _, name in index.iter_candidates(shard_id)] == DOC_ORDER
+    index.restore_block(utils.sha3('3'))
+    assert len(index) == 20
+
+    # Filtered instead
+    index = mk_doc_index()
+
+    def is_canonical(blockhash, block_number):
+        return block_number != 1
+    assert [name for _, name in index.iter_candidates(shard_id, is_canonical)] == \
+        [name for name in DOC_ORDER if name[0] != 'B']
+
+
+def test_candidate_iterator_is_lazy():
+    index = mk_doc_index()
+    candidates = index.iter_candidates(shard_id)
+    assert next(candidates) == (19, 'D4')
+    # A new log with the current score, and one with a higher score
+    index.add_header(shard_id, 19, 'E1', utils.sha3('4'), 4, 0)
+    index.add_header(shard_id, 20, 'E2', utils.sha3('4'), 4, 1)
+    assert next(candidates) == (19, 'E1')
+    assert next(candidates) == (18, 'D3')
+
+
+def test_fetch_candidate_heads():
+    t = tester.Chain(env='sharding', deploy_sharding_contracts=True)
+    t.mine(5)
+    valcode_addr = t.sharding_valcode_addr(tester.k0)
+    t.sharding_deposit(tester.k0, valcode_addr)
+    t.mine(sharding_config['SHUFFLING_CYCLE_LENGTH'])
+    t.add_test_shard(shard_id)
+
+    collation = t.collate(shard_id, tester.k0)
+    t.mine(5)
+    assert list(t.chain.fetch_candidate_heads(shard_id)) == [(1, collation.header.hash)]
+
+    # Known to be invalid
+    t.chain.shards[shard_id].validity_cache.set_invalid(collation.header.hash, 'invalid')
+    assert list(t.chain.fetch_candidate_heads(shard_id)) == []
+
+
+def test_candidate_heads_of_block_not_on_head():
+    t = tester.Chain(env='sharding', deploy_sharding_contracts=True)
+    t.mine(5)
+    valcode_addr = t.sharding_valcode_addr(tester.k0)
+    t.sharding_deposit(tester.k0, valcode_addr)
+    t.mine(sharding_config['SHUFFLING_CYCLE_LENGTH'])
+    t.add_test_shard(shard_id)
+
+    collation = t.collate(shard_id, tester.k0)
+    t.cs.finalize(t.head_state, t.block)
+    set_execution_results(t.head_state, t.block)
+    fork_block = Miner(t.block).mine(rounds=100, start_nonce=0)
+    # The head moves on without the block of the add_header log
+    parent = t.chain.head
+    for _ in range(2):
+        parent, _ = make_head_candidate(t.chain, parent=parent, timestamp=t.chain.state.timestamp + 14)
+        parent = Miner(parent).mine(rounds=100, start_nonce=0)
+        assert t.chain.add_block(parent)[0]
+    assert t.chain.add_block(fork_block)[0]
+    assert t.chain.head_hash == parent.header.hash
+
+    # The log is indexed, but not on the main chain
+    assert [e[2][2] for e in t.chain.candidate_heads.block_entries[fork_block.header.hash]] == \
+        [collation.header.hash]
+    assert list(t.chain.fetch_candidate_heads(shard_id)) == []
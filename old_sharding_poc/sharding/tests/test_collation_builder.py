@@ -0,0 +1,197 @@
+import pytest
+import rlp
+
+from ethereum import utils
+from ethereum.transaction_queue import TransactionQueue
+
+from sharding import collator
+from sharding.collation import CollationHeader
+from sharding.collation_builder import (
+    CollationBuilder,
+    PHASES,
+    get_proposal_slots,
+)
+from sharding.config import sharding_config
+from sharding.metrics import metrics
+from sharding.tools import tester
+from sharding.validator_manager_utils import call_tx_add_header
+
+shard_id = 1
+
+
+@pytest.fixture
+def chain():
+    c = tester.Chain(env='sharding', deploy_sharding_contracts=True)
+    c.mine(5)
+    c.valcode_addr = c.sharding_valcode_addr(tester.k0)
+    c.sharding_deposit(tester.k0, c.valcode_addr)
+    c.mine(sharding_config['SHUFFLING_CYCLE_LENGTH'])
+    c.add_test_shard(shard_id)
+    metrics.reset()
+    return c
+
+
+def mk_txqueue(chain):
+    txqueue = TransactionQueue()
+    for privkey, to in ((tester.k2, tester.a4), (tester.k3, tester.a5)):
+        txqueue.add_transaction(chain.generate_shard_tx(shard_id, privkey, to, int(0.03 * utils.denoms.ether)))
+    return txqueue
+
+
+class FakeClock(object):
+    """A clock which advances by `step` seconds on each call
+    """
+
+    def __init__(self, step):
+        self.time = 0.0
+        self.step = step
+
+    def __call__(self):
+        self.time += self.step
+        return self.time
+
+
+def test_proposal_slots(chain):
+    slots = get_proposal_slots(chain.chain, chain.valcode_addr)
+    # The only validator proposes in every shard
+    assert len(slots) == sharding_config['SHARD_COUNT'] * (sharding_config['LOOKAHEAD_PERIODS'] + 1)
+    assert slots == sorted(slots, key=lambda slot: slot[1])
+
+
+def test_build_collation(chain):
+    expected_period_number = chain.chain.get_expected_period_number()
+    builder = CollationBuilder(
+        chain.chain, shard_id, expected_period_number, tester.a0, tester.k0,
+        txqueue=mk_txqueue(chain), time_budget=60,
+    )
+    collation = builder.build()
+    assert collation.transaction_count == 2
+    assert collation.header.parent_collation_hash == chain.chain.shards[shard_id].head_hash
+
+    # The same collation as create_collation
+    expected = collator.create_collation(
+        chain.chain, shard_id, collation.header.parent_collation_hash,
+        expected_period_number, tester.a0, tester.k0, txqueue=mk_txqueue(chain))
+    assert collation.header.post_state_root == expected.header.post_state_root
+    assert collation.header.hash == expected.header.hash
+    period_start_prevblock = chain.chain.get_block(collation.header.period_start_prevhash)
+    assert chain.chain.shards[shard_id].add_collation(collation, period_start_prevblock)
+
+    report = builder.report()
+    assert set(report['phases']) == set(PHASES)
+    assert report['num_txs'] == 2
+    assert report['remaining'] > 0
+    assert metrics.histogram('collation_builder.pack.seconds').count == 1
+    assert metrics.counter('collation_builder.deadline_missed').value == 0
+
+
+def test_best_collation_improves(chain):
+    builder = CollationBuilder(
+        chain.chain, shard_id, chain.chain.get_expected_period_number(), tester.a0, tester.k0,
+        txqueue=mk_txqueue(chain), time_budget=60,
+    )
+    builder.create()
+    empty = builder.best_collation()
+    assert empty.transaction_count == 0
+    assert builder.best_collation() is empty
+    builder.pack()
+    best = builder.best_collation()
+    assert best.transaction_count == 2
+    assert best.header.post_state_root != empty.header.post_state_root
+
+
+def test_build_collation_out_of_time(chain):
+    # Every call of the clock takes a second, with a budget of two seconds
+    builder = CollationBuilder(
+        chain.chain, shard_id, chain.chain.get_expected_period_number(), tester.a0, tester.k0,
+        txqueue=mk_txqueue(chain), time_budget=2, clock=FakeClock(1),
+    )
+    collation = builder.build()
+    # A collation is still ready, without the transactions
+    assert collation.transaction_count == 0
+    assert builder.report()['remaining'] < 0
+    assert metrics.counter('collation_builder.deadline_missed').value == 1
+
+
+def test_guess_head(chain):
+    collation = chain.collate(shard_id, tester.k0)
+    chain.mine(5)
+    builder = CollationBuilder(
+        chain.chain, shard_id, chain.chain.get_expected_period_number(), tester.a0, tester.k0,
+        time_budget=60,
+    )
+    assert builder.guess_head() == collation.header.hash
+    assert builder.head_score == 1
+    assert builder.checked_heads == 1
+    assert builder.build().header.parent_collation_hash == collation.header.hash
+
+    # Known to be invalid, fall back to its parent
+    chain.chain.shards[shard_id].validity_cache.set_invalid(collation.header.hash, 'invalid')
+    builder = CollationBuilder(
+        chain.chain, shard_id, chain.chain.get_expected_period_number(), tester.a0, tester.k0,
+        time_budget=60,
+    )
+    assert builder.guess_head() == collation.header.parent_collation_hash
+
+    # The genesis is the last resort
+    chain.chain.shards[shard_id].validity_cache.set_invalid(collation.header.parent_collation_hash, 'invalid')
+    builder = CollationBuilder(
+        chain.chain, shard_id, chain.chain.get_expected_period_number(), tester.a0, tester.k0,
+        time_budget=60,
+    )
+    assert builder.guess_head() == collation.header.parent_collation_hash
+    assert builder.head_score == 0
+
+
+def add_header(chain, collation):
+    tx = call_tx_add_header(chain.head_state, tester.k0, 0, rlp.encode(CollationHeader.serialize(collation.header)))
+    chain.direct_tx(tx)
+    chain.mine(5)
+
+
+def test_guess_head_fetches_collations(chain):
+    shard = chain.chain.shards[shard_id]
+    collation_1 = chain.generate_collation(shard_id, tester.a0, tester.k0)
+    assert shard.add_collation(collation_1, chain.chain.get_block(collation_1.header.period_start_prevhash))
+    add_header(chain, collation_1)
+    collation_2 = chain.generate_collation(shard_id, tester.a0, tester.k0, parent_collation_hash=collation_1.hash)
+    add_header(chain, collation_2)
+    collations = {collation_1.hash: collation_1, collation_2.hash: collation_2}
+
+    def mk_builder(fetch_collation=None):
+        return CollationBuilder(
+            chain.chain, shard_id, chain.chain.get_expected_period_number(), tester.a0, tester.k0,
+            time_budget=60, fetch_collation=fetch_collation,
+        )
+
+    # The body of collation_2 isn't available
+    builder = mk_builder()
+    assert builder.guess_head() == collation_1.hash
+    assert builder.checked_heads == 2
+
+    # Fetched and validated, with its ancestor which the shard no longer has
+    shard.db.delete(collation_1.hash)
+    builder = mk_builder(collations.get)
+    assert builder.guess_head() == collation_2.hash
+    assert builder.head_score == 2
+    assert collation_1.hash in shard.db and collation_2.hash in shard.db
+    assert builder.verified == {collation_1.hash: True, collation_2.hash: True}
+
+    # An invalid ancestor
+    collation_3 = chain.generate_collation(shard_id, tester.a0, tester.k0, parent_collation_hash=collation_2.hash)
+    add_header(chain, collation_3)
+    shard.db.delete(collation_2.hash)
+    shard.validity_cache.set_invalid(collation_2.hash, 'invalid')
+    collations[collation_3.hash] = collation_3
+    builder = mk_builder(collations.get)
+    assert builder.guess_head() == collation_1.hash
+    assert collation_3.hash not in shard.db
+    assert builder.verified[collation_3.hash] is False
+
+    # Out of time: every call of the clock takes a second
+    builder = CollationBuilder(
+        chain.chain, shard_id, chain.chain.get_expected_period_number(), tester.a0, tester.k0,
+        time_budget=4, clock=FakeClock(1), fetch_collation=collations.get,
+    )
+    assert builder.fetch_and_verify(collation_3.hash) is None
+    assert builder.verified == {}
@@ -0,0 +1,84 @@
+import pytest
+
+from ethereum import utils
+
+from sharding.collation_validation import (
+    CollationValidationError,
+    validate_collation,
+)
+from sharding.config import sharding_config
+from sharding.contract_utils import sign
+from sharding.metrics import metrics
+from sharding.tools import tester
+
+shard_id = 1
+
+
+@pytest.fixture
+def chain():
+    c = tester.Chain(env='sharding', deploy_sharding_contracts=True)
+    c.mine(5)
+    valcode_addr = c.sharding_valcode_addr(tester.k0)
+    c.sharding_deposit(tester.k0, valcode_addr)
+    c.mine(sharding_config['SHUFFLING_CYCLE_LENGTH'])
+    c.add_test_shard(shard_id)
+    metrics.reset()
+    return c
+
+
+def get_counter(stage, result):
+    return metrics.counter('collation_validation.{}.{}'.format(stage, result)).value
+
+
+def add(chain, collation, check_header_signature=False):
+    shard = chain.chain.shards[shard_id]
+    period_start_prevblock = chain.chain.get_block(collation.header.period_start_prevhash)
+    return validate_collation(shard, collation, period_start_prevblock, check_header_signature)
+
+
+def test_validate_collation(chain):
+    collation = chain.generate_collation(shard_id=shard_id, coinbase=tester.a1, key=tester.k0)
+    state = add(chain, collation, check_header_signature=True)
+    assert state.trie.root_hash == collation.header.post_state_root
+    for stage in ('structure', 'signature', 'tx_root', 'execution'):
+        assert get_counter(stage, 'passed') == 1
+        assert metrics.histogram('collation_validation.{}.seconds'.format(stage)).count == 1
+
+
+def test_validate_collation_early_rejection(chain):
+    collation = chain.generate_collation(shard_id=shard_id, coinbase=tester.a1, key=tester.k0)
+
+    # Wrong shard
+    collation.header.shard_id = shard_id + 1
+    with pytest.raises(CollationValidationError) as e:
+        add(chain, collation)
+    assert e.value.stage == 'structure'
+    collation.header.shard_id = shard_id
+
+    # Wrong tx root: rejected before the execution
+    tx_list_root = collation.header.tx_list_root
+    collation.header.tx_list_root = utils.sha3(b'wrong root')
+    with pytest.raises(CollationValidationError) as e:
+        add(chain, collation)
+    assert e.value.stage == 'tx_root'
+    collation.header.tx_list_root = tx_list_root
+
+    assert get_counter('structure', 'rejected') == 1
+    assert get_counter('tx_root', 'rejected') == 1
+    assert get_counter('execution', 'passed') == 0
+    assert get_counter('execution', 'rejected') == 0
+
+
+def test_validate_collation_signature(chain):
+    # k1 isn't a validator, k0 is the only eligible proposer
+    collation = chain.generate_collation(shard_id=shard_id, coinbase=tester.a1, key=tester.k1)
+    # Not checked by default
+    add(chain, collation)
+    with pytest.raises(CollationValidationError) as e:
+        add(chain, collation, check_header_signature=True)
+    assert e.value.stage == 'signature'
+
+    collation.header.sig = sign(collation.header.signing_hash, tester.k0)
+    add(chain, collation, check_header_signature=True)
+    assert get_counter('signature', 'rejected') == 1
+    assert get_counter('signature', 'passed') == 1
@@ -1,5 +1,8 @@
 import pytest
 import logging
+from multiprocessing.pool import ThreadPool
+
+import rlp
 
 from ethereum.slogging import get_logger
 from ethereum.transaction_queue import TransactionQueue
@@ -7,6 +10,7 @@ from ethereum import utils
 from ethereum import trie
 from ethereum.exceptions import VerificationFailed
 from ethereum.state import State
+from ethereum.transactions import Transaction
 
 from sharding import collator
 from sharding.collation import Collation, CollationHeader
@@ -117,6 +121,31 @@ def test_apply_collation():
     assert collation.header.post_state_root == t.chain.shards[shard_id].state.trie.root_hash
 
 
+def test_apply_collation_preverify():
+    """Apply collation with the senders recovered in a pool first
+    """
+    shard_id = 1
+    t = chain(shard_id)
+
+    txqueue = TransactionQueue()
+    for i in range(5):
+        txqueue.add_transaction(t.generate_shard_tx(shard_id, tester.keys[2 + i], tester.a9, i + 1))
+    collation = t.generate_collation(shard_id=1, coinbase=tester.a1, key=tester.k1, txqueue=txqueue)
+    assert collation.transaction_count == 5
+    collation.transactions = [rlp.decode(rlp.encode(tx), Transaction) for tx in collation.transactions]
+
+    state = t.chain.shards[shard_id].state
+    period_start_prevblock = t.chain.get_block(collation.header.period_start_prevhash)
+    pool = ThreadPool(2)
+    try:
+        collator.apply_collation(state, collation, period_start_prevblock, t.chain.state, preverify_pool=pool)
+    finally:
+        pool.close()
+        pool.join()
+    assert all(tx._sender for tx in collation.transactions)
+    assert collation.header.post_state_root == state.trie.root_hash
+
+
 def test_apply_collation_wrong_root():
     """Test apply_collation with wrong roots in header
     test verify_execution_results
@@ -314,3 +343,55 @@ def test_verify_fast_sync_data():
             received_collation,
             depth=1,
         )
+
+
+def check_apply_collation_stateless(t, shard_id, collation):
+    shard = t.chain.shards[shard_id]
+    period_start_prevblock = t.chain.get_block(collation.header.period_start_prevhash)
+    prev_state_root = shard.mk_poststate_of_collation_hash(collation.header.parent_collation_hash).trie.root_hash
+
+    nodes, codes = collator.mk_witness(shard, collation, period_start_prevblock, t.chain.state)
+    post_state_root, reads, writes = collator.apply_collation_stateless(
+        prev_state_root, nodes, collation, period_start_prevblock, t.chain.state, shard.env.config,
+        shard_id=shard_id, codes=codes,
+    )
+    assert post_state_root == collation.header.post_state_root
+    assert prev_state_root in reads
+    assert reads <= set(utils.sha3(obj) for obj in nodes + codes)
+    # The post-state isn't in the witness
+    assert post_state_root not in set(utils.sha3(node) for node in nodes)
+    assert post_state_root in writes
+    assert all(utils.sha3(obj) == key for key, obj in writes.items())
+
+    # A node missing from the witness
+    with pytest.raises(KeyError):
+        collator.apply_collation_stateless(
+            prev_state_root, [node for node in nodes if utils.sha3(node) != prev_state_root],
+            collation, period_start_prevblock, t.chain.state, shard.env.config,
+            shard_id=shard_id, codes=codes,
+        )
+
+
+def test_apply_collation_stateless():
+    """Apply collation with only the witness of its pre-state
+    """
+    shard_id = 1
+    t = chain(shard_id)
+
+    txqueue = TransactionQueue()
+    tx1 = t.generate_shard_tx(shard_id, tester.k2, tester.a4, int(0.03 * utils.denoms.ether))
+    tx2 = t.generate_shard_tx(shard_id, tester.k3, tester.a5, int(0.03 * utils.denoms.ether))
+    txqueue.add_transaction(tx1)
+    txqueue.add_transaction(tx2)
+    collation = t.generate_collation(shard_id=shard_id, coinbase=tester.a1, key=tester.k1, txqueue=txqueue)
+    # On the genesis post-state
+    check_apply_collation_stateless(t, shard_id, collation)
+
+    # On the post-state of a collation
+    t.collate(shard_id, tester.k0)
+    t.mine(5)
+    txqueue = TransactionQueue()
+    txqueue.add_transaction(t.generate_shard_tx(shard_id, tester.k2, tester.a5, int(0.01 * utils.denoms.ether)))
+    collation = t.generate_collation(shard_id=shard_id, coinbase=tester.a1, key=tester.k1, txqueue=txqueue)
+    assert collation.header.number == 2
+    check_apply_collation_stateless(t, shard_id, collation)
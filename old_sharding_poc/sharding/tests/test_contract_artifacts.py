@@ -0,0 +1,71 @@
+import os
+import pytest
+
+from sharding import contract_artifacts
+from sharding.contract_artifacts import (
+    CACHE_DIR_ENV,
+    get_artifact_path,
+    get_contract_artifact,
+)
+from sharding.used_receipt_store_utils import URS_PATH
+from sharding.validator_manager_utils import VALMGR_PATH
+
+
+@pytest.fixture
+def cache_dir(tmpdir, monkeypatch):
+    monkeypatch.setenv(CACHE_DIR_ENV, str(tmpdir))
+    monkeypatch.setattr(contract_artifacts, '_artifacts', {})
+    return str(tmpdir)
+
+
+def test_contract_artifact_cache(cache_dir, monkeypatch):
+    code = open(VALMGR_PATH).read()
+    path = get_artifact_path(VALMGR_PATH, code)
+    assert os.path.dirname(path) == cache_dir
+    assert not os.path.exists(path)
+
+    artifact = get_contract_artifact(VALMGR_PATH)
+    assert os.path.exists(path)
+    assert artifact['bytecode']
+    assert any(item.get('name') == 'add_header' for item in artifact['abi'])
+
+    # Cache hit: loaded from the disk without compiling
+    def fail_compile(code):
+        raise AssertionError('compiled on a cache hit')
+    monkeypatch.setattr(contract_artifacts, '_compile', fail_compile)
+    monkeypatch.setattr(contract_artifacts, '_artifacts', {})
+    assert get_contract_artifact(VALMGR_PATH) == artifact
+
+
+def test_contract_artifact_key(cache_dir, monkeypatch):
+    valmgr_path = get_artifact_path(VALMGR_PATH, open(VALMGR_PATH).read())
+    urs_path = get_artifact_path(URS_PATH, open(URS_PATH).read())
+    assert valmgr_path != urs_path
+    # Another source
+    assert get_artifact_path(VALMGR_PATH, '# changed\n') != valmgr_path
+    # Another compiler version
+    monkeypatch.setattr(contract_artifacts, '_compiler_version', '0.0.0-test')
+    version_path = get_artifact_path(VALMGR_PATH, open(VALMGR_PATH).read())
+    assert version_path != valmgr_path
+    # Another compiler source with the same version
+    monkeypatch.setattr(contract_artifacts, '_compiler_source_hash', '00' * 32)
+    assert get_artifact_path(VALMGR_PATH, open(VALMGR_PATH).read()) not in (valmgr_path, version_path)
+
+
+def test_compiler_source_hash(monkeypatch):
+    monkeypatch.setattr(contract_artifacts, '_compiler_source_hash', None)
+    source_hash = contract_artifacts.get_compiler_source_hash()
+    assert len(source_hash) == 64
+    monkeypatch.setattr(contract_artifacts, '_compiler_source_hash', None)
+    assert contract_artifacts.get_compiler_source_hash() == source_hash
+
+
+def test_contract_artifact_corrupted(cache_dir):
+    path = get_artifact_path(URS_PATH, open(URS_PATH).read())
+    with open(path, 'w') as f:
+        f.write('{"bytecode": ')
+    artifact = get_contract_artifact(URS_PATH)
+    assert artifact['bytecode']
+    # Rewritten
+    contract_artifacts._artifacts.clear()
+    assert get_contract_artifact(URS_PATH) == artifact
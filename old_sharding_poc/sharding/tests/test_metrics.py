@@ -0,0 +1,52 @@
+import threading
+
+import pytest
+
+from sharding.metrics import (
+    Histogram,
+    Metrics,
+)
+
+
+def test_histogram():
+    histogram = Histogram(buckets=(1, 10))
+    for value in (0.5, 1, 5, 100):
+        histogram.observe(value)
+    assert histogram.counts == [2, 1, 1]
+    assert histogram.count == 4
+    assert histogram.mean == 106.5 / 4
+
+
+def test_metrics():
+    m = Metrics()
+    m.counter('a').inc()
+    m.counter('a').inc(2)
+    assert m.counter('a').value == 3
+
+    with m.timer('t'):
+        pass
+    with pytest.raises(ValueError):
+        with m.timer('t'):
+            raise ValueError()
+    assert m.histogram('t').count == 2
+    assert m.to_dict()['counters'] == {'a': 3}
+    assert m.to_dict()['histograms']['t']['count'] == 2
+
+    m.reset()
+    assert m.to_dict() == {'counters': {}, 'histograms': {}}
+
+
+def test_metrics_threads():
+    m = Metrics()
+
+    def work():
+        for _ in range(1000):
+            m.counter('a').inc()
+            m.histogram('t').observe(0.5)
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert m.counter('a').value == 8000
+    assert m.histogram('t').count == 8000
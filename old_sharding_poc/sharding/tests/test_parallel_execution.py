@@ -0,0 +1,132 @@
+import pytest
+
+from ethereum.exceptions import InvalidNonce
+from ethereum.transaction_queue import TransactionQueue
+
+from sharding import collator
+from sharding.parallel_execution import (
+    RecordingStateView,
+    apply_transactions_optimistically,
+)
+from sharding.receipt_consuming_tx_utils import apply_shard_transaction
+from sharding.tools import tester
+from sharding.tools.workload import Workload
+
+SHARD_ID = 1
+
+
+def mk_shard_state(workload):
+    c = tester.Chain(env='sharding', deploy_sharding_contracts=True)
+    c.mine(5)
+    c.add_test_shard(SHARD_ID, setup_urs_contracts=False, alloc=workload.mk_alloc())
+    state = c.chain.shards[SHARD_ID].state
+    state.block_coinbase = tester.a1
+    return c, state
+
+
+def apply_sequentially(state, txs):
+    for tx in txs:
+        apply_shard_transaction(None, state, None, tx)
+
+
+def assert_same_results(state1, state2):
+    assert state1.trie.root_hash == state2.trie.root_hash
+    assert state1.gas_used == state2.gas_used
+    assert state1.bloom == state2.bloom
+    assert state1.txindex == state2.txindex
+    assert [r.state_root for r in state1.receipts] == [r.state_root for r in state2.receipts]
+    assert [r.gas_used for r in state1.receipts] == [r.gas_used for r in state2.receipts]
+
+
+def test_recording_state_view():
+    workload = Workload(num_senders=2)
+    _, state = mk_shard_state(workload)
+    sender = workload.senders[0]
+    view = RecordingStateView(state)
+
+    view.delta_balance(sender, -1)
+    assert view.reads == set([(sender, 'balance')])
+    # The coinbase deltas are accumulated without reading the balance
+    balance = state.get_balance(tester.a1)
+    view.delta_balance(tester.a1, 10)
+    view.delta_balance(tester.a1, 5)
+    assert (tester.a1, 'balance') not in view.reads
+    assert view.coinbase_delta == 15
+    assert view.get_written_keys() == set([(sender, 'balance'), (tester.a1, 'balance')])
+    # Reading it is a real read
+    assert view.get_balance(tester.a1) == balance + 15
+    assert (tester.a1, 'balance') in view.reads
+
+    snapshot = view.snapshot()
+    view.delta_balance(tester.a1, 1)
+    view.revert(snapshot)
+    assert view.coinbase_delta == 15
+    assert view.replayable
+    view.del_account(sender)
+    assert not view.replayable
+
+
+@pytest.mark.parametrize(
+    'num_senders, conflict_rate, expected_reexecuted',
+    [
+        (20, 0.0, 0),
+        (20, 0.5, None),
+        (20, 1.0, 19),
+        # The txs of the same sender always conflict on the nonce
+        (1, 0.0, 19),
+    ]
+)
+def test_apply_transactions_optimistically(num_senders, conflict_rate, expected_reexecuted):
+    workload = Workload(num_senders=num_senders)
+    _, state = mk_shard_state(workload)
+    txs = workload.mk_transfer_txs(state, 20, conflict_rate=conflict_rate)
+
+    sequential_state = state.ephemeral_clone()
+    apply_sequentially(sequential_state, txs)
+    outputs, reexecuted = apply_transactions_optimistically(None, state, None, txs)
+
+    assert len(outputs) == len(txs)
+    assert all(success == 1 for success, _ in outputs)
+    assert_same_results(state, sequential_state)
+    if expected_reexecuted is not None:
+        assert reexecuted == expected_reexecuted
+    assert state.get_balance(workload.hot_recipient) == sequential_state.get_balance(workload.hot_recipient)
+
+
+def test_apply_transactions_optimistically_invalid_tx():
+    workload = Workload(num_senders=2)
+    _, state = mk_shard_state(workload)
+    txs = workload.mk_transfer_txs(state, 4)
+    # Skip a nonce
+    workload.next_nonce(state, workload.senders[0])
+    txs.append(workload.mk_transfer_tx(state, 0, workload.new_recipient()))
+
+    sequential_state = state.ephemeral_clone()
+    with pytest.raises(InvalidNonce):
+        apply_sequentially(sequential_state, txs)
+    with pytest.raises(InvalidNonce):
+        apply_transactions_optimistically(None, state, None, txs)
+    assert_same_results(state, sequential_state)
+
+
+def test_apply_collation_optimistic():
+    """Apply the same collation with the sequential and the optimistic paths
+    """
+    t = tester.Chain(env='sharding', deploy_sharding_contracts=True)
+    t.mine(5)
+    t.add_test_shard(SHARD_ID)
+
+    txqueue = TransactionQueue()
+    for i in range(3):
+        txqueue.add_transaction(t.generate_shard_tx(SHARD_ID, tester.keys[2 + i], tester.a9, i + 1))
+    txqueue.add_transaction(t.generate_shard_tx(SHARD_ID, tester.k5, tester.a6, 1))
+    collation = t.generate_collation(shard_id=SHARD_ID, coinbase=tester.a1, key=tester.k1, txqueue=txqueue)
+    assert collation.transaction_count == 4
+
+    period_start_prevblock = t.chain.get_block(collation.header.period_start_prevhash)
+    state = t.chain.shards[SHARD_ID].state
+    sequential_state = state.ephemeral_clone()
+    collator.apply_collation(sequential_state, collation, period_start_prevblock, t.chain.state, SHARD_ID)
+    collator.apply_collation(state, collation, period_start_prevblock, t.chain.state, SHARD_ID, optimistic=True)
+    assert collation.header.post_state_root == state.trie.root_hash
+    assert_same_results(state, sequential_state)
@@ -0,0 +1,99 @@
+import pytest
+
+from ethereum import utils
+
+from sharding.config import sharding_config
+from sharding.proposer_schedule import ProposerSchedule
+from sharding.tools import tester as t
+from sharding.validator_manager_utils import call_valmgr
+
+
+@pytest.fixture
+def chain():
+    c = t.Chain(env='sharding', deploy_sharding_contracts=True)
+    c.mine(5)
+    valcode_addrs = []
+    for privkey in (t.k0, t.k1, t.k2):
+        valcode_addr = c.sharding_valcode_addr(privkey)
+        c.sharding_deposit(privkey, valcode_addr)
+        valcode_addrs.append(valcode_addr)
+    c.mine(sharding_config['SHUFFLING_CYCLE_LENGTH'])
+    c.valcode_addrs = valcode_addrs
+    return c
+
+
+def get_eligible_proposer(state, shard_id, period):
+    addr = call_valmgr(state, 'get_eligible_proposer', [shard_id, period])
+    return utils.zpad(utils.int_to_big_endian(int(addr, 16)), 20)
+
+
+def test_proposer_schedule_matches_contract(chain):
+    state = chain.head_state
+    schedule = ProposerSchedule()
+    window = schedule.update(state)
+    assert len(window) == sharding_config['LOOKAHEAD_PERIODS'] + 1
+    for period in window:
+        for shard_id in range(5):
+            assert schedule.get_proposer(shard_id, period) == get_eligible_proposer(state, shard_id, period)
+
+    # Reverse lookup
+    period = window[-1]
+    for valcode_addr in chain.valcode_addrs:
+        for shard_id in schedule.get_proposer_shards(valcode_addr, period):
+            assert schedule.get_proposer(shard_id, period) == valcode_addr
+    assert sum(
+        len(schedule.get_proposer_shards(valcode_addr, period))
+        for valcode_addr in chain.valcode_addrs
+    ) == sharding_config['SHARD_COUNT']
+
+    # Not computed
+    assert schedule.get_proposer(0, window[-1] + 1) is None
+    assert schedule.get_proposer_shards(chain.valcode_addrs[0], window[-1] + 1) == []
+
+
+def test_proposer_schedule_update(chain):
+    schedule = ProposerSchedule()
+    window = schedule.update(chain.head_state)
+    cached = dict(schedule.schedules)
+
+    # The schedules are reused in the next period, and the past ones are dropped
+    chain.mine(sharding_config['PERIOD_LENGTH'])
+    new_window = schedule.update(chain.head_state)
+    assert new_window[0] == window[0] + 1
+    assert window[0] not in schedule.schedules
+    for period in window[1:]:
+        assert schedule.schedules[period] is cached[period]
+
+    # A new validator changes the validator set
+    valcode_addr = chain.sharding_valcode_addr(t.k3)
+    chain.sharding_deposit(t.k3, valcode_addr)
+    chain.mine(1)
+    schedule.update(chain.head_state)
+    for period in window[1:]:
+        assert schedule.schedules[period] is not cached[period]
+
+
+def test_proposer_schedule_update_on_head(chain):
+    schedule = chain.chain.proposer_schedule
+    chain.mine(sharding_config['PERIOD_LENGTH'])
+    expected = ProposerSchedule()
+    window = expected.update(chain.chain.state)
+    assert sorted(schedule.schedules) == list(window)
+    for period in window:
+        assert schedule.schedules[period].proposers == expected.schedules[period].proposers
+
+
+def test_proposer_schedule_invalidate_on_reorg(chain):
+    schedule = chain.chain.proposer_schedule
+    window = schedule.update(chain.head_state)
+    cached = dict(schedule.schedules)
+    # The seed block of the last period in the window
+    seed_block_number = schedule.get_seed_block_number(window[-1])
+    fork_block = chain.chain.get_block_by_number(seed_block_number)
+
+    chain.change_head(fork_block.header.prevhash)
+    chain.mine(chain.chain.head.number - seed_block_number + 3)
+    assert chain.chain.get_block_by_number(seed_block_number).header.hash != fork_block.header.hash
+    # The schedule of the replaced seed block is recomputed for the new head
+    assert schedule.schedules[window[-1]] is not cached[window[-1]]
+    assert schedule.schedules[window[-1]].seed != cached[window[-1]].seed
@@ -0,0 +1,131 @@
+import pytest
+
+from ethereum import utils
+from ethereum.messages import (
+    Log,
+    Receipt,
+)
+
+from sharding import collator
+from sharding.receipt_index import ReceiptIndex
+from sharding.receipt_consuming_tx_utils import is_receipt_consuming_tx
+from sharding.tools import tester as t
+from sharding.validator_manager_utils import (
+    TX_TO_SHARD_TOPIC,
+    get_valmgr_addr,
+    get_valmgr_ct,
+)
+from sharding.config import sharding_config
+
+
+def mk_tx_to_shard_receipt(shard_id, receipt_id, to=t.a1, addr=None, value=500000, startgas=100000):
+    topics = [
+        utils.big_endian_to_int(TX_TO_SHARD_TOPIC),
+        utils.big_endian_to_int(to),
+        shard_id,
+    ]
+    data = utils.encode_int32(receipt_id) + utils.encode_int32(value) + utils.encode_int32(startgas)
+    log = Log(addr or get_valmgr_addr(), topics, data)
+    return Receipt(b'', 0, [log])
+
+
+@pytest.fixture
+def chain():
+    c = t.Chain(env='sharding', deploy_sharding_contracts=True)
+    c.mine(5)
+    return c
+
+
+def test_receipt_index_connect_disconnect():
+    index = ReceiptIndex()
+    block_a, block_b = b'\x0a' * 32, b'\x0b' * 32
+    index.add_block_receipts(block_a, [
+        mk_tx_to_shard_receipt(1, 0),
+        mk_tx_to_shard_receipt(2, 1),
+    ])
+    index.add_block_receipts(block_b, [
+        mk_tx_to_shard_receipt(1, 2),
+        # Not emitted by validator manager contract
+        mk_tx_to_shard_receipt(1, 3, addr=b'\x35' * 20),
+    ])
+    assert index.get_receipt_ids(1) == []
+
+    assert index.connect_block(block_a)
+    assert index.connect_block(block_b)
+    assert not index.connect_block(block_b)
+    assert index.get_receipt_ids(1) == [0, 2]
+    assert index.get_receipt_ids(2) == [1]
+    assert index.get_receipts(2) == [(1, t.a1, 500000, 100000)]
+
+    # Reorg: block_b leaves the canonical chain
+    assert index.disconnect_block(block_b)
+    assert not index.disconnect_block(block_b)
+    assert index.get_receipt_ids(1) == [0]
+    assert not index.has_receipt(1, 2)
+
+    # Unknown block
+    assert not index.connect_block(b'\x0c' * 32)
+
+    # The receipts of a pruned canonical block stay in the index
+    index.prune_block(block_a)
+    index.prune_block(block_b)
+    assert not index.block_receipts
+    assert not index.canonical_blocks
+    assert index.get_receipt_ids(1) == [0]
+
+
+def test_receipt_index_on_main_chain(chain):
+    valmgr = t.ABIContract(chain, get_valmgr_ct(), get_valmgr_addr())
+    receipt_id_0 = valmgr.tx_to_shard(t.a1, 0, 100000, 1, b'', sender=t.k0, value=500000)
+    receipt_id_1 = valmgr.tx_to_shard(t.a2, 1, 100000, 1, b'', sender=t.k0, value=500000)
+    block = chain.mine(1)
+    assert chain.chain.receipt_index.get_receipt_ids(0) == [receipt_id_0]
+    assert chain.chain.receipt_index.get_receipts(1) == [(receipt_id_1, t.a2, 500000, 100000)]
+
+    # Fork from the parent block and make the fork the canonical chain
+    chain.change_head(block.header.prevhash)
+    chain.mine(2)
+    assert chain.chain.head.number == block.number + 1
+    assert chain.chain.receipt_index.get_receipt_ids(0) == []
+    assert chain.chain.receipt_index.get_receipt_ids(1) == []
+
+
+def test_receipt_index_pruned_with_history(chain):
+    chain.chain.max_history = 2
+    valmgr = t.ABIContract(chain, get_valmgr_ct(), get_valmgr_addr())
+    receipt_id = valmgr.tx_to_shard(t.a1, 0, 100000, 1, b'', sender=t.k0, value=500000)
+    block = chain.mine(1)
+    assert block.header.hash in chain.chain.receipt_index.block_receipts
+    chain.mine(2)
+    assert block.header.hash not in chain.chain.receipt_index.block_receipts
+    assert chain.chain.receipt_index.get_receipt_ids(0) == [receipt_id]
+
+
+def test_create_collation_consume_receipts(chain):
+    shard_id = 1
+    valcode_addr = chain.sharding_valcode_addr(t.k0)
+    chain.sharding_deposit(t.k0, valcode_addr)
+    chain.mine(sharding_config['SHUFFLING_CYCLE_LENGTH'])
+    chain.add_test_shard(shard_id)
+
+    to_addr = utils.privtoaddr(utils.sha3("test_to_addr"))
+    valmgr = t.ABIContract(chain, get_valmgr_ct(), get_valmgr_addr())
+    receipt_id = valmgr.tx_to_shard(to_addr, shard_id, 100000, 1, b'', sender=t.k0, value=500000)
+    # The value can't pay for startgas * gasprice
+    valmgr.tx_to_shard(to_addr, shard_id, 100000, 1, b'', sender=t.k0, value=1)
+    chain.mine(5)
+
+    collation = collator.create_collation(
+        chain.chain,
+        shard_id,
+        chain.chain.shards[shard_id].head_hash,
+        chain.chain.get_expected_period_number(),
+        coinbase=t.a1,
+        key=t.k1,
+        consume_receipts=True,
+    )
+    assert collation.transaction_count == 1
+    rctx = collation.transactions[0]
+    assert is_receipt_consuming_tx(rctx)
+    assert rctx.r == receipt_id
+    assert rctx.to == to_addr
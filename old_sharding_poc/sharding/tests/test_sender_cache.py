@@ -0,0 +1,123 @@
+import threading
+
+import rlp
+
+from ethereum import transactions
+from ethereum import utils
+from ethereum.transaction_queue import TransactionQueue
+from ethereum.transactions import Transaction
+
+from sharding import collator
+from sharding.config import sharding_config
+from sharding.contract_utils import extract_sender_from_tx
+from sharding.sender_cache import (
+    SenderCache,
+    sender_cache,
+    sign_tx,
+)
+from sharding.tools import tester
+
+
+def copy_tx(tx):
+    # A new object, whose sender isn't recovered yet
+    return rlp.decode(rlp.encode(tx), Transaction)
+
+
+def test_sender_cache():
+    cache = SenderCache(max_size=2)
+    txs = [Transaction(i, 1, 21000, tester.a1, 0, b'').sign(tester.k0) for i in range(3)]
+    assert cache.hit_rate == 0.0
+
+    assert cache.get_sender(copy_tx(txs[0])) == tester.a0
+    assert (cache.hits, cache.misses) == (0, 1)
+    tx = copy_tx(txs[0])
+    assert cache.get_sender(tx) == tester.a0
+    assert tx._sender == tester.a0
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert cache.hit_rate == 0.5
+
+    # A locally signed tx doesn't need to be recovered, but the sender it
+    # carries isn't cached
+    assert cache.get_sender(txs[1]) == tester.a0
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert txs[1] not in cache
+    tx = copy_tx(txs[1])
+    tx._sender = tester.a5
+    assert cache.get_sender(tx) == tester.a5
+    assert cache.get_sender(copy_tx(txs[1])) == tester.a0
+    assert (cache.hits, cache.misses) == (1, 2)
+
+    # Bounded: txs[0] is evicted
+    cache.get_sender(copy_tx(txs[2]))
+    assert len(cache) == 2
+    cache.get_sender(copy_tx(txs[0]))
+    assert (cache.hits, cache.misses) == (1, 4)
+
+    # Same fields with another signature is another key
+    tx = Transaction(0, 1, 21000, tester.a1, 0, b'').sign(tester.k1)
+    assert cache.get_sender(copy_tx(tx)) == tester.a1
+
+
+def test_sign_tx():
+    tx = sign_tx(Transaction(0, 1, 21000, tester.a1, 0, b''), tester.k3)
+    assert tx._sender == tester.a3
+    assert tx in sender_cache
+    hits = sender_cache.hits
+    assert sender_cache.get_sender(copy_tx(tx)) == tester.a3
+    assert sender_cache.hits == hits + 1
+
+
+def test_sender_cache_threads():
+    cache = SenderCache(max_size=4)
+    txs = [Transaction(i, 1, 21000, tester.a1, 0, b'').sign(tester.k0) for i in range(8)]
+    tx_copies = [[copy_tx(tx) for tx in txs] for _ in range(4)]
+
+    def work(copies):
+        for tx in copies:
+            assert cache.get_sender(tx) == tester.a0
+    threads = [threading.Thread(target=work, args=(copies,)) for copies in tx_copies]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert cache.hits + cache.misses == 32
+    assert len(cache) == 4
+    assert all(tx._sender == tester.a0 for copies in tx_copies for tx in copies)
+
+
+def test_extract_sender_from_tx():
+    tx = Transaction(0, 1, 21000, tester.a1, 0, b'').sign(tester.k2)
+    assert extract_sender_from_tx(copy_tx(tx)) == tester.a2
+    hits = sender_cache.hits
+    assert extract_sender_from_tx(copy_tx(tx)) == tester.a2
+    assert sender_cache.hits == hits + 1
+
+
+def test_replay_collation_skips_ecrecover(monkeypatch):
+    shard_id = 1
+    t = tester.Chain(env='sharding', deploy_sharding_contracts=True)
+    t.mine(5)
+    valcode_addr = t.sharding_valcode_addr(tester.k0)
+    t.sharding_deposit(tester.k0, valcode_addr)
+    t.mine(sharding_config['SHUFFLING_CYCLE_LENGTH'])
+    t.add_test_shard(shard_id)
+
+    txqueue = TransactionQueue()
+    txqueue.add_transaction(t.generate_shard_tx(shard_id, tester.k2, tester.a4, int(0.03 * utils.denoms.ether)))
+    txqueue.add_transaction(t.generate_shard_tx(shard_id, tester.k3, tester.a5, int(0.03 * utils.denoms.ether)))
+    collation = t.generate_collation(shard_id=shard_id, coinbase=tester.a1, key=tester.k1, txqueue=txqueue)
+    assert collation.transaction_count == 2
+
+    # Replay the collation with txs received from the network
+    collation.transactions = [copy_tx(tx) for tx in collation.transactions]
+
+    def fail_ecrecover(*args):
+        raise AssertionError('ecrecover called')
+    monkeypatch.setattr(transactions, 'ecrecover_to_pub', fail_ecrecover)
+
+    hits = sender_cache.hits
+    state = t.chain.shards[shard_id].state
+    period_start_prevblock = t.chain.get_block(collation.header.period_start_prevhash)
+    collator.apply_collation(state, collation, period_start_prevblock, t.chain.state)
+    assert collation.header.post_state_root == state.trie.root_hash
+    assert sender_cache.hits == hits + 2
@@ -0,0 +1,73 @@
+import pytest
+
+from ethereum import utils
+
+from sharding import shard_assignment
+from sharding.config import sharding_config
+from sharding.shard_assignment import (
+    ShardAssignment,
+    get_cycle_seed,
+    get_shard_assignment,
+)
+from sharding.tools import tester as t
+from sharding.validator_manager_utils import (
+    get_shard_list,
+    get_validation_code_addrs,
+)
+
+
+@pytest.fixture
+def chain():
+    c = t.Chain(env='sharding', deploy_sharding_contracts=True)
+    c.mine(5)
+    return c
+
+
+def deposit_validators(chain, keys):
+    valcode_addrs = []
+    for privkey in keys:
+        valcode_addr = chain.sharding_valcode_addr(privkey)
+        chain.sharding_deposit(privkey, valcode_addr)
+        valcode_addrs.append(valcode_addr)
+    chain.mine(sharding_config['SHUFFLING_CYCLE_LENGTH'])
+    return valcode_addrs
+
+
+def test_shard_assignment():
+    addrs = [utils.sha3(utils.encode_int32(i))[-20:] for i in range(10)]
+    # An empty slot
+    addrs[3] = b'\x00' * 20
+    assignment = ShardAssignment(b'\x35' * 32, addrs)
+    assert len(assignment.indices) == sharding_config['SHARD_COUNT'] * sharding_config['NUM_VALIDATORS_PER_CYCLE']
+    assert all(0 <= i < len(addrs) for i in assignment.indices)
+    assert assignment.get_shard_ids(addrs[3]) == []
+    for addr in addrs[:3] + addrs[4:]:
+        shard_list = assignment.get_shard_list(addr)
+        assert len(shard_list) == sharding_config['SHARD_COUNT']
+        assert [i for i, x in enumerate(shard_list) if x] == assignment.get_shard_ids(addr)
+    # With 9 validators and 100 samples per shard, every validator is sampled
+    # in almost all the shards
+    assert len(assignment.get_shard_ids(addrs[0])) > 90
+
+    # No validators
+    assert ShardAssignment(b'\x35' * 32, []).get_shard_list(addrs[0]) == [False] * sharding_config['SHARD_COUNT']
+
+
+def test_shard_assignment_matches_contract(chain):
+    valcode_addrs = deposit_validators(chain, [t.k0, t.k1, t.k2])
+    state = chain.head_state
+    assert get_validation_code_addrs(state) == valcode_addrs
+    assignment = get_shard_assignment(state)
+    assert assignment.cycle_seed == get_cycle_seed(state)
+    for valcode_addr in valcode_addrs + [t.a9]:
+        assert assignment.get_shard_list(valcode_addr) == get_shard_list(state, valcode_addr)
+    # Cached
+    assert get_shard_assignment(state) is assignment
+
+    # Withdraw a validator: the slot becomes empty
+    chain.sharding_withdraw(t.k1, 1)
+    chain.mine(sharding_config['SHUFFLING_CYCLE_LENGTH'])
+    state = chain.head_state
+    assert get_validation_code_addrs(state)[1] == b'\x00' * 20
+    for valcode_addr in valcode_addrs:
+        assert shard_assignment.get_shard_list(state, valcode_addr) == get_shard_list(state, valcode_addr)
@@ -0,0 +1,105 @@
+import pytest
+
+from ethereum import utils
+from ethereum.transaction_queue import TransactionQueue
+
+from sharding.metrics import metrics
+from sharding.tools import tester
+
+shard_ids = [1, 2, 3]
+
+
+@pytest.fixture
+def chain():
+    c = tester.Chain(env='sharding', deploy_sharding_contracts=True)
+    c.mine(5)
+    for shard_id in shard_ids:
+        c.add_test_shard(shard_id, setup_urs_contracts=False)
+    metrics.reset()
+    return c
+
+
+def mk_collation(chain, shard_id):
+    txqueue = TransactionQueue()
+    for i in range(2):
+        txqueue.add_transaction(chain.generate_shard_tx(shard_id, tester.keys[2 + i], tester.a9, shard_id))
+    return chain.generate_collation(shard_id=shard_id, coinbase=tester.a1, key=tester.k1, txqueue=txqueue)
+
+
+def test_import_collations(chain):
+    collations = [mk_collation(chain, shard_id) for shard_id in shard_ids]
+    importer = chain.chain.start_shard_importer(processes=2)
+    assert importer.shard_ids == shard_ids
+    # The order of the collations doesn't matter
+    added = chain.chain.import_collations(chain.chain.head, collations[::-1])
+    chain.chain.stop_shard_importer()
+
+    assert added == dict((shard_id, True) for shard_id in shard_ids)
+    for collation in collations:
+        assert importer.get_head_hash(collation.header.shard_id) == collation.header.hash
+    assert metrics.counter('shard_import.collations').value == len(shard_ids)
+
+
+def test_import_collations_head(chain):
+    importer = chain.chain.start_shard_importer(processes=2)
+    collations = [mk_collation(chain, shard_id) for shard_id in shard_ids]
+    chain.chain.import_collations(chain.chain.head, collations)
+    for collation in collations:
+        assert chain.chain.get_shard_head_hash(collation.header.shard_id) == collation.header.hash
+
+    # The next collations are on the next snapshot of the main chain. The
+    # shards of this process don't have the collations of the workers, so
+    # the parent is added to build the next collation on.
+    shard = chain.chain.shards[1]
+    assert shard.add_collation(collations[0], chain.chain.get_block(collations[0].header.period_start_prevhash))
+    chain.mine(5)
+    next_collation = chain.generate_collation(
+        shard_id=1, coinbase=tester.a1, key=tester.k1, txqueue=TransactionQueue(),
+        parent_collation_hash=collations[0].header.hash)
+    assert chain.chain.import_collations(chain.chain.head, [next_collation]) == {1: True}
+    assert chain.chain.get_shard_head_hash(1) == next_collation.header.hash
+    assert chain.chain.get_shard_head_hash(2) == collations[1].header.hash
+    chain.chain.stop_shard_importer()
+    assert importer.pool.processes == []
+
+
+def test_import_collations_invalid(chain):
+    collations = [mk_collation(chain, shard_id) for shard_id in shard_ids]
+    collations[1].header.tx_list_root = utils.sha3(b'wrong root')
+    genesis_hash = chain.chain.shards[2].head_hash
+    chain.chain.start_shard_importer(processes=2)
+    added = chain.chain.import_collations(chain.chain.head, collations)
+
+    assert added == {1: True, 2: False, 3: True}
+    assert chain.chain.get_shard_head_hash(1) == collations[0].header.hash
+    assert chain.chain.get_shard_head_hash(2) == genesis_hash
+    assert chain.chain.get_shard_head_hash(3) == collations[2].header.hash
+    chain.chain.stop_shard_importer()
+
+
+def test_import_collations_in_process(chain):
+    # A shard tracked after the importer started is imported in this process
+    chain.chain.start_shard_importer(processes=1)
+    chain.add_test_shard(4, setup_urs_contracts=False)
+    collations = [mk_collation(chain, shard_id) for shard_id in shard_ids + [4]]
+    added = chain.chain.import_collations(chain.chain.head, collations)
+    chain.chain.stop_shard_importer()
+
+    assert added == dict((shard_id, True) for shard_id in shard_ids + [4])
+    shard = chain.chain.shards[4]
+    assert shard.head_hash == collations[-1].header.hash
+    assert shard.head_collation_of_block[chain.chain.head_hash] == collations[-1].header.hash
+    state = shard.mk_poststate_of_collation_hash(collations[-1].header.hash)
+    assert state.trie.root_hash == collations[-1].header.post_state_root
+    # The shards of the importer aren't added in this process
+    assert collations[0].header.hash not in chain.chain.shards[1].db
+
+
+def test_import_collations_duplicate_shard(chain):
+    collations = [mk_collation(chain, 1), mk_collation(chain, 1)]
+    with pytest.raises(AssertionError):
+        chain.chain.import_collations(chain.chain.head, collations)
+    chain.chain.start_shard_importer(processes=1)
+    with pytest.raises(AssertionError):
+        chain.chain.import_collations(chain.chain.head, collations)
+    chain.chain.stop_shard_importer()
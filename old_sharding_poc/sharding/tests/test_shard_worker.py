@@ -0,0 +1,133 @@
+import json
+import os
+
+import pytest
+
+from ethereum import utils
+from ethereum.transaction_queue import TransactionQueue
+
+from sharding.shard_worker import (
+    ShardProcessPool,
+    SnapshotMainChain,
+    mk_main_chain_snapshot,
+    write_snapshot,
+)
+from sharding.tools import tester
+from sharding.validator_manager_utils import call_valmgr
+
+shard_ids = [1, 2]
+
+
+@pytest.fixture
+def chain():
+    c = tester.Chain(env='sharding', deploy_sharding_contracts=True)
+    c.mine(5)
+    for shard_id in shard_ids:
+        c.add_test_shard(shard_id, setup_urs_contracts=False)
+    return c
+
+
+def get_genesis_snapshot(chain, shard_id):
+    shard = chain.chain.shards[shard_id]
+    return json.loads(shard.db.get(b'SHARD_' + utils.to_string(shard_id) + b'_GENESIS_STATE'))
+
+
+def mk_collation(chain, shard_id):
+    txqueue = TransactionQueue()
+    txqueue.add_transaction(chain.generate_shard_tx(shard_id, tester.k2, tester.a9, shard_id))
+    return chain.generate_collation(shard_id=shard_id, coinbase=tester.a1, key=tester.k1, txqueue=txqueue)
+
+
+def test_main_chain_snapshot(chain, tmpdir):
+    path = str(tmpdir.join('snapshot_0.bin'))
+    known = set()
+    snapshot = mk_main_chain_snapshot(chain.chain, num_headers=3, known=known)
+    write_snapshot(path, snapshot)
+    main_chain = SnapshotMainChain(chain.chain.env.config)
+    main_chain.load(path)
+
+    assert main_chain.head_hash == chain.chain.head_hash
+    assert len(main_chain.blocks) == 3
+    assert main_chain.get_block(chain.chain.head_hash).header == chain.chain.head.header
+    assert main_chain.get_block(chain.chain.get_block_by_number(0).header.hash) is None
+    # The validator manager can be called on the snapshot
+    assert call_valmgr(main_chain.state, 'get_collation_gas_limit', []) == \
+        call_valmgr(chain.chain.state, 'get_collation_gas_limit', [])
+
+    # The next snapshot only carries the new objects
+    valcode_addr = chain.sharding_valcode_addr(tester.k3)
+    chain.sharding_deposit(tester.k3, valcode_addr)
+    chain.mine(1)
+    next_snapshot = mk_main_chain_snapshot(chain.chain, num_headers=3, known=known)
+    assert next_snapshot['objects']
+    assert not set(next_snapshot['objects']) & set(snapshot['objects'])
+    path = str(tmpdir.join('snapshot_1.bin'))
+    write_snapshot(path, next_snapshot)
+    main_chain.load(path)
+
+    assert main_chain.head_hash == chain.chain.head_hash
+    assert call_valmgr(main_chain.state, 'get_validators_max_index', []) == \
+        call_valmgr(chain.chain.state, 'get_validators_max_index', [])
+    assert main_chain.state.get_code(valcode_addr) == chain.chain.state.get_code(valcode_addr)
+
+
+def test_shard_process_pool(chain):
+    pool = ShardProcessPool(chain.chain)
+    # One worker per shard
+    for shard_id in shard_ids:
+        pool.start_worker({shard_id: get_genesis_snapshot(chain, shard_id)})
+    path = pool.publish_snapshot()
+
+    collations = [mk_collation(chain, shard_id) for shard_id in shard_ids]
+    invalid_collation = mk_collation(chain, 2)
+    invalid_collation.header.tx_list_root = utils.sha3(b'wrong root')
+    for collation in [invalid_collation] + collations[::-1]:
+        pool.submit(collation)
+    heads = pool.collect()
+    # Both workers loaded the snapshot before they added the collations
+    assert not os.path.exists(path)
+    pool.close()
+
+    assert heads == dict((c.header.shard_id, c.header.hash) for c in collations)
+    for collation in collations:
+        assert pool.get_head_hash(collation.header.shard_id) == collation.header.hash
+    assert pool.collect() == {}
+
+
+def test_shard_process_pool_late_worker(chain):
+    pool = ShardProcessPool(chain.chain)
+    pool.start_worker({1: get_genesis_snapshot(chain, 1)})
+    pool.publish_snapshot()
+    chain.sharding_deposit(tester.k3, chain.sharding_valcode_addr(tester.k3))
+    chain.mine(1)
+    # The first worker gets the objects it misses before the new worker's
+    # full snapshot, which the next snapshots are relative to
+    pool.start_worker({2: get_genesis_snapshot(chain, 2)})
+    chain.mine(1)
+    pool.publish_snapshot()
+
+    collations = [mk_collation(chain, shard_id) for shard_id in shard_ids]
+    for collation in collations:
+        pool.submit(collation)
+    heads = pool.collect()
+    assert not os.listdir(pool.snapshot_dir)
+    pool.close()
+
+    assert heads == dict((c.header.shard_id, c.header.hash) for c in collations)
+
+
+def test_shard_process_pool_worker_error(chain):
+    pool = ShardProcessPool(chain.chain)
+    pool.start_worker({1: get_genesis_snapshot(chain, 1)})
+    # The worker doesn't have shard 2, so it fails on its collations
+    pool.conns[2] = pool.conns[1]
+    pool.publish_snapshot()
+
+    collations = [mk_collation(chain, shard_id) for shard_id in shard_ids]
+    for collation in collations:
+        pool.submit(collation)
+    heads = pool.collect()
+    pool.close()
+
+    assert heads == {1: collations[0].header.hash}
+    assert pool.get_head_hash(2) is None
@@ -0,0 +1,111 @@
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+import pytest
+import rlp
+
+from ethereum.exceptions import InvalidTransaction
+from ethereum.transactions import (
+    Transaction,
+    secpk1n,
+)
+
+from sharding import signature_utils
+from sharding.collation import CollationHeader
+from sharding.contract_utils import sign
+from sharding.sender_cache import sender_cache
+from sharding.signature_utils import (
+    batch_verify_header_signatures,
+    recover_header_signer,
+    recover_tx_senders,
+)
+from sharding.tools import tester as t
+from sharding.tools.workload import Workload
+
+
+def mk_header(shard_id, privkey):
+    header = CollationHeader(shard_id=shard_id, number=1, coinbase=t.a0)
+    header.sig = sign(header.signing_hash, privkey)
+    return header
+
+
+def mk_pairs(num):
+    pairs = []
+    for i in range(num):
+        header = mk_header(i, t.keys[i % 3])
+        # Every 4th expected signer is wrong
+        signer = t.accounts[(i + 1) % 3] if i % 4 == 0 else t.accounts[i % 3]
+        pairs.append((header, signer))
+    return pairs
+
+
+def expected_results(num):
+    return [i % 4 != 0 for i in range(num)]
+
+
+def test_recover_header_signer():
+    header = mk_header(1, t.k1)
+    assert recover_header_signer(header.signing_hash, header.sig) == t.a1
+    assert recover_header_signer(header.signing_hash, b'') is None
+
+
+def test_batch_verify_header_signatures_in_process():
+    num = signature_utils.MIN_POOL_BATCH_SIZE - 1
+    assert batch_verify_header_signatures(mk_pairs(num)) == expected_results(num)
+    assert batch_verify_header_signatures([]) == []
+
+
+@pytest.fixture
+def pool():
+    p = multiprocessing.Pool(2)
+    yield p
+    p.close()
+    p.join()
+
+
+def test_batch_verify_header_signatures_in_pool(pool):
+    num = signature_utils.MIN_POOL_BATCH_SIZE * 3
+    pairs = mk_pairs(num)
+    # An invalid signature
+    pairs[1][0].sig = b'\x00' * 96
+    results = batch_verify_header_signatures(pairs, pool=pool)
+    expected = expected_results(num)
+    expected[1] = False
+    assert results == expected
+
+
+@pytest.mark.parametrize('mk_pool', [multiprocessing.Pool, ThreadPool])
+def test_recover_tx_senders(mk_pool):
+    sender_cache.clear()
+    workload = Workload(num_senders=5)
+    state = t.Chain(env='sharding').head_state
+    signed_txs = workload.mk_transfer_txs(state, signature_utils.MIN_POOL_BATCH_SIZE * 2)
+    # A receipt-consuming tx isn't recovered
+    rctx = Transaction(0, 1, 21000, t.a1, 100, b'')
+    rctx.v, rctx.r, rctx.s = 1, 0, 0
+    txs = [rlp.decode(rlp.encode(tx), Transaction) for tx in signed_txs] + [rctx]
+
+    pool = mk_pool(2)
+    try:
+        assert recover_tx_senders(txs, pool=pool) == len(signed_txs)
+    finally:
+        pool.close()
+        pool.join()
+    for tx, signed_tx in zip(txs, signed_txs):
+        assert tx._sender == signed_tx.sender
+        assert tx in sender_cache
+    assert rctx not in sender_cache
+    # Already recovered
+    assert recover_tx_senders(txs) == 0
+
+
+def test_recover_tx_senders_invalid_signature():
+    sender_cache.clear()
+    tx = Transaction(0, 1, 21000, t.a1, 100, b'').sign(t.k0)
+    # The signature values which tx.sender rejects are left to tx.sender
+    for r, s in ((tx.r, secpk1n), (0, tx.s), (secpk1n + tx.r, tx.s)):
+        bad_tx = Transaction(0, 1, 21000, t.a1, 100, b'', v=tx.v, r=r, s=s)
+        assert recover_tx_senders([bad_tx]) == 0
+        assert not bad_tx._sender
+        assert bad_tx not in sender_cache
+        with pytest.raises(InvalidTransaction):
+            bad_tx.sender
@@ -0,0 +1,131 @@
+import pytest
+import rlp
+
+from ethereum import utils
+from ethereum.db import (
+    EphemDB,
+    RefcountDB,
+)
+from ethereum.transaction_queue import TransactionQueue
+
+from sharding.collation_validation import (
+    CollationValidationError,
+    validate_collation,
+)
+from sharding.metrics import metrics
+from sharding.speculative_validation import (
+    SpeculativeDB,
+    SpeculativeValidationCache,
+)
+from sharding.tools import tester
+
+shard_id = 1
+
+
+@pytest.fixture
+def chain():
+    c = tester.Chain(env='sharding', deploy_sharding_contracts=True)
+    c.mine(5)
+    c.add_test_shard(shard_id)
+    shard = c.chain.shards[shard_id]
+    shard.speculative_validation = SpeculativeValidationCache(shard)
+    metrics.reset()
+    yield c
+    shard.speculative_validation.close()
+
+
+def get_counter(name):
+    return metrics.counter(name).value
+
+
+def mk_collation(chain):
+    txqueue = TransactionQueue()
+    for i in range(3):
+        txqueue.add_transaction(chain.generate_shard_tx(shard_id, tester.keys[2 + i], tester.a9, i + 1))
+    return chain.generate_collation(shard_id=shard_id, coinbase=tester.a1, key=tester.k1, txqueue=txqueue)
+
+
+def test_speculative_db():
+    base = EphemDB()
+    base.put(b'a', b'1')
+    db = SpeculativeDB(base)
+    assert db.get(b'a') == b'1'
+    db.put(b'a', b'2')
+    db.put(b'b', b'3')
+    assert base.get(b'a') == b'1'
+    assert b'b' not in base
+    assert db.merge()
+    assert base.get(b'a') == b'2'
+    assert base.get(b'b') == b'3'
+
+    # `a` is changed in the underlying db after it was read
+    db = SpeculativeDB(base)
+    db.put(b'a', db.get(b'a') + b'4')
+    base.put(b'a', b'5')
+    assert not db.merge()
+    assert base.get(b'a') == b'5'
+
+    # Only the refcount of a shared trie node is changed
+    node = rlp.encode([b'key', b'value'])
+    key = utils.sha3(node)
+    base.put(key, b'\x00\x00\x00\x02' + node)
+    db = SpeculativeDB(base)
+    refcount_db = RefcountDB(db)
+    refcount_db.put(key, node)
+    refcount_db.put(key, node)
+    RefcountDB(base).delete(key)
+    assert db.merge()
+    assert base.get(key) == b'\x00\x00\x00\x03' + node
+
+
+def test_speculative_validation(chain):
+    shard = chain.chain.shards[shard_id]
+    collation = mk_collation(chain)
+    period_start_prevblock = chain.chain.get_block(collation.header.period_start_prevhash)
+    assert shard.receive_collation(collation)
+    assert collation in shard.speculative_validation
+
+    assert shard.add_collation(collation, period_start_prevblock)
+    assert get_counter('speculative_validation.hit') == 1
+    assert get_counter('collation_validation.execution.passed') == 1
+    assert len(shard.speculative_validation) == 0
+    # The post-state was merged into the shard db
+    state = shard.mk_poststate_of_collation_hash(collation.header.hash)
+    assert state.trie.root_hash == collation.header.post_state_root
+
+
+def test_speculative_validation_miss(chain):
+    shard = chain.chain.shards[shard_id]
+    collation = mk_collation(chain)
+    period_start_prevblock = chain.chain.get_block(collation.header.period_start_prevhash)
+    # Not received
+    state = validate_collation(shard, collation, period_start_prevblock, speculative_cache=shard.speculative_validation)
+    assert state.trie.root_hash == collation.header.post_state_root
+    assert get_counter('speculative_validation.miss') == 1
+
+    # Received, but included with another period_start_prevblock
+    assert shard.receive_collation(collation)
+    assert shard.speculative_validation.take(collation, chain.chain.get_block_by_number(0)) is None
+    assert get_counter('speculative_validation.miss') == 2
+    assert collation in shard.speculative_validation
+
+
+def test_speculative_validation_invalid(chain):
+    shard = chain.chain.shards[shard_id]
+    collation = mk_collation(chain)
+    collation.header.tx_list_root = utils.sha3(b'wrong root')
+    period_start_prevblock = chain.chain.get_block(collation.header.period_start_prevhash)
+    assert shard.receive_collation(collation)
+    with pytest.raises(CollationValidationError) as e:
+        validate_collation(shard, collation, period_start_prevblock, speculative_cache=shard.speculative_validation)
+    assert e.value.stage == 'tx_root'
+    assert get_counter('speculative_validation.hit') == 1
+    assert not shard.add_collation(collation, period_start_prevblock)
+
+
+def test_speculative_validation_unknown_parent(chain):
+    shard = chain.chain.shards[shard_id]
+    collation = mk_collation(chain)
+    collation.header.parent_collation_hash = utils.sha3(b'unknown')
+    assert not shard.receive_collation(collation)
+    assert len(shard.speculative_validation) == 0
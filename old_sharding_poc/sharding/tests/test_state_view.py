@@ -0,0 +1,85 @@
+import pytest
+
+from ethereum.messages import apply_message
+from ethereum.vm import Message
+
+from sharding.contract_utils import call_msg
+from sharding.state_view import StateView
+from sharding.tools import tester as t
+from sharding.validator_manager_utils import (
+    call_contract_constantly,
+    get_valmgr_addr,
+    get_valmgr_ct,
+)
+
+
+@pytest.fixture
+def chain():
+    c = t.Chain(env='sharding', deploy_sharding_contracts=True)
+    c.mine(5)
+    return c
+
+
+def test_state_view_reads_and_writes(chain):
+    state = chain.head_state
+    balance = state.get_balance(t.a1)
+    nonce = state.get_nonce(t.a1)
+    view = StateView(state)
+    assert view.get_balance(t.a1) == balance
+    assert view.get_nonce(t.a1) == nonce
+    assert view.get_code(get_valmgr_addr()) == state.get_code(get_valmgr_addr())
+
+    view.delta_balance(t.a1, 100)
+    view.increment_nonce(t.a1)
+    view.set_storage_data(t.a1, 1, 42)
+    assert view.get_balance(t.a1) == balance + 100
+    assert view.get_nonce(t.a1) == nonce + 1
+    assert view.get_storage_data(t.a1, 1) == 42
+    # The parent state is never modified
+    assert state.get_balance(t.a1) == balance
+    assert state.get_nonce(t.a1) == nonce
+    assert state.get_storage_data(t.a1, 1) == 0
+
+
+def test_state_view_snapshot_revert(chain):
+    state = chain.head_state
+    balance = state.get_balance(t.a1)
+    view = StateView(state)
+    view.delta_balance(t.a1, 1)
+    snapshot = view.snapshot()
+    view.delta_balance(t.a1, 1)
+    view.set_storage_data(t.a2, 1, 42)
+    view.set_param('gas_used', 21000)
+    view.revert(snapshot)
+    assert view.get_balance(t.a1) == balance + 1
+    assert view.get_storage_data(t.a2, 1) == 0
+    assert view.gas_used == state.gas_used
+
+
+def test_state_view_reset_storage(chain):
+    state = chain.head_state
+    valmgr_addr = get_valmgr_addr()
+    view = StateView(state)
+    view.set_storage_data(valmgr_addr, 1, 42)
+    view.reset_storage(valmgr_addr)
+    assert view.get_storage_data(valmgr_addr, 1) == 0
+    for key in range(10):
+        assert view.get_storage_data(valmgr_addr, key) == 0
+
+
+def test_state_view_constant_call(chain):
+    state = chain.head_state
+    ct = get_valmgr_ct()
+    for func in ('get_validators_max_index', 'get_collation_gas_limit'):
+        # The call on an ephemeral clone, as before the views
+        expected = call_msg(
+            state.ephemeral_clone(), ct, func, [], b'\x00' * 20, get_valmgr_addr(), 0, 200000)
+        assert call_contract_constantly(state, ct, get_valmgr_addr(), func, [], 0) == expected
+
+    # Messages applied to the view don't leak into the parent state
+    balance = state.get_balance(t.a1)
+    root = state.trie.root_hash
+    msg = Message(t.a0, t.a1, 10, 25000, b'')
+    assert apply_message(StateView(state), msg) is not None
+    assert state.get_balance(t.a1) == balance
+    assert state.trie.root_hash == root
@@ -141,3 +141,84 @@ def test_get_collations_with_score():
         2,
     )
     assert len(collations) == 3
+
+
+def test_collations_with_score_cache():
+    shard_id = 1
+    t1 = chain(shard_id)
+    cache = t1.chain.collations_with_score_cache
+
+    def mk_collation(parent_collation_hash):
+        expected_period_number = t1.chain.get_expected_period_number()
+        return collator.create_collation(
+            t1.chain,
+            shard_id,
+            parent_collation_hash=parent_collation_hash,
+            expected_period_number=expected_period_number,
+            coinbase=tester.a0,
+            key=tester.k0,
+            txqueue=TransactionQueue(),
+            period_start_prevhash=t1.chain.get_period_start_prevhash(expected_period_number),
+        )
+
+    collation_1 = mk_collation(t1.chain.shards[shard_id].head_hash)
+    period_start_prevblock = t1.chain.get_block(collation_1.header.period_start_prevhash)
+    assert t1.chain.shards[shard_id].add_collation(collation_1, period_start_prevblock)
+    apply_add_header(t1, collation_1.header)
+    # The pending state isn't the state of the head: the cache isn't used
+    assert stateless_collator.get_collations_by_score(t1.head_state, shard_id, 0, 2, cache) == \
+        {0: [], 1: [collation_1.hash], 2: []}
+    assert cache.hits == cache.misses == 0
+    t1.mine(1)
+    assert t1.chain.get_collations_by_score(shard_id, 0, 2) == \
+        {0: [], 1: [collation_1.hash], 2: []}
+    assert cache.misses == 3
+    # The missing scores are filled from the add_header logs
+    assert cache.fallbacks == 0
+    assert stateless_collator.get_collations_with_score(t1.chain.state, shard_id, 1, cache) == \
+        [collation_1.hash]
+    assert cache.hits == 1
+    old_head_hash = t1.chain.head_hash
+    t1.mine(5)
+
+    # A new collation with score 2: only this score is fetched again
+    collation_2 = mk_collation(collation_1.hash)
+    assert collation_2.number == 2
+    apply_add_header(t1, collation_2.header)
+    t1.mine(1)
+    assert t1.chain.get_collations_with_scores_in_range(shard_id, 1, 2) == \
+        [collation_1.hash, collation_2.hash]
+    assert cache.misses == 4
+    assert stateless_collator.get_collations_with_scores_in_range(t1.chain.state, shard_id, 1, 2) == \
+        [collation_1.hash, collation_2.hash]
+    # The cache isn't used for the state of an older block
+    old_state = t1.chain.mk_poststate_of_blockhash(old_head_hash)
+    assert stateless_collator.get_collations_with_scores_in_range(old_state, shard_id, 1, 2, cache) == \
+        [collation_1.hash]
+    assert (cache.hits, cache.misses) == (2, 4)
+
+
+def test_collations_with_score_cache_fallback():
+    shard_id = 1
+    t1 = chain(shard_id)
+    cache = t1.chain.collations_with_score_cache
+
+    expected_period_number = t1.chain.get_expected_period_number()
+    collation = collator.create_collation(
+        t1.chain,
+        shard_id,
+        parent_collation_hash=t1.chain.shards[shard_id].head_hash,
+        expected_period_number=expected_period_number,
+        coinbase=tester.a0,
+        key=tester.k0,
+        txqueue=TransactionQueue(),
+        period_start_prevhash=t1.chain.get_period_start_prevhash(expected_period_number),
+    )
+    apply_add_header(t1, collation.header)
+    t1.mine(1)
+    # Drop the indexed add_header log
+    t1.chain.candidate_heads.remove_block(t1.chain.head_hash)
+    assert not t1.chain.candidate_heads.get_collation_hashes(shard_id, 1)
+
+    assert t1.chain.get_collations_by_score(shard_id, 0, 1) == {0: [], 1: [collation.hash]}
+    assert cache.fallbacks == 1
@@ -0,0 +1,153 @@
+import pytest
+
+import rlp
+
+from ethereum import utils
+from ethereum.db import EphemDB
+from ethereum.transaction_queue import TransactionQueue
+
+from sharding import collator
+from sharding.receipt_consuming_tx_utils import apply_shard_transaction
+from sharding.tools import tester
+from sharding.tools.workload import Workload
+from sharding.trie_db import (
+    REFCOUNT_ONE,
+    DeferredCommitDB,
+    NodeCacheDB,
+    RecordingDB,
+    WitnessDB,
+    db_value_to_object,
+    deferred_commits,
+)
+
+SHARD_ID = 1
+
+
+def test_node_cache_db():
+    db = EphemDB()
+    db.put(b'a', b'1')
+    cache = NodeCacheDB(db)
+    assert cache.get(b'a') == b'1'
+    db.put(b'a', b'2')
+    # Served from the cache
+    assert cache.get(b'a') == b'1'
+    cache.put(b'b', b'3')
+    assert db.get(b'b') == b'3'
+    cache.delete(b'b')
+    assert b'b' not in cache
+    with pytest.raises(KeyError):
+        cache.get(b'c')
+
+
+def test_deferred_commit_db():
+    db = EphemDB()
+    db.put(b'a', b'1')
+    deferred = DeferredCommitDB(db)
+    deferred.put(b'b', b'2')
+    deferred.put(b'b', b'3')
+    deferred.delete(b'a')
+    deferred.delete(b'c')
+    assert b'a' not in deferred
+    assert deferred.get(b'b') == b'3'
+    assert db.get(b'a') == b'1'
+    assert b'b' not in db
+
+    assert deferred.flush() == 3
+    assert b'a' not in db
+    assert db.get(b'b') == b'3'
+    assert deferred.overlay == {}
+
+
+def test_recording_db():
+    db = EphemDB()
+    db.put(b'a', b'1')
+    db.put(b'b', b'2')
+    recording = RecordingDB(db)
+    recording.put(b'c', b'3')
+    assert recording.get(b'a') == b'1'
+    assert recording.get(b'c') == b'3'
+    recording.put(b'a', b'4')
+    # The value read first
+    assert recording.get(b'a') == b'4'
+    assert recording.reads == {b'a': b'1'}
+    assert b'c' not in db
+    # Read only to be written, as RefcountDB does
+    assert recording.get(b'b') == b'2'
+    recording.put(b'b', b'5')
+    assert recording.reads == {b'a': b'1'}
+    recording.reset()
+    assert recording.reads == {}
+
+
+def test_witness_db():
+    node, code = rlp.encode([b'key', b'value']), b'\x60\x00'
+    db = WitnessDB([node], [code])
+    # Trie nodes have the refcount prefix of RefcountDB
+    assert db.get(utils.sha3(node)) == REFCOUNT_ONE + node
+    assert db.get(utils.sha3(code)) == code
+    assert db.reads == set([utils.sha3(node), utils.sha3(code)])
+    with pytest.raises(KeyError):
+        db.get(utils.sha3(b'missing'))
+
+    new_node = rlp.encode([b'key', b'new value'])
+    db.put(utils.sha3(new_node), REFCOUNT_ONE + new_node)
+    # Already in the witness
+    db.put(utils.sha3(node), b'\x00\x00\x00\x02' + node)
+    assert db.get_written_objects() == {utils.sha3(new_node): new_node}
+    assert db_value_to_object(b'address:' + b'\x00' * 20, b'account') is None
+
+
+@pytest.mark.parametrize('checkpoint_interval', [None, 3])
+def test_deferred_commits(checkpoint_interval):
+    workload = Workload(num_senders=5)
+    c = tester.Chain(env='sharding', deploy_sharding_contracts=True)
+    c.mine(5)
+    c.add_test_shard(SHARD_ID, setup_urs_contracts=False, alloc=workload.mk_alloc())
+    state = c.chain.shards[SHARD_ID].state
+    txs = workload.mk_transfer_txs(state, 10)
+
+    sequential_state = state.ephemeral_clone()
+    for tx in txs:
+        apply_shard_transaction(None, sequential_state, None, tx)
+
+    env = state.env
+    db = env.db
+    with deferred_commits(state, checkpoint_interval) as deferred:
+        assert state.env.db is deferred
+        # The Env shared with the main chain and the other shards is untouched
+        assert env.db is db
+        assert c.chain.env.db is db
+        for i, tx in enumerate(txs):
+            apply_shard_transaction(None, state, None, tx)
+            # The root is computed, but the nodes aren't written yet
+            assert state.receipts[-1].state_root == sequential_state.receipts[i].state_root
+            if checkpoint_interval is None:
+                assert state.trie.root_hash not in db
+        if checkpoint_interval:
+            assert sequential_state.receipts[5].state_root in db
+    assert 'commit' not in vars(state)
+    assert state.env is env
+    assert state.env.db is db
+    assert state.trie.root_hash == sequential_state.trie.root_hash
+    assert state.trie.root_hash in db
+    # The committed state can be read back from the db
+    assert state.ephemeral_clone().get_balance(txs[-1].to) == workload.value
+
+
+def test_apply_collation_deferred_commit():
+    t = tester.Chain(env='sharding', deploy_sharding_contracts=True)
+    t.mine(5)
+    t.add_test_shard(SHARD_ID)
+
+    txqueue = TransactionQueue()
+    for i in range(3):
+        txqueue.add_transaction(t.generate_shard_tx(SHARD_ID, tester.keys[2 + i], tester.a9, i + 1))
+    collation = t.generate_collation(shard_id=SHARD_ID, coinbase=tester.a1, key=tester.k1, txqueue=txqueue)
+    period_start_prevblock = t.chain.get_block(collation.header.period_start_prevhash)
+    state = t.chain.shards[SHARD_ID].state
+    collator.apply_collation(
+        state, collation, period_start_prevblock, t.chain.state, SHARD_ID,
+        deferred_commit=True, checkpoint_interval=2,
+    )
+    assert collation.header.post_state_root == state.trie.root_hash
+    assert state.trie.root_hash in state.env.db
@@ -0,0 +1,75 @@
+from ethereum.common import (
+    mk_receipt_sha,
+    mk_transaction_sha,
+)
+from ethereum.transaction_queue import TransactionQueue
+from ethereum.transactions import Transaction
+
+from sharding import state_transition
+from sharding.collation import (
+    Collation,
+    CollationHeader,
+)
+from sharding.tools import tester
+from sharding.trie_root import (
+    IncrementalTrieRoot,
+    get_tx_list_root,
+)
+
+shard_id = 1
+
+
+def mk_txs(n):
+    return [Transaction(i, 1, 21000, tester.a1, i, b'').sign(tester.k0) for i in range(n)]
+
+
+def test_incremental_trie_root():
+    txs = mk_txs(5)
+    builder = IncrementalTrieRoot()
+    assert builder.sync([]) == mk_transaction_sha([])
+    for i in range(len(txs)):
+        assert builder.sync(txs[:i + 1]) == mk_transaction_sha(txs[:i + 1])
+    assert builder.num_updates == 5
+    # Already up to date
+    assert builder.sync(txs) == mk_transaction_sha(txs)
+    assert builder.num_updates == 5
+
+    # Not a prefix anymore: rebuilt
+    other_txs = txs[:2] + mk_txs(1)
+    assert builder.sync(other_txs) == mk_transaction_sha(other_txs)
+    assert builder.num_updates == 8
+
+
+def test_get_tx_list_root():
+    collation = Collation(CollationHeader(), mk_txs(3))
+    assert get_tx_list_root(collation) == mk_transaction_sha(collation.transactions)
+    builder = collation._tx_list_root_builder
+    assert get_tx_list_root(collation) == mk_transaction_sha(collation.transactions)
+    assert builder.num_updates == 3
+    collation.transactions.append(mk_txs(4)[3])
+    assert get_tx_list_root(collation) == mk_transaction_sha(collation.transactions)
+    assert builder.num_updates == 4
+
+
+def test_roots_computed_once():
+    """add_transactions updates the roots, the later steps reuse them
+    """
+    t = tester.Chain(env='sharding', deploy_sharding_contracts=True)
+    t.mine(5)
+    t.add_test_shard(shard_id)
+    txqueue = TransactionQueue()
+    for i in range(3):
+        txqueue.add_transaction(t.generate_shard_tx(shard_id, tester.keys[2 + i], tester.a9, i + 1))
+
+    state = t.chain.shards[shard_id].state.ephemeral_clone()
+    collation = state_transition.mk_collation_from_prevstate(t.chain.shards[shard_id], state, tester.a1)
+    state_transition.add_transactions(state, collation, txqueue, t.head_state, shard_id)
+    assert collation.transaction_count == 3
+    state_transition.set_execution_results(state, collation)
+    assert state_transition.validate_transaction_tree(collation)
+    assert state_transition.verify_execution_results(state, collation)
+
+    assert collation.header.tx_list_root == mk_transaction_sha(collation.transactions)
+    assert collation.header.receipts_root == mk_receipt_sha(state.receipts)
+    assert collation._tx_list_root_builder.num_updates == 3
+    assert collation._receipts_root_builder.num_updates == len(state.receipts)
@@ -7,6 +7,8 @@ from sharding.tools import tester as t
 from sharding.contract_utils import (
     sign,
     create_contract_tx,
+    encode_function_call,
+    mk_calldata,
 )
 from sharding.validator_manager_utils import (
     DEPOSIT_SIZE,
@@ -21,7 +23,8 @@ from sharding.validator_manager_utils import (
     call_contract_constantly,
     get_shard_list,
     get_valmgr_addr,
-    get_valmgr_ct
+    get_valmgr_ct,
+    get_validation_code_signer,
 )
 from sharding.config import sharding_config
 
@@ -192,3 +195,53 @@ def test_get_validators_max_index(chain):
 def test_call_get_collation_gas_limit(chain):
     output = call_valmgr(chain.head_state, 'get_collation_gas_limit', [])
     assert output == 10000000
+
+
+def test_encode_function_call():
+    ct = get_valmgr_ct()
+    for func, args in (
+        ('get_collation_gas_limit', []),
+        ('get_shard_head', [1]),
+        ('tx_to_shard', [t.a1, 1, 100000, 1, b'\x35' * 4096]),
+    ):
+        data = encode_function_call(ct, func, args)
+        assert data == ct.encode_function_call(func, args)
+        # cached encoder
+        assert encode_function_call(ct, func, args) == data
+        calldata = mk_calldata(data)
+        assert calldata.size == len(data)
+        assert calldata.extract_all() == data
+        assert calldata.extract32(0) == utils.big_endian_to_int(data[:32].ljust(32, b'\x00'))
+    with pytest.raises(ValueError):
+        encode_function_call(ct, 'no_such_function', [])
+
+
+def test_call_validation_code_native(chain):
+    tx = create_contract_tx(chain.head_state, t.k0, mk_validation_code(t.a0))
+    k0_valcode_addr = chain.direct_tx(tx)
+    # A validation code which isn't made by mk_validation_code: gives 3001 gas
+    # instead of 3000 to ecrecover
+    valcode = mk_validation_code(t.a1)
+    i = valcode.index(b'a\x0b\xb8')
+    tx = create_contract_tx(chain.head_state, t.k1, valcode[:i] + b'a\x0b\xb9' + valcode[i + 3:])
+    custom_valcode_addr = chain.direct_tx(tx)
+    chain.mine(1)
+    state = chain.head_state
+    assert get_validation_code_signer(state, k0_valcode_addr) == t.a0
+    assert get_validation_code_signer(state, custom_valcode_addr) is None
+    assert get_validation_code_signer(state, t.a2) is None
+
+    msg_hash = utils.sha3('hello')
+    for signature in (
+        sign(msg_hash, t.k0),
+        sign(msg_hash, t.k1),
+        sign(msg_hash, t.k0)[:-1],
+        b'',
+        utils.encode_int32(26) + sign(msg_hash, t.k0)[32:],
+        b'\xff' * 96,
+    ):
+        expected = call_validation_code(state, k0_valcode_addr, msg_hash, signature, native=False)
+        assert call_validation_code(state, k0_valcode_addr, msg_hash, signature) == expected
+    assert call_validation_code(state, k0_valcode_addr, msg_hash, sign(msg_hash, t.k0))
+    assert not call_validation_code(state, k0_valcode_addr, msg_hash, sign(msg_hash, t.k1))
+    assert call_validation_code(state, custom_valcode_addr, msg_hash, sign(msg_hash, t.k1))
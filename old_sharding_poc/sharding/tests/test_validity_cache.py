@@ -0,0 +1,120 @@
+import pytest
+
+from ethereum import utils
+
+from sharding.collator import create_collation
+from sharding.metrics import metrics
+from sharding.tools import tester
+from sharding.validity_cache import (
+    RECORD_HEADER,
+    ValidityCache,
+)
+
+shard_id = 1
+
+
+def h(i):
+    return utils.sha3(utils.to_string(i))
+
+
+def test_validity_cache():
+    cache = ValidityCache(max_size=3)
+    assert cache.is_valid(h(0)) is None
+    cache.set_invalid(h(0), 'invalid tx root')
+    cache.set_valid(h(1), h('head'))
+    cache.set_invalid(h(2), 'bad nonce', h('head'))
+    # Without a context, in any context
+    assert cache.is_valid(h(0)) is False
+    assert cache.get(h(0), h('other head')) == (False, b'invalid tx root')
+    # Only in its context
+    assert cache.is_valid(h(1), h('head')) is True
+    assert cache.is_valid(h(1), h('other head')) is None
+    assert cache.is_valid(h(1)) is None
+    assert cache.get(h(2), h('head')) == (False, b'bad nonce')
+    # h(0) is the least recently used
+    cache.set_valid(h(3), h('head'))
+    assert h(0) not in cache
+    assert len(cache) == 3
+    assert cache.hits == 4
+    assert cache.misses == 3
+
+
+def test_validity_cache_persistence(tmpdir):
+    path = str(tmpdir.join('validity'))
+    cache = ValidityCache(path)
+    cache.set_valid(h(0), h('head'))
+    cache.set_invalid(h(1), 'bad nonce', h('head'))
+    cache.set_valid(h(1), h('head'))
+    cache.close()
+
+    cache = ValidityCache(path)
+    assert cache.num_records == 3
+    assert cache.get(h(0), h('head')) == (True, b'')
+    assert cache.get(h(1), h('head')) == (True, b'')
+    assert cache.get(h(1), h('other head')) is None
+
+    # A record cut short by a crash is dropped
+    cache.set_invalid(h(2), 'invalid tx root')
+    cache.close()
+    with open(path, 'ab') as f:
+        f.write(RECORD_HEADER.pack(h(3), b'', 0, 10) + b'trunc')
+    cache = ValidityCache(path)
+    assert cache.get(h(2), h('other head')) == (False, b'invalid tx root')
+    assert h(3) not in cache
+    cache.set_invalid(h(3), 'invalid signature')
+    cache.close()
+    assert ValidityCache(path).is_valid(h(3)) is False
+
+
+def test_validity_cache_compaction(tmpdir):
+    path = str(tmpdir.join('validity'))
+    cache = ValidityCache(path, max_size=2)
+    for i in range(5):
+        cache.set_invalid(h(i), 'invalid')
+    # Compacted on the 5th record
+    assert cache.num_records == 2
+    cache.close()
+    cache = ValidityCache(path, max_size=2)
+    assert len(cache) == 2
+    assert h(3) in cache and h(4) in cache
+
+
+@pytest.fixture
+def chain():
+    c = tester.Chain(env='sharding', deploy_sharding_contracts=True)
+    c.mine(5)
+    c.add_test_shard(shard_id)
+    metrics.reset()
+    return c
+
+
+def test_add_collation_uses_validity_cache(chain):
+    shard = chain.chain.shards[shard_id]
+    collation = chain.generate_collation(shard_id=shard_id, coinbase=tester.a1, key=tester.k1)
+    period_start_prevblock = chain.chain.get_block(collation.header.period_start_prevhash)
+    assert shard.add_collation(collation, period_start_prevblock)
+    assert shard.validity_cache.is_valid(collation.header.hash, chain.chain.head_hash) is True
+    # Not executed again on the same main chain head
+    assert shard.add_collation(collation, period_start_prevblock)
+    assert metrics.counter('collation_validation.execution.passed').value == 1
+    # The execution reads the main chain state, so it's verified again on a new head
+    chain.mine(1)
+    assert shard.validity_cache.is_valid(collation.header.hash, chain.chain.head_hash) is None
+    assert shard.add_collation(collation, period_start_prevblock)
+    assert metrics.counter('collation_validation.execution.passed').value == 2
+
+    invalid_collation = chain.generate_collation(shard_id=shard_id, coinbase=tester.a2, key=tester.k1)
+    invalid_collation.header.tx_list_root = utils.sha3(b'wrong root')
+    assert not shard.add_collation(invalid_collation, period_start_prevblock)
+    # An invalid tx root is invalid on any main chain head
+    valid, reason = shard.validity_cache.get(invalid_collation.header.hash)
+    assert not valid
+    assert b'tx_root' in reason
+    assert not shard.add_collation(invalid_collation, period_start_prevblock)
+    assert metrics.counter('collation_validation.tx_root.rejected').value == 1
+
+    # No collation is created on top of an invalid one
+    with pytest.raises(ValueError):
+        create_collation(
+            chain.chain, shard_id, invalid_collation.header.hash,
+            chain.chain.get_expected_period_number(), tester.a1, tester.k1)
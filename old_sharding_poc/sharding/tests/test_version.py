@@ -0,0 +1,23 @@
+import subprocess
+import sys
+
+import sharding
+from sharding._version import (
+    __version__,
+    get_version,
+)
+
+
+def test_version():
+    assert sharding.__version__ == __version__
+    assert get_version()
+    assert get_version() == get_version()
+
+
+def test_import_has_no_side_effects():
+    # Importing the package doesn't look up the distribution or spawn git
+    output = subprocess.check_output([
+        sys.executable, '-c',
+        'import sys, sharding; print("pkg_resources" in sys.modules or "subprocess" in sys.modules)'
+    ])
+    assert output.strip() == b'False'
@@ -28,7 +28,6 @@ from ethereum.messages import apply_transaction
 from ethereum.common import mk_block_from_prevstate, set_execution_results
 from ethereum.meta import make_head_candidate
 from ethereum.abi import ContractTranslator
-from ethereum.tools._solidity import get_solidity
 
 from sharding.main_chain import MainChain
 from sharding.shard_chain import ShardChain
@@ -37,6 +36,7 @@ from sharding.collator import create_collation
 from sharding import state_transition as shard_state_transition
 from sharding.collation import CollationHeader
 from sharding.receipt_consuming_tx_utils import apply_shard_transaction
+from sharding.sender_cache import sign_tx
 from sharding.contract_utils import (
     sign,
     create_contract_tx,
@@ -75,18 +75,25 @@ for i in range(1, 9):
     minimal_alloc[int_to_addr(i)] = {'balance': 1}
 minimal_alloc[accounts[0]] = {'balance': 1 * utils.denoms.ether}
 
-# Initialize languages
+# Languages are loaded on first use, since detecting solc and importing the
+# Viper compiler are slow
 languages = {}
 
-_solidity = get_solidity()
-if _solidity:
-    languages['solidity'] = _solidity
 
-try:
-    from viper import compiler
-    languages['viper'] = compiler
-except ImportError:
-    pass
+def get_language(language):
+    if language not in languages:
+        if language == 'solidity':
+            from ethereum.tools._solidity import get_solidity
+            _solidity = get_solidity()
+            if _solidity:
+                languages['solidity'] = _solidity
+        elif language == 'viper':
+            try:
+                from viper import compiler
+                languages['viper'] = compiler
+            except ImportError:
+                pass
+    return languages[language]
 
 
 class TransactionFailed(Exception):
@@ -255,9 +262,9 @@ class Chain(object):
             self.last_sender = sender
         else:
             assert self.chain.has_shard(shard_id)
-            transaction = Transaction(
+            transaction = sign_tx(Transaction(
                 self.shard_head_state[shard_id].get_nonce(sender_addr), gasprice, startgas, to, value, data
-            ).sign(sender)
+            ), sender)
             self.shard_last_sender[shard_id] = sender
         o = self.direct_tx(transaction, shard_id=shard_id)
         return o
@@ -267,7 +274,7 @@ class Chain(object):
             assert len(args) == 0
             return self.tx(sender=sender, to=b'', value=value, data=sourcecode, startgas=startgas, gasprice=gasprice, shard_id=shard_id)
         else:
-            compiler = languages[language]
+            compiler = get_language(language)
             interface = compiler.mk_full_signature(sourcecode)
             ct = ContractTranslator(interface)
             code = compiler.compile(sourcecode) + (ct.encode_constructor_arguments(args) if args else b'')
@@ -284,7 +291,14 @@ class Chain(object):
         # Reorganize head collation
         collation = None
         # Check add_header_logs
+        # The watcher also sees the logs again when the block is applied to
+        # the main chain state, which shares the log listeners of head_state
+        logs = []
         for item in self.add_header_logs:
+            if item not in logs:
+                logs.append(item)
+        for log_index, item in enumerate(logs):
+            self.chain.index_add_header_log(b, log_index, item)
             # use sedes to prevent integer 0 from being decoded as b''
             sedes = List([utils.big_endian_int, utils.big_endian_int, utils.hash32, utils.hash32, utils.hash32, utils.address, utils.hash32, utils.hash32, utils.big_endian_int, binary])
             values = rlp.decode(item, sedes)
@@ -292,6 +306,7 @@ class Chain(object):
             if shard_id in self.chain.shard_id_list:
                 collation_hash = sha3(item)
                 collation = self.chain.shards[shard_id].get_collation(collation_hash)
+        self.chain.collations_with_score_cache.advance(b)
         self.chain.reorganize_head_collation(b, collation)
         # Clear logs
         self.add_header_logs = []
@@ -300,6 +315,7 @@ class Chain(object):
             b, _ = make_head_candidate(self.chain, parent=b, timestamp=self.chain.state.timestamp + 14, coinbase=coinbase)
             b = Miner(b).mine(rounds=100, start_nonce=0)
             assert self.chain.add_block(b)
+            self.chain.collations_with_score_cache.advance(b)
             self.chain.reorganize_head_collation(b, None)
 
         self.change_head(b.header.hash, coinbase)
@@ -404,8 +420,8 @@ class Chain(object):
         """Generate a tx of shard
         """
         sender_addr = privtoaddr(sender)
-        transaction = Transaction(self.shard_head_state[shard_id].get_nonce(sender_addr), gasprice, startgas,
-                                  to, value, data).sign(sender)
+        transaction = sign_tx(Transaction(self.shard_head_state[shard_id].get_nonce(sender_addr), gasprice, startgas,
+                                          to, value, data), sender)
         return transaction
 
     def generate_collation(self, shard_id, coinbase, key, txqueue=None, parent_collation_hash=None, expected_period_number=None):
@@ -0,0 +1,68 @@
+import random
+
+from ethereum import utils
+from ethereum.transactions import Transaction
+
+from sharding.tools import tester
+
+
+class Workload(object):
+    """Generates signed value-transfer shard txs from a set of funded senders
+
+    The accounts have to be in the alloc of the shard, e.g.
+    `chain.add_test_shard(shard_id, alloc=workload.mk_alloc())`.
+    """
+
+    def __init__(self, num_senders=10, seed=0, value=1, startgas=21000, gasprice=1):
+        self.keys = [utils.sha3('workload sender %d' % i) for i in range(num_senders)]
+        self.senders = [utils.privtoaddr(k) for k in self.keys]
+        self.value = value
+        self.startgas = startgas
+        self.gasprice = gasprice
+        self.random = random.Random(seed)
+        self.nonces = {}
+        self.num_recipients = 0
+        # The recipient shared by the conflicting txs
+        self.hot_recipient = utils.sha3(b'workload hot recipient')[-20:]
+
+    def mk_alloc(self, balance=1000 * utils.denoms.ether, alloc=None):
+        """The tester's base alloc plus the funded senders
+        """
+        o = dict(tester.base_alloc if alloc is None else alloc)
+        for sender in self.senders:
+            o[sender] = {'balance': balance}
+        return o
+
+    def next_nonce(self, state, sender):
+        if sender not in self.nonces:
+            self.nonces[sender] = state.get_nonce(sender)
+        nonce = self.nonces[sender]
+        self.nonces[sender] += 1
+        return nonce
+
+    def new_recipient(self):
+        self.num_recipients += 1
+        return utils.sha3('workload recipient %d' % self.num_recipients)[-20:]
+
+    def mk_transfer_tx(self, state, sender_index, to):
+        key, sender = self.keys[sender_index], self.senders[sender_index]
+        return Transaction(
+            self.next_nonce(state, sender), self.gasprice, self.startgas,
+            to, self.value, b''
+        ).sign(key)
+
+    def mk_transfer_txs(self, state, num_txs, conflict_rate=0.0):
+        """Make `num_txs` value transfers to new accounts, with the senders
+        taken in turn
+
+        conflict_rate: the probability that a tx is sent to `hot_recipient`
+            instead, so that it conflicts with the previous txs sent there
+        """
+        txs = []
+        for i in range(num_txs):
+            if self.random.random() < conflict_rate:
+                to = self.hot_recipient
+            else:
+                to = self.new_recipient()
+            txs.append(self.mk_transfer_tx(state, i % len(self.senders), to))
+        return txs
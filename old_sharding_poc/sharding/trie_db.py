@@ -0,0 +1,259 @@
+import contextlib
+
+from ethereum import utils
+from ethereum.config import Env
+from ethereum.db import BaseDB, OverlayDB
+from ethereum.state import BLANK_HASH
+from ethereum.slogging import get_logger
+
+log = get_logger('sharding.trie_db')
+
+
+class NodeCacheDB(BaseDB):
+    """A write-through cache of the trie nodes read from and written to `db`
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self.kv = None
+        self.nodes = {}
+
+    def get(self, key):
+        if key not in self.nodes:
+            self.nodes[key] = self.db.get(key)
+        return self.nodes[key]
+
+    def put(self, key, value):
+        self.nodes[key] = value
+        self.db.put(key, value)
+
+    def delete(self, key):
+        self.nodes.pop(key, None)
+        self.db.delete(key)
+
+    def commit(self):
+        self.db.commit()
+
+    def _has_key(self, key):
+        return key in self.nodes or key in self.db
+
+    def __contains__(self, key):
+        return self._has_key(key)
+
+    def __eq__(self, other):
+        return isinstance(other, self.__class__) and self.db == other.db
+
+    def __hash__(self):
+        return utils.big_endian_to_int(utils.str_to_bytes(self.__repr__()))
+
+
+class DeferredCommitDB(OverlayDB):
+    """An OverlayDB whose buffered writes are written to `db` on `flush`
+    """
+
+    def flush(self):
+        """Write the buffered writes to `db`, and return their number
+        """
+        for key, value in self.overlay.items():
+            if value is None:
+                if key in self.db:
+                    self.db.delete(key)
+            else:
+                self.db.put(key, value)
+        num_writes = len(self.overlay)
+        self.overlay = {}
+        return num_writes
+
+
+# The refcount of a trie node written once by RefcountDB
+REFCOUNT_ONE = b'\x00\x00\x00\x01'
+
+
+def db_value_to_object(key, value):
+    """The witness object of a value of the state db: trie nodes are stored
+    under their hash with the refcount prefix of RefcountDB, codes without.
+    Returns None for the values which aren't content-addressed.
+    """
+    if utils.sha3(value) == key:
+        return value
+    if utils.sha3(value[len(REFCOUNT_ONE):]) == key:
+        return value[len(REFCOUNT_ONE):]
+    return None
+
+
+class RecordingDB(OverlayDB):
+    """An OverlayDB which records the values read through it, except the
+    ones it wrote first, e.g. to collect the witness of an execution
+
+    A first read immediately followed by a put of the same key isn't
+    recorded either: RefcountDB reads a node before it writes it, to bump
+    its refcount, and an execution which only writes a node doesn't need it.
+    """
+
+    def __init__(self, db):
+        super(RecordingDB, self).__init__(db)
+        self.reads = {}
+        self.written = set()
+        self._new_read = None
+
+    def get(self, key):
+        self._new_read = None
+        value = OverlayDB.get(self, key)
+        if key not in self.written and key not in self.reads:
+            self.reads[key] = value
+            self._new_read = key
+        return value
+
+    def put(self, key, value):
+        if key == self._new_read:
+            del self.reads[key]
+        self._new_read = None
+        OverlayDB.put(self, key, value)
+        self.written.add(key)
+
+    def reset(self):
+        """Forget the recorded keys
+        """
+        self.reads = {}
+        self.written = set()
+        self._new_read = None
+
+
+class WitnessDB(BaseDB):
+    """An in-memory state db seeded only from a witness: the trie nodes and
+    the codes that an execution may read
+
+    The witness objects which are read are recorded in `reads`, and the
+    new objects which are written in `writes`. A key which isn't in the
+    witness raises a KeyError. Nothing is deleted, the objects are
+    content-addressed and the memory is bounded by the witness and the
+    writes of one execution.
+    """
+
+    def __init__(self, nodes=(), codes=()):
+        self.kv = None
+        self.db = {BLANK_HASH: b''}
+        for node in nodes:
+            self.db[utils.sha3(node)] = REFCOUNT_ONE + node
+        for code in codes:
+            self.db[utils.sha3(code)] = code
+        self.witness_keys = set(self.db) - set([BLANK_HASH])
+        self.reads = set()
+        self.writes = {}
+
+    def get(self, key):
+        if key not in self.db:
+            raise KeyError('{} is not in the witness'.format(utils.encode_hex(key)))
+        if key in self.witness_keys:
+            self.reads.add(key)
+        return self.db[key]
+
+    def put(self, key, value):
+        if key not in self.db or key in self.writes:
+            self.writes[key] = value
+        self.db[key] = value
+
+    def delete(self, key):
+        pass
+
+    def commit(self):
+        pass
+
+    def _has_key(self, key):
+        return key in self.db
+
+    def __contains__(self, key):
+        return self._has_key(key)
+
+    def __eq__(self, other):
+        return isinstance(other, self.__class__) and self.db == other.db
+
+    def __hash__(self):
+        return utils.big_endian_to_int(utils.str_to_bytes(self.__repr__()))
+
+    def get_written_objects(self):
+        """The new trie nodes and codes, by hash
+        """
+        objects = {}
+        for key, value in self.writes.items():
+            obj = db_value_to_object(key, value)
+            if obj is not None:
+                objects[key] = obj
+        return objects
+
+
+@contextlib.contextmanager
+def _wrapped_db(state, wrap):
+    # The Env of a state is shared with the other chains, so the state gets
+    # a private Env over the wrapped db instead, like the speculative
+    # validation does. The state trie reads and writes through its own
+    # RefcountDB, and the Accounts through the Env they're cached with.
+    env = state.env
+    refcount_db = state.trie.db
+    trie_db = refcount_db.db
+    db = wrap(env.db)
+    wrapped_trie_db = db if trie_db is env.db else wrap(trie_db)
+    state.env = Env(db, env.config, env.global_config)
+    refcount_db.db = wrapped_trie_db
+    try:
+        yield db, wrapped_trie_db
+    finally:
+        state.env.db = env.db
+        state.env = env
+        refcount_db.db = trie_db
+        # The Accounts cached in the context keep the private Env, and the
+        # RefcountDB of their storage trie
+        for acct in state.cache.values():
+            storage_db = acct.storage_trie.db
+            if storage_db.db is db:
+                storage_db.db = env.db
+
+
+@contextlib.contextmanager
+def cached_trie_nodes(state):
+    """Read and write the trie nodes of `state` through a NodeCacheDB while
+    the context is active, e.g. for the execution of one collation
+    """
+    with _wrapped_db(state, NodeCacheDB) as (db, _):
+        yield db
+
+
+@contextlib.contextmanager
+def deferred_commits(state, checkpoint_interval=None):
+    """Buffer the trie nodes written by the commits of `state` in memory while
+    the context is active, and write them to the db when it exits
+
+    Pre-Metropolis, `apply_transaction` commits the state after every tx for
+    the intermediate state root of the receipt, so the commits themselves
+    still happen, but their writes only reach the db once, when the context
+    exits.
+
+    checkpoint_interval: if given, the writes are also flushed after every
+        `checkpoint_interval` commits
+    """
+    commit = state.commit
+    own_commit = vars(state).get('commit')
+    with _wrapped_db(state, DeferredCommitDB) as dbs:
+        deferred_dbs = [dbs[0]] if dbs[0] is dbs[1] else list(dbs)
+
+        def flush():
+            return sum(db.flush() for db in deferred_dbs)
+
+        def checkpointed_commit(*args, **kwargs):
+            commit(*args, **kwargs)
+            checkpointed_commit.num_commits += 1
+            if checkpoint_interval and checkpointed_commit.num_commits % checkpoint_interval == 0:
+                log.debug('Checkpoint: {} writes'.format(flush()))
+        checkpointed_commit.num_commits = 0
+
+        state.commit = checkpointed_commit
+        try:
+            yield dbs[0]
+        finally:
+            if own_commit is None:
+                del state.commit
+            else:
+                state.commit = own_commit
+            # Also on errors: the state root may already point to the
+            # buffered nodes if the caller doesn't revert the state
+            log.debug('Flushed {} writes after {} commits'.format(flush(), checkpointed_commit.num_commits))
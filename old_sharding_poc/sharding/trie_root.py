@@ -0,0 +1,65 @@
+import rlp
+from ethereum import trie
+from ethereum.db import EphemDB
+
+
+class IncrementalTrieRoot(object):
+    """The root of the `rlp(index) -> rlp(item)` trie of a list, the same as
+    `mk_transaction_sha` / `mk_receipt_sha`, updated as the items are
+    appended to the list
+
+    `sync(items)` only adds the new items if the ones already added are
+    still the prefix of `items` (compared by identity), and rebuilds the
+    trie otherwise.
+    """
+
+    def __init__(self):
+        self.trie = trie.Trie(EphemDB())
+        self.items = []
+        # The number of trie updates, for the tests and the metrics
+        self.num_updates = 0
+
+    def _common_prefix_length(self, items):
+        n = 0
+        for a, b in zip(self.items, items):
+            if a is not b:
+                break
+            n += 1
+        return n
+
+    def sync(self, items):
+        if self._common_prefix_length(items) < len(self.items):
+            self.trie = trie.Trie(EphemDB())
+            self.items = []
+        for item in items[len(self.items):]:
+            self.trie.update(rlp.encode(len(self.items)), rlp.encode(item))
+            self.items.append(item)
+            self.num_updates += 1
+        return self.trie.root_hash
+
+    @property
+    def root_hash(self):
+        return self.trie.root_hash
+
+
+def _get_builder(collation, name):
+    # Not getattr: Collation looks up the missing attributes in its header
+    builder = vars(collation).get(name)
+    if builder is None:
+        builder = IncrementalTrieRoot()
+        setattr(collation, name, builder)
+    return builder
+
+
+def get_tx_list_root(collation):
+    """The tx_list_root of the collation's transactions, memoized on the
+    collation
+    """
+    return _get_builder(collation, '_tx_list_root_builder').sync(collation.transactions)
+
+
+def get_receipts_root(collation, receipts):
+    """The receipts_root of `receipts`, the receipts of the collation's
+    transactions, memoized on the collation
+    """
+    return _get_builder(collation, '_receipts_root_builder').sync(receipts)
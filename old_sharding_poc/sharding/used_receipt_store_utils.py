@@ -5,15 +5,17 @@ from ethereum import (
     utils,
 )
 from ethereum.transactions import Transaction
-from viper import compiler
 
 from sharding.config import sharding_config
+from sharding.contract_artifacts import get_contract_artifact
 from sharding.contract_utils import (
     GASPRICE,
     call_contract_constantly,
     get_tx_rawhash,
 )
 
+URS_PATH = os.path.join(os.path.dirname(__file__), 'contracts/used_receipt_store.v.py')
+
 _urs_contracts = {}
 _urs_ct = None
 _urs_code = None
@@ -39,7 +41,7 @@ def get_urs_ct(shard_id):
     global _urs_ct, _urs_code
     if not _urs_ct:
         _urs_ct = abi.ContractTranslator(
-            compiler.mk_full_signature(get_urs_code(shard_id))
+            get_contract_artifact(URS_PATH)['abi']
         )
     return _urs_ct
 
@@ -47,16 +49,14 @@ def get_urs_ct(shard_id):
 def get_urs_code(shard_id):
     global _urs_code
     if not _urs_code:
-        mydir = os.path.dirname(__file__)
-        urs_path = os.path.join(mydir, 'contracts/used_receipt_store.v.py')
-        _urs_code = open(urs_path).read()
+        _urs_code = open(URS_PATH).read()
     return _urs_code
 
 
 def get_urs_bytecode(shard_id):
     global _urs_bytecode
     if not _urs_bytecode:
-        _urs_bytecode = compiler.compile(get_urs_code(shard_id))
+        _urs_bytecode = get_contract_artifact(URS_PATH)['bytecode']
     return _urs_bytecode
 
 
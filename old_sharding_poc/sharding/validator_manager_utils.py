@@ -1,6 +1,5 @@
 import os
 import rlp
-from viper import compiler
 
 from ethereum import (
     abi,
@@ -11,17 +10,24 @@ from ethereum.messages import apply_message
 from ethereum.transactions import Transaction
 
 from sharding.config import sharding_config
+from sharding.contract_artifacts import get_contract_artifact
 from sharding.contract_utils import (
     GASPRICE,
     extract_sender_from_tx,
     call_contract_constantly,
     call_tx,
+    ecrecover_from_signature,
+    mk_calldata,
 )
+from sharding.state_view import StateView
 
 
 DEPOSIT_SIZE = sharding_config['DEPOSIT_SIZE']
 WITHDRAW_HASH = utils.sha3("withdraw")
 ADD_HEADER_TOPIC = utils.sha3("add_header()")
+TX_TO_SHARD_TOPIC = utils.sha3("tx_to_shard()")
+
+VALMGR_PATH = os.path.join(os.path.dirname(__file__), 'contracts/validator_manager.v.py')
 
 _valmgr_ct = None
 _valmgr_code = None
@@ -29,6 +35,8 @@ _valmgr_bytecode = None
 _valmgr_addr = None
 _valmgr_sender_addr = None
 _valmgr_tx = None
+# validation_code_addr -> (code, signer)
+_validation_code_signers = {}
 
 viper_rlp_decoder_tx = rlp.decode(utils.parse_as_bin("0xf90237808506fc23ac00830330888080b902246102128061000e60003961022056600060007f010000000000000000000000000000000000000000000000000000000000000060003504600060c082121515585760f882121561004d5760bf820336141558576001905061006e565b600181013560f783036020035260005160f6830301361415585760f6820390505b5b368112156101c2577f010000000000000000000000000000000000000000000000000000000000000081350483602086026040015260018501945060808112156100d55760018461044001526001828561046001376001820191506021840193506101bc565b60b881121561014357608081038461044001526080810360018301856104600137608181141561012e5760807f010000000000000000000000000000000000000000000000000000000000000060018401350412151558575b607f81038201915060608103840193506101bb565b60c08112156101b857600182013560b782036020035260005160388112157f010000000000000000000000000000000000000000000000000000000000000060018501350402155857808561044001528060b6838501038661046001378060b6830301830192506020810185019450506101ba565bfe5b5b5b5061006f565b601f841315155857602060208502016020810391505b6000821215156101fc578082604001510182826104400301526020820391506101d8565b808401610420528381018161044003f350505050505b6000f31b2d4f"), Transaction)
 viper_rlp_decoder_addr = viper_rlp_decoder_tx.creates
@@ -59,11 +67,18 @@ return(~mload(0) == {})
     return validation_code_bytecode
 
 
+# The runtime code of the validation code made by `mk_validation_code` is
+# VALIDATION_CODE_PREFIX + address + VALIDATION_CODE_SUFFIX
+_validation_code_runtime = mk_validation_code(b'\x00' * 20)[14:14 + 57]
+VALIDATION_CODE_PREFIX = _validation_code_runtime[:25]
+VALIDATION_CODE_SUFFIX = _validation_code_runtime[45:]
+
+
 def get_valmgr_ct():
-    global _valmgr_ct, _valmgr_code
+    global _valmgr_ct
     if not _valmgr_ct:
         _valmgr_ct = abi.ContractTranslator(
-            compiler.mk_full_signature(get_valmgr_code())
+            get_contract_artifact(VALMGR_PATH)['abi']
         )
     return _valmgr_ct
 
@@ -71,16 +86,14 @@ def get_valmgr_ct():
 def get_valmgr_code():
     global _valmgr_code
     if not _valmgr_code:
-        mydir = os.path.dirname(__file__)
-        valmgr_path = os.path.join(mydir, 'contracts/validator_manager.v.py')
-        _valmgr_code = open(valmgr_path).read()
+        _valmgr_code = open(VALMGR_PATH).read()
     return _valmgr_code
 
 
 def get_valmgr_bytecode():
     global _valmgr_bytecode
     if not _valmgr_bytecode:
-        _valmgr_bytecode = compiler.compile(get_valmgr_code())
+        _valmgr_bytecode = get_contract_artifact(VALMGR_PATH)['bytecode']
     return _valmgr_bytecode
 
 
@@ -161,14 +174,62 @@ def call_tx_to_shard(state, sender_privkey, value, to, shard_id, startgas, gaspr
     )
 
 
-def call_validation_code(state, validation_code_addr, msg_hash, signature):
+def get_blockhash(state, block_number):
+    """Get the result of the BLOCKHASH opcode for `block_number`, as seen by
+    a message call on `state`
+    """
+    if not (state.block_number - 256 <= block_number < state.block_number):
+        return b'\x00' * 32
+    return state.get_block_hash(state.block_number - block_number - 1)
+
+
+def get_validation_code_addrs(state):
+    """Get the validation_code_addr of the validators, indexed by the validator
+    index up to `get_validators_max_index()`. The empty slots are zero addresses.
+    """
+    max_index = call_valmgr(state, 'get_validators_max_index', [])
+    addrs = [call_valmgr(state, 'get_validators__validation_code_addr', [i]) for i in range(max_index)]
+    return [utils.zpad(utils.int_to_big_endian(int(addr, 16)), 20) for addr in addrs]
+
+
+def get_validation_code_signer(state, validation_code_addr):
+    """Get the address which the validation code at `validation_code_addr`
+    checks the signatures against, if the code was made by `mk_validation_code`,
+    otherwise None
+    """
+    code = state.get_code(validation_code_addr)
+    cached = _validation_code_signers.get(validation_code_addr)
+    if cached is not None and cached[0] == code:
+        return cached[1]
+    signer = None
+    if len(code) == len(VALIDATION_CODE_PREFIX) + 20 + len(VALIDATION_CODE_SUFFIX) and \
+            code.startswith(VALIDATION_CODE_PREFIX) and code.endswith(VALIDATION_CODE_SUFFIX):
+        signer = code[len(VALIDATION_CODE_PREFIX):-len(VALIDATION_CODE_SUFFIX)]
+    _validation_code_signers[validation_code_addr] = (code, signer)
+    return signer
+
+
+def call_validation_code(state, validation_code_addr, msg_hash, signature, native=True):
     """Call validationCodeAddr on the main shard with 200000 gas, 0 value,
     the block_number concatenated with the sigIndex'th signature as input data gives output 1.
+
+    If the code was made by `mk_validation_code` and `native` is set, the
+    signature is checked without running the EVM.
     """
+    signer = get_validation_code_signer(state, validation_code_addr) if native else None
+    if signer is not None:
+        # The code compares the first word of the memory with the signer,
+        # which is still msg_hash if ecrecover fails
+        recovered = ecrecover_from_signature(msg_hash, signature)
+        if recovered is None:
+            first_word = (msg_hash + signature)[:32].ljust(32, b'\x00')
+            return utils.big_endian_to_int(first_word) == utils.big_endian_to_int(signer)
+        return recovered == signer
+
     dummy_addr = b'\xff' * 20
     data = msg_hash + signature
-    msg = vm.Message(dummy_addr, validation_code_addr, 0, 200000, data)
-    result = apply_message(state.ephemeral_clone(), msg)
+    msg = vm.Message(dummy_addr, validation_code_addr, 0, 200000, mk_calldata(data))
+    result = apply_message(StateView(state), msg)
     if result is None:
         raise MessageFailed()
     return bool(utils.big_endian_to_int(result))
@@ -0,0 +1,151 @@
+import os
+import struct
+from collections import OrderedDict
+
+from ethereum.slogging import get_logger
+from ethereum.utils import to_string
+
+log = get_logger('sharding.validity_cache')
+
+DEFAULT_MAX_SIZE = 65536
+
+# A record of the file: collation hash, context, valid flag, reason length,
+# reason; a context of zeros is no context
+RECORD_HEADER = struct.Struct('>32s32sBH')
+NO_CONTEXT = b''
+MAX_REASON_LENGTH = 2 ** 16 - 1
+
+
+def _pack_context(context):
+    return context or b'\x00' * 32
+
+
+def _unpack_context(context):
+    return NO_CONTEXT if context == b'\x00' * 32 else context
+
+
+class ValidityCache(object):
+    """A bounded LRU cache of the validity of the verified collations, and
+    of the reason why the invalid ones are invalid, keyed by collation hash
+    and context
+
+    The collation hash covers the parent collation hash and the
+    period_start_prevhash, but the verification also reads the main chain
+    state, e.g. the receipts and the collation gas limit, so a result which
+    depends on it is only valid in its context: the main chain head it was
+    verified on. The results which don't, e.g. an invalid structure, tx root
+    or signature, are put without a context and hold in any context. The
+    errors which depend on data that can still arrive shouldn't be cached.
+
+    path: if given, the records are appended to this file, and loaded from
+        it, e.g. after a restart. The file is compacted when it holds more
+        than twice as many records as the cache can hold.
+    """
+
+    def __init__(self, path=None, max_size=DEFAULT_MAX_SIZE):
+        self.path = path
+        self.max_size = max_size
+        self.entries = OrderedDict()    # (collation hash, context) -> (valid, reason)
+        self.num_records = 0
+        self.hits = 0
+        self.misses = 0
+        self.file = None
+        if path is not None:
+            if os.path.exists(path):
+                self.load()
+            self.file = open(path, 'ab')
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, collation_hash):
+        return (collation_hash, NO_CONTEXT) in self.entries
+
+    def get(self, collation_hash, context=NO_CONTEXT):
+        """Return (valid, reason) of the collation in `context`, or None if
+        it's unknown. The results without a context hold in any context.
+        """
+        for key in ((collation_hash, NO_CONTEXT), (collation_hash, context)):
+            if key in self.entries:
+                self.hits += 1
+                entry = self.entries.pop(key)
+                self.entries[key] = entry
+                return entry
+        self.misses += 1
+        return None
+
+    def is_valid(self, collation_hash, context=NO_CONTEXT):
+        """True or False if the validity of the collation in `context` is
+        known, else None
+        """
+        entry = self.get(collation_hash, context)
+        return None if entry is None else entry[0]
+
+    def _put(self, collation_hash, context, valid, reason):
+        key = (collation_hash, context)
+        self.entries.pop(key, None)
+        self.entries[key] = (valid, reason)
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def _pack(self, collation_hash, context, valid, reason):
+        return RECORD_HEADER.pack(collation_hash, _pack_context(context), int(valid), len(reason)) + reason
+
+    def put(self, collation_hash, valid, reason=b'', context=NO_CONTEXT):
+        reason = to_string(reason)[:MAX_REASON_LENGTH]
+        self._put(collation_hash, context, valid, reason)
+        if self.file is not None:
+            self.file.write(self._pack(collation_hash, context, valid, reason))
+            self.file.flush()
+            self.num_records += 1
+            if self.num_records > 2 * self.max_size:
+                self.compact()
+
+    def set_valid(self, collation_hash, context):
+        """The collation is valid on the main chain head `context`
+        """
+        self.put(collation_hash, True, context=context)
+
+    def set_invalid(self, collation_hash, reason, context=NO_CONTEXT):
+        """The collation is invalid in `context`, or in any context if the
+        reason doesn't depend on the main chain state
+        """
+        log.debug('Collation is invalid', reason=reason)
+        self.put(collation_hash, False, reason, context)
+
+    def load(self):
+        """Load the records of `path`, the latest ones win
+        """
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        i = 0
+        while i + RECORD_HEADER.size <= len(data):
+            collation_hash, context, valid, length = RECORD_HEADER.unpack_from(data, i)
+            start = i + RECORD_HEADER.size
+            if start + length > len(data):
+                break
+            self._put(collation_hash, _unpack_context(context), bool(valid), data[start:start + length])
+            i = start + length
+            self.num_records += 1
+        if i < len(data):
+            # The last record was cut short, e.g. by a crash while writing it
+            with open(self.path, 'r+b') as f:
+                f.truncate(i)
+        log.info('Loaded {} collation validity records'.format(self.num_records))
+
+    def compact(self):
+        """Rewrite the file with only the records of the cached entries
+        """
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            for (collation_hash, context), (valid, reason) in self.entries.items():
+                f.write(self._pack(collation_hash, context, valid, reason))
+        self.file.close()
+        os.rename(tmp_path, self.path)
+        self.file = open(self.path, 'ab')
+        self.num_records = len(self.entries)
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None